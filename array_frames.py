@@ -0,0 +1,200 @@
+"""array_frames.py
+
+Binary frames for NumPy arrays: no pickling, no intermediate bytes objects.
+
+    header   !4sBBHQ    magic b"NDAR", version, ndim, len(dtype), nbytes
+             dtype      the .npy format dtype descr as ascii, e.g. b"'<f8'"
+                        (byte order included; structured dtypes keep their fields)
+             shape      ndim x !Q
+             strides    ndim x !q
+    data     nbytes     the array's memory exactly as the sender holds it
+
+send_array() hands the array's own buffer to sendmsg() next to the small
+header; recv_array() allocates the result (or takes a preallocated `out`)
+and recv_into()s the data straight into it. Strides travel with the shape,
+so Fortran-ordered arrays arrive Fortran-ordered. Non-contiguous arrays
+(e.g. A[:, ::2]) have no single buffer to send and are made contiguous first,
+which is the one copy this module makes.
+
+Array frames are a separate stream format from framing.py: use them on a
+connection of their own, not interleaved with length-prefixed frames read
+through a FrameDecoder (its buffer could swallow part of an array).
+
+Remote block worker for mpi_exercises/q1_matrix_multiplication.py --remote:
+    python array_frames.py --serve tcp://0.0.0.0:7000
+"""
+
+import argparse
+import ast
+import struct
+import threading
+
+import numpy as np
+
+from framing import sendmsg_all
+from transport import connect, create_server, peer_name, set_nodelay
+
+MAGIC = b"NDAR"
+VERSION = 1
+PREFIX = struct.Struct("!4sBBHQ")
+DEFAULT_MAX_BYTES = 1 << 31
+
+
+def _layout(arr):
+    """The array itself if its memory is one block, else a C-contiguous copy."""
+    if not (arr.flags.c_contiguous or arr.flags.f_contiguous):
+        arr = np.ascontiguousarray(arr)
+    return arr
+
+
+def pack_header(arr):
+    if arr.dtype.hasobject:
+        raise TypeError("object arrays hold pointers, not data; they cannot be sent without pickling")
+    dtype = repr(np.lib.format.dtype_to_descr(arr.dtype)).encode("ascii")
+    return b"".join((
+        PREFIX.pack(MAGIC, VERSION, arr.ndim, len(dtype), arr.nbytes),
+        dtype,
+        struct.pack(f"!{arr.ndim}Q", *arr.shape),
+        struct.pack(f"!{arr.ndim}q", *arr.strides),
+    ))
+
+
+def _data_view(arr):
+    """Flat byte view of a contiguous array's memory (C or Fortran order), no copy."""
+    return memoryview(arr.ravel(order="K").view(np.uint8))
+
+
+def send_arrays(sock, arrays):
+    """Send several arrays with vectored sendmsg() calls. Returns the bytes sent."""
+    buffers = []
+    for arr in arrays:
+        arr = _layout(np.asarray(arr))
+        buffers.append(pack_header(arr))
+        if arr.nbytes:
+            buffers.append(_data_view(arr))
+    return sendmsg_all(sock, buffers)
+
+
+def send_array(sock, arr):
+    return send_arrays(sock, [arr])
+
+
+def _recv_exact_into(sock, view):
+    """Fill `view` completely; False on a clean EOF before the first byte."""
+    got = 0
+    while got < len(view):
+        n = sock.recv_into(view[got:])
+        if not n:
+            if got == 0:
+                return False
+            raise ConnectionError(f"connection closed mid-array ({got}/{len(view)} bytes)")
+        got += n
+    return True
+
+
+def recv_array(sock, out=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Receive one array frame. Returns None on EOF at a frame boundary.
+
+    With `out`, the data is received directly into it; it must be contiguous
+    and match the sender's dtype, shape and strides. Otherwise a new array is
+    allocated.
+    """
+    prefix = bytearray(PREFIX.size)
+    if not _recv_exact_into(sock, memoryview(prefix)):
+        return None
+    magic, version, ndim, dtype_len, nbytes = PREFIX.unpack(prefix)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not an array frame (magic {magic!r}, version {version})")
+    if nbytes > max_bytes:
+        raise ValueError(f"array of {nbytes} bytes exceeds the {max_bytes} byte limit")
+    meta = bytearray(dtype_len + 16 * ndim)
+    if not _recv_exact_into(sock, memoryview(meta)):
+        raise ConnectionError("connection closed mid-array header")
+    try:
+        # literal_eval only builds literals, so a hostile header cannot run code
+        dtype = np.lib.format.descr_to_dtype(ast.literal_eval(meta[:dtype_len].decode("ascii")))
+    except (ValueError, TypeError, SyntaxError, UnicodeDecodeError) as e:
+        raise ValueError(f"bad dtype in array frame: {e}") from None
+    if dtype.hasobject:
+        raise ValueError("refusing an object dtype")
+    shape = struct.unpack_from(f"!{ndim}Q", meta, dtype_len)
+    strides = struct.unpack_from(f"!{ndim}q", meta, dtype_len + 8 * ndim)
+
+    if out is None:
+        buf = np.empty(nbytes, dtype=np.uint8)
+        # numpy checks that shape and strides stay inside the buffer
+        arr = np.ndarray(shape, dtype=dtype, buffer=buf, strides=strides)
+        target = memoryview(buf)
+    else:
+        if out.dtype != dtype or out.shape != shape or out.strides != strides:
+            raise ValueError(f"out is {out.dtype}{out.shape} strides {out.strides}, "
+                             f"frame is {dtype}{shape} strides {strides}")
+        if not (out.flags.c_contiguous or out.flags.f_contiguous) or not out.flags.writeable:
+            raise ValueError("out must be a writeable contiguous array")
+        if nbytes != out.nbytes:
+            # reading any other count into out would leave the stream mid-frame
+            raise ValueError(f"frame carries {nbytes} bytes for {dtype}{shape}, out holds {out.nbytes}")
+        arr = out
+        target = _data_view(out)
+    if nbytes and not _recv_exact_into(sock, target):
+        raise ConnectionError("connection closed before the array data")
+    return arr
+
+
+def _serve_dot_connection(conn, addr):
+    set_nodelay(conn)
+    with conn:
+        try:
+            while True:
+                A = recv_array(conn)
+                if A is None:
+                    break
+                B = recv_array(conn)
+                if B is None:
+                    raise ConnectionError("missing B block")
+                send_array(conn, np.dot(A, B))
+        except (OSError, ValueError) as e:
+            print(f"[array] {peer_name(addr)}: {e}")
+
+
+def serve_dot(uri):
+    """Block worker: for every (A_block, B) pair received, reply with np.dot(A_block, B)."""
+    server = create_server(uri)
+    print(f"[array] dot worker listening on {uri}")
+    with server:
+        while True:
+            conn, addr = server.accept()
+            # np.dot releases the GIL, so connections really run in parallel
+            threading.Thread(target=_serve_dot_connection, args=(conn, addr), daemon=True).start()
+
+
+class DotClient:
+    """One connection to a serve_dot() worker."""
+
+    def __init__(self, uri, timeout=None):
+        self.sock = connect(uri, timeout=timeout)
+
+    def dot(self, A, B, out=None):
+        send_arrays(self.sock, [A, B])
+        C = recv_array(self.sock, out=out)
+        if C is None:
+            raise ConnectionError("worker closed the connection")
+        return C
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", metavar="URI", required=True,
+                        help="run a np.dot block worker on tcp://host:port or unix:///path")
+    args = parser.parse_args()
+    serve_dot(args.serve)
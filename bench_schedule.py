@@ -0,0 +1,203 @@
+"""bench_schedule.py
+
+Benchmark of the loop schedules in parallel_loop.py over synthetic iteration
+costs, to choose schedules from data instead of from one demo's wall time.
+
+Cost profiles (mean cost per iteration is --mean-cost in every profile, a
+little less for heavy, whose tail is capped at 100 x mean):
+
+    uniform      random, uniformly spread over [0.5, 1.5] x mean
+    linear       grows linearly with the iteration index (late iterations cost most)
+    triangular   cheap at both ends, 2 x mean in the middle
+    heavy        Pareto tail (alpha 1.5): most iterations are cheap, a few are huge
+    bimodal      90% cheap, 10% ten times as expensive, in random places
+
+Costs are drawn once per (profile, n, --seed), so every schedule, chunk size,
+worker count and backend runs exactly the same loop. An iteration "costs"
+its time either sleeping (--work sleep: scales on any machine and under the
+GIL, so it isolates scheduling) or spinning (--work spin: real CPU, where the
+threads backend is GIL-bound).
+
+Every combination of --backends, --profiles, --workers, --schedules and
+--chunks is run (auto tunes its own chunk size and runs once per
+combination) and printed as one JSON line:
+
+    ran_on               the backend the loop ran on (what auto resolved to)
+    makespan_s           wall time of the parallel call
+    efficiency           total cost / (workers x makespan); 1.0 is ideal
+                         (workers is 1 for a loop that ran serially)
+    imbalance            busiest worker's time in chunks / the mean
+    dispatch_overhead_s  time workers spent between chunks while the loop was
+                         running (startup, claims, queueing), summed
+    dispatch_us_per_chunk  the same per chunk
+
+The numbers come from a loop_trace.Trace recorded by parallel_loop, so
+measuring adds one lock-free write per chunk.
+
+Usage (examples):
+    python bench_schedule.py
+    python bench_schedule.py --profiles heavy,bimodal --workers 2,4,8 --chunks 1,16 --backends processes
+    python bench_schedule.py --work spin --mean-cost 0.0002 -n 20000 --summary --output results.json
+"""
+
+import argparse
+import functools
+import json
+import random
+import statistics
+import time
+
+from loop_schedule import AUTO
+from loop_trace import Trace, now
+from parallel_loop import BACKENDS, SCHEDULES, SERIAL, THREADS, parallel_for
+
+SLEEP = "sleep"
+SPIN = "spin"
+PROFILES = ("uniform", "linear", "triangular", "heavy", "bimodal")
+
+
+def make_costs(profile, n, mean, seed=1):
+    """Per-iteration costs in seconds, averaging `mean`."""
+    rng = random.Random(f"{profile}:{n}:{seed}")
+    if profile == "uniform":
+        costs = [mean * rng.uniform(0.5, 1.5) for _ in range(n)]
+    elif profile == "linear":
+        costs = [2 * mean * (i + 0.5) / n for i in range(n)]
+    elif profile == "triangular":
+        costs = [2 * mean * (1 - abs(2 * (i + 0.5) / n - 1)) for i in range(n)]
+    elif profile == "heavy":
+        # Pareto(alpha) has mean x_m * alpha / (alpha - 1); cap the tail at 100 x mean
+        alpha = 1.5
+        x_m = mean * (alpha - 1) / alpha
+        costs = [min(x_m * rng.paretovariate(alpha), 100 * mean) for _ in range(n)]
+    elif profile == "bimodal":
+        cheap = mean / 1.9            # 0.9 * cheap + 0.1 * 10 * cheap = mean
+        costs = [cheap * (10 if rng.random() < 0.1 else 1) for _ in range(n)]
+    else:
+        raise ValueError(f"unknown profile {profile!r}; expected one of {PROFILES}")
+    return costs
+
+
+def work(costs, spin, i):
+    """One iteration: burn costs[i] seconds."""
+    if spin:
+        deadline = time.perf_counter() + costs[i]
+        while time.perf_counter() < deadline:
+            pass
+    else:
+        time.sleep(costs[i])
+
+
+def _noop(i):
+    pass
+
+
+def run_point(costs, schedule, chunk, workers, backend, spin):
+    """Run one configuration; returns the measurements as a dict."""
+    n = len(costs)
+    body = functools.partial(work, costs, spin)
+    with Trace(workers, capacity=max(n, 1)) as trace:
+        t_call = now()
+        parallel_for(n, body, schedule=schedule, chunk=chunk or None, workers=workers,
+                     backend=backend, trace=trace)
+        t_done = now()
+        records = trace.records()
+        stats = trace.stats()
+        ran_on = trace.backend
+
+    makespan = (t_done - t_call) / 1e9
+    # a serial run (asked for, or what auto chose) is all on the caller, whatever `workers` says
+    used = 1 if ran_on == SERIAL else workers
+    gaps = 0
+    last_end = {}
+    for t_start, t_end, worker, _, _, _ in records:
+        gaps += t_start - last_end.get(worker, t_call)
+        last_end[worker] = t_end
+    total_cost = sum(costs)
+    busy = stats["busy"][:used]
+    mean_busy = sum(busy) / used
+    return dict(
+        ran_on=ran_on,
+        makespan_s=round(makespan, 4),
+        ideal_s=round(total_cost / used, 4),
+        efficiency=round(total_cost / (used * makespan), 3) if makespan else None,
+        imbalance=round(max(busy) / mean_busy, 3) if mean_busy else 1.0,
+        chunks=len(records),
+        dispatch_overhead_s=round(gaps / 1e9, 4),
+        dispatch_us_per_chunk=round(gaps / 1e3 / len(records), 1) if records else None,
+    )
+
+
+def _list(text):
+    return [x for x in text.split(",") if x]
+
+
+def _int_list(text):
+    return [int(x) for x in _list(text)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("-n", type=int, default=2000, help="iterations per loop")
+    parser.add_argument("--mean-cost", type=float, default=0.0005, help="mean seconds per iteration")
+    parser.add_argument("--profiles", type=_list, default=list(PROFILES))
+    parser.add_argument("--schedules", type=_list, default=list(SCHEDULES))
+    parser.add_argument("--chunks", type=_int_list, default=[0, 1, 16],
+                        help="comma separated chunk sizes; 0 is the schedule's default")
+    parser.add_argument("--workers", type=_int_list, default=[2, 4])
+    parser.add_argument("--backends", type=_list, default=[b for b in BACKENDS if b != SERIAL],
+                        help="comma separated; serial (a baseline, on one worker) is not run by default")
+    parser.add_argument("--work", choices=[SLEEP, SPIN], default=SLEEP)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per configuration; the median is reported")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--summary", action="store_true", help="finish with the best configuration per case")
+    parser.add_argument("--output", help="write the JSON results to this file as well")
+    args = parser.parse_args()
+    for name, given, known in (("profile", args.profiles, PROFILES), ("schedule", args.schedules, SCHEDULES),
+                               ("backend", args.backends, BACKENDS)):
+        unknown = set(given) - set(known)
+        if unknown:
+            parser.error(f"unknown {name}(s) {sorted(unknown)}; expected some of {list(known)}")
+    return args
+
+
+def main():
+    args = parse_args()
+    results = []
+    for backend in args.backends:
+        for workers in args.workers:
+            # start the warm pool outside the measurements; auto in parallel_for
+            # resolves to serial or threads, so threads is the pool it may use
+            parallel_for(workers, _noop, workers=workers, backend=THREADS if backend == AUTO else backend)
+            for profile in args.profiles:
+                costs = make_costs(profile, args.n, args.mean_cost, args.seed)
+                for schedule in args.schedules:
+                    for chunk in ([0] if schedule == AUTO else args.chunks):
+                        runs = [run_point(costs, schedule, chunk, workers, backend, args.work == SPIN)
+                                for _ in range(args.repeat)]
+                        median = sorted(runs, key=lambda r: r["makespan_s"])[len(runs) // 2]
+                        result = dict(backend=backend, work=args.work, profile=profile, n=args.n,
+                                      workers=workers, schedule=schedule, chunk=chunk or None, **median)
+                        if len(runs) > 1:
+                            result["makespan_stdev_s"] = round(statistics.stdev(r["makespan_s"] for r in runs), 4)
+                        results.append(result)
+                        print(json.dumps(result), flush=True)
+
+    if args.summary:
+        best = {}
+        for r in results:
+            case = (r["backend"], r["profile"], r["workers"])
+            if case not in best or r["makespan_s"] < best[case]["makespan_s"]:
+                best[case] = r
+        print(f"\n{'backend':<10} {'profile':<11} {'workers':>7}  {'best schedule':<16} {'makespan':>9} {'efficiency':>10}")
+        for (backend, profile, workers), r in sorted(best.items()):
+            label = f"{r['schedule']}" + (f"/{r['chunk']}" if r["chunk"] else "")
+            print(f"{backend:<10} {profile:<11} {workers:>7}  {label:<16} {r['makespan_s']:>8.3f}s {r['efficiency']:>10.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""bench_server.py
+
+Load generator and latency benchmark for the length-prefixed servers.
+
+Two load models:
+
+    closed  - every connection keeps --depth requests in flight and sends a new
+              one as soon as a reply arrives (throughput-oriented)
+    open    - requests are sent at a constant arrival rate (--rate per second,
+              spread over all connections) no matter how fast replies come back.
+              Latency is measured from the *scheduled* send time, so a stalled
+              server shows up in the percentiles instead of being hidden by a
+              client that politely waits (coordinated omission).
+
+Targets:
+
+    server  - server.py / server_cluster.py: persistent connections, framed replies
+    labmid  - labmid/server_with_length.py: one request per connection, the reply
+              is read until the server closes the socket (closed loop, depth 1)
+
+Every combination of --concurrency, --sizes and --depth is run for --duration
+seconds and the results are printed as JSON.
+
+Usage (examples):
+    python bench_server.py --concurrency 1,8,64 --sizes 16,512 --depth 1,16
+    python bench_server.py --mode open --rate 20000 --concurrency 16 --header u32 --sizes 4096
+    python bench_server.py --target labmid --port 12345 --concurrency 1,4
+    python bench_server.py --uri unix:///tmp/echo.sock --concurrency 8
+    python bench_server.py --header u32 --sizes 65536 --compression zlib
+
+throughput_mbps counts payload bytes before compression, so with
+--compression it is the logical rate the application sees.
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import transport
+from compression import METHODS, negotiate
+from framing import ASCII3, HEADERS, FrameDecoder, encode_frame, recv_frame, send_frames, sendmsg_all
+from metrics import LatencyHistogram
+
+SERVER = "server"
+LABMID = "labmid"
+CLOSED = "closed"
+OPEN = "open"
+
+
+def _payload(size):
+    # never "hello", so the server echoes it and the reply size is predictable
+    return (b"x" * size) if size else b""
+
+
+def _connect(params):
+    return transport.connect(params["uri"], timeout=params["timeout"])
+
+
+def _negotiate(sock, params, decoder):
+    """Codec for this connection, or None when compression is off or declined."""
+    if not params["compression"]:
+        return None
+    return negotiate(sock, params["compression"], decoder=decoder)
+
+
+def _send(sock, payloads, header, codec):
+    if codec is None:
+        return send_frames(sock, payloads, header)
+    buffers = []
+    for payload in payloads:
+        buffers.extend(codec.frame_buffers(payload, header))
+    return sendmsg_all(sock, buffers)
+
+
+def _recv(sock, decoder, codec):
+    """One reply, inflated if needed; None on EOF."""
+    reply = recv_frame(sock, decoder)
+    if reply is not None and codec is not None:
+        codec.decode(reply)
+    return reply
+
+
+class _Result:
+    """What one connection measured; merged into the point result."""
+
+    def __init__(self):
+        self.hist = LatencyHistogram()
+        self.requests = 0
+        self.errors = 0
+
+    def merge(self, other):
+        self.hist.merge(other.hist)
+        self.requests += other.requests
+        self.errors += other.errors
+
+
+def _closed_loop(params, deadline, result):
+    payload = _payload(params["size"])
+    header = params["header"]
+    depth = params["depth"]
+    try:
+        sock = _connect(params)
+    except OSError:
+        result.errors += 1
+        return
+    decoder = FrameDecoder(header)
+    sent = deque()
+    with sock:
+        try:
+            codec = _negotiate(sock, params, decoder)
+            _send(sock, [payload] * depth, header, codec)
+            now = time.perf_counter()
+            sent.extend([now] * depth)
+            while sent:
+                if _recv(sock, decoder, codec) is None:
+                    result.errors += 1
+                    return
+                now = time.perf_counter()
+                result.hist.record((now - sent.popleft()) * 1e6)
+                result.requests += 1
+                if now < deadline:
+                    _send(sock, [payload], header, codec)
+                    sent.append(time.perf_counter())
+        except (OSError, ValueError):
+            result.errors += 1
+
+
+def _open_loop(params, deadline, result, offset):
+    payload = _payload(params["size"])
+    header = params["header"]
+    interval = params["concurrency"] / params["rate"]
+    try:
+        sock = _connect(params)
+    except OSError:
+        result.errors += 1
+        return
+    scheduled = deque()
+    lock = threading.Lock()
+    decoder = FrameDecoder(header)
+    try:
+        codec = _negotiate(sock, params, decoder)
+    except (OSError, ValueError):
+        result.errors += 1
+        sock.close()
+        return
+
+    def receive():
+        try:
+            while True:
+                if _recv(sock, decoder, codec) is None:
+                    # after the sender is done we half-close, so EOF is the normal end
+                    if scheduled:
+                        result.errors += 1
+                    return
+                now = time.perf_counter()
+                with lock:
+                    intended = scheduled.popleft()
+                result.hist.record((now - intended) * 1e6)
+                result.requests += 1
+        except (OSError, ValueError):
+            result.errors += 1
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    with sock:
+        receiver.start()
+        next_send = time.perf_counter() + offset * interval
+        try:
+            while next_send < deadline:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                with lock:
+                    scheduled.append(next_send)
+                _send(sock, [payload], header, codec)
+                next_send += interval
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            result.errors += 1
+        receiver.join(params["timeout"])
+
+
+def _labmid_loop(params, deadline, result):
+    frame = encode_frame(_payload(params["size"]), ASCII3)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            with _connect(params) as sock:
+                sock.sendall(frame)
+                while sock.recv(65536):   # the ack is not framed; it ends when the server closes
+                    pass
+        except OSError:
+            result.errors += 1
+            continue
+        result.hist.record((time.perf_counter() - start) * 1e6)
+        result.requests += 1
+
+
+def _run_connections(params, first, count):
+    """Run `count` connections in this process; returns plain data for pickling."""
+    started = time.perf_counter()
+    deadline = started + params["duration"]
+    results = [_Result() for _ in range(count)]
+    threads = []
+    for i, result in enumerate(results):
+        if params["target"] == LABMID:
+            target, args = _labmid_loop, (params, deadline, result)
+        elif params["mode"] == OPEN:
+            target, args = _open_loop, (params, deadline, result, (first + i) / params["concurrency"])
+        else:
+            target, args = _closed_loop, (params, deadline, result)
+        threads.append(threading.Thread(target=target, args=args, daemon=True))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = _Result()
+    for result in results:
+        total.merge(result)
+    elapsed = time.perf_counter() - started
+    return total.hist.counts, total.hist.total, total.hist.max, total.requests, total.errors, elapsed
+
+
+def run_point(params):
+    """Run one benchmark configuration, splitting connections over params['procs'] processes."""
+    procs = max(1, min(params["procs"], params["concurrency"]))
+    shares = [params["concurrency"] // procs + (i < params["concurrency"] % procs) for i in range(procs)]
+    firsts = [sum(shares[:i]) for i in range(procs)]
+    if procs == 1:
+        parts = [_run_connections(params, 0, shares[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=procs) as ex:
+            parts = list(ex.map(_run_connections, [params] * procs, firsts, shares))
+    # measured inside the workers so process start-up does not count
+    elapsed = max(part[-1] for part in parts)
+
+    total = _Result()
+    for counts, n, mx, requests, errors, _ in parts:
+        part = _Result()
+        part.hist.counts, part.hist.total, part.hist.max = counts, n, mx
+        part.requests, part.errors = requests, errors
+        total.merge(part)
+
+    out = {key: params[key] for key in ("target", "mode", "concurrency", "size", "depth", "header")}
+    if params["compression"]:
+        out["compression"] = ",".join(params["compression"])
+    if params["mode"] == OPEN:
+        out["offered_rate"] = params["rate"]
+    out.update(
+        duration_s=round(elapsed, 3),
+        requests=total.requests,
+        errors=total.errors,
+        throughput_rps=round(total.requests / elapsed, 1),
+        throughput_mbps=round(total.requests * params["size"] / elapsed / 1e6, 3),
+        p50_us=total.hist.percentile(50),
+        p99_us=total.hist.percentile(99),
+        p999_us=total.hist.percentile(99.9),
+        max_us=total.hist.max,
+    )
+    return out
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", choices=[SERVER, LABMID], default=SERVER)
+    parser.add_argument("--mode", choices=[CLOSED, OPEN], default=CLOSED)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None,
+                        help="default: 65432 for server.py, 12345 for labmid")
+    parser.add_argument("--uri", help="tcp://host:port or unix:///path (overrides --host/--port)")
+    parser.add_argument("--header", choices=HEADERS, default=ASCII3)
+    parser.add_argument("--compression", default="",
+                        help=f"server target: methods to negotiate, e.g. zlib or {','.join(METHODS)}")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8, 32],
+                        help="comma separated connection counts to sweep")
+    parser.add_argument("--sizes", type=_int_list, default=[16, 512],
+                        help="comma separated payload sizes in bytes")
+    parser.add_argument("--depth", type=_int_list, default=[1],
+                        help="closed loop: comma separated pipelining depths")
+    parser.add_argument("--rate", type=float, default=1000.0,
+                        help="open loop: total requests per second")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per configuration")
+    parser.add_argument("--procs", type=int, default=os.cpu_count() or 1,
+                        help="client processes to spread connections over")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--output", help="write the JSON results to this file as well")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.port is None:
+        args.port = 12345 if args.target == LABMID else 65432
+    depths = [1] if args.target == LABMID or args.mode == OPEN else args.depth
+    results = []
+    for concurrency in args.concurrency:
+        for size in args.sizes:
+            for depth in depths:
+                params = dict(
+                    target=args.target, mode=CLOSED if args.target == LABMID else args.mode,
+                    uri=args.uri or transport.tcp_uri(args.host, args.port), header=ASCII3 if args.target == LABMID else args.header,
+                    concurrency=concurrency, size=size, depth=depth, rate=args.rate,
+                    duration=args.duration, procs=args.procs, timeout=args.timeout,
+                    compression=[] if args.target == LABMID else [m for m in args.compression.split(",") if m],
+                )
+                result = run_point(params)
+                results.append(result)
+                print(json.dumps(result), flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,28 @@
 # activity5_reduction_dot.py
 # Activity 5: REDUCTION – dot product with static/dynamic/guided schedules.
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from schedule_utils import make_chunks_static, make_chunks_dynamic, make_chunks_guided
+import os
+import sys
+
+if __name__ == "__main__":
+    # run on its own rather than from main.py or activity_runner.py, which set this up
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parallel_loop import parallel_reduce
 
 def run(n=40, chunk=5, schedule="static", max_workers=4):
     print(f"Activity 5: REDUCTION (dot product) schedule={schedule}, chunk={chunk}")
     a = [float(i) for i in range(n)]
     b = [2.0*float(i) for i in range(n)]
 
-    def dot_partial(indices):
+    def dot_partial(chunk):
         partial = 0.0
-        for i in indices:
+        for i in chunk.iterations:
             partial += a[i] * b[i]
-        print(f"Partial {indices[0]}..{indices[-1]} -> {partial}")
+        print(f"Partial {chunk.iterations.start}..{chunk.iterations.stop - 1} -> {partial}")
         return partial
 
-    if schedule == "static":
-        buckets = make_chunks_static(n, chunk, max_workers)
-        work = [bucket for bucket in buckets if bucket]
-    elif schedule == "dynamic":
-        work = make_chunks_dynamic(n, chunk)
-    elif schedule == "guided":
-        work = make_chunks_guided(n, max(1, chunk))
-    else:
-        raise ValueError("Unknown schedule")
-
-    result = 0.0
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futures = []
-        if schedule == "static":
-            futures = [ex.submit(dot_partial, bucket) for bucket in work]
-        else:
-            futures = [ex.submit(dot_partial, chunk_ixs) for chunk_ixs in work]
-        for f in as_completed(futures):
-            result += f.result()
+    result = parallel_reduce(n, dot_partial, initial=0.0, schedule=schedule, chunk=chunk,
+                             workers=max_workers, per_chunk=True)
 
     print(f"Final dot product = {result}\n")
     return result
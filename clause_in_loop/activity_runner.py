@@ -1,5 +1,10 @@
 # run_all_and_capture_outputs.py
 # Runs all activities in sequence so you can capture outputs for your report.
+import os
+import sys
+
+# parallel_loop.py, which activity 5 uses, lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from activity1_private import run as act1
 from activity2_shared import run as act2
 from activity3_first_private import run as act3
@@ -1,3 +1,8 @@
+import os
+import sys
+
+# parallel_loop.py, which reduction_sum uses, lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from activity_runner import main as run_all
 from reduction_sum import demo as reduction_demo
 
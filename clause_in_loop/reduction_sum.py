@@ -1,46 +1,37 @@
 # graded_task2_reduction_sum.py
 # Graded Task 2: Parallel sum of an array using a reduction-style pattern.
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from schedule_utils import make_chunks_static, make_chunks_dynamic, make_chunks_guided
+import os
+import sys
+
+if __name__ == "__main__":
+    # run on its own rather than from main.py or activity_runner.py, which set this up
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parallel_loop import parallel_reduce
 
 def reduction_sum(array, chunk=16, schedule="static", max_workers=4):
     """
     Parallel sum of a 1-D array:
       - Each task computes a local partial sum (private accumulator).
       - The main thread reduces (adds) all partials into the final result.
+    With schedule="auto", `chunk` is only the first probe size: chunk sizes
+    are tuned from measured chunk times and remembered for the next call.
     """
     n = len(array)
     if n == 0:
         return 0
 
-    def sum_partial(indices):
+    def sum_partial(chunk):
         s = 0
-        for i in indices:
+        for i in chunk.iterations:
             s += array[i]
         # Print once per partial for visibility
-        print(f"Partial {indices[0]}..{indices[-1]} -> {s}")
+        print(f"Partial {chunk.iterations.start}..{chunk.iterations.stop - 1} -> {s}")
         return s
 
-    # Partition work
-    if schedule == "static":
-        buckets = make_chunks_static(n, chunk, max_workers)
-        work = [bucket for bucket in buckets if bucket]
-    elif schedule == "dynamic":
-        work = make_chunks_dynamic(n, chunk)
-    elif schedule == "guided":
-        work = make_chunks_guided(n, max(1, chunk))
-    else:
-        raise ValueError("Unknown schedule")
-
-    # Parallel partial sums + reduction
-    total = 0
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futures = [ex.submit(sum_partial, bucket) for bucket in work]
-        for f in as_completed(futures):
-            total += f.result()
-
-    return total
+    # Parallel partial sums + reduction; chunks are ranges, no index lists are built
+    return parallel_reduce(n, sum_partial, initial=0, schedule=schedule, chunk=chunk,
+                           workers=max_workers, per_chunk=True)
 
 def demo():
     # Example usage for your report
@@ -52,6 +43,8 @@ def demo():
     print("Total (dynamic):", ans2)
     ans3 = reduction_sum(data, chunk=8, schedule="guided",  max_workers=4)
     print("Total (guided): ", ans3)
+    ans4 = reduction_sum(data, schedule="auto", max_workers=4)
+    print("Total (auto):   ", ans4)
 
 if __name__ == "__main__":
     demo()
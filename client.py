@@ -1,25 +1,30 @@
-import socket
+import argparse
 import threading
+import time
+
+import transport
+from compression import METHODS, negotiate
+from framing import ASCII3, HEADERS, FrameDecoder, encode_frame, recv_frame, send_frames, sendmsg_all
 
 HOST = "127.0.0.1"
 PORT = 65432
+URI = transport.tcp_uri(HOST, PORT)
 
-def client_thread(msg):
+def client_thread(msg, header=ASCII3, uri=URI):
     print(f"[client] starting client thread for message '{msg}'...")
-    print(f"[client] attempting to connect to {HOST}:{PORT}")
+    print(f"[client] attempting to connect to {uri}")
     try:
-        with socket.create_connection((HOST, PORT), timeout=5) as s:
+        with transport.connect(uri, timeout=5) as s:
             print(f"[client] connected to server for '{msg}'")
             print(f"[client] message: '{msg}'")
-            L = len(msg)
-            print(f"[client] message length: {L}")
-            length_str = str(L).zfill(3)
-            print(f"[client] length string (zero-padded): '{length_str}'")
-            full_msg = length_str + msg
-            print(f"[client] full message to send: '{full_msg}'")
-            s.sendall(full_msg.encode())
+            payload = msg.encode()
+            L = len(payload)
+            print(f"[client] message length: {L} bytes")
+            full_msg = encode_frame(payload, header)
+            print(f"[client] full message to send ({header} header): {full_msg!r}")
+            s.sendall(full_msg)
             print(f"[client] message sent for '{msg}', waiting for response...")
-            data = s.recv(1024)
+            data = recv_frame(s, FrameDecoder(header, buffer_size=1024))
             print(f"[client] received for '{msg}':", data.decode())
         print(f"[client] done for '{msg}', closing")
     except ConnectionRefusedError:
@@ -27,16 +32,128 @@ def client_thread(msg):
     except Exception as e:
         print(f"[client] error for '{msg}':", e)
 
-# List of messages to send
-messages = ["hello", "world", "test message"]
+class PipelinedClient:
+    """
+    One persistent connection that pipelines many frames.
+
+    The server answers the frames of a connection in the order they arrive, so
+    the i-th reply on the wire belongs to the i-th request. request_batch()
+    writes up to `window` frames (and about `window_bytes` of payload) with
+    vectored sendmsg() calls before reading any replies, so a batch of N
+    messages costs about N / window round trips instead of N connects. The
+    window bounds how much unread data can pile up in the socket buffers of
+    either side; without the byte limit, large payloads would fill both and
+    deadlock.
+
+    `compression` is a sequence of methods to offer the server ("zlib",
+    "lzma"); if it accepts one, payloads above the codec threshold travel
+    compressed and `codec` is set, otherwise frames stay plain.
+    """
+
+    def __init__(self, host=HOST, port=PORT, header=ASCII3, timeout=5, window=256, uri=None,
+                 compression=None, window_bytes=1 << 20):
+        self.header = header
+        self.window = window
+        self.window_bytes = window_bytes
+        self.sock = transport.connect(uri or transport.tcp_uri(host, port), timeout=timeout)
+        self.decoder = FrameDecoder(header)
+        self.codec = None
+        if compression:
+            try:
+                self.codec = negotiate(self.sock, compression, decoder=self.decoder)
+            except BaseException:
+                self.sock.close()
+                raise
+
+    def request_batch(self, payloads):
+        """Send every payload and return the replies in the same order."""
+        replies = []
+        i = 0
+        while i < len(payloads):
+            j, size = i, 0
+            while j < len(payloads) and j - i < self.window and (j == i or size + len(payloads[j]) <= self.window_bytes):
+                size += len(payloads[j])
+                j += 1
+            chunk = payloads[i:j]
+            i = j
+            if self.codec is None:
+                send_frames(self.sock, chunk, self.header)
+            else:
+                buffers = []
+                for payload in chunk:
+                    buffers.extend(self.codec.frame_buffers(payload, self.header))
+                sendmsg_all(self.sock, buffers)
+            for _ in chunk:
+                reply = recv_frame(self.sock, self.decoder)
+                if reply is None:
+                    raise ConnectionError("server closed the connection mid-batch")
+                if self.codec is not None:
+                    reply = bytes(self.codec.decode(reply))
+                replies.append(reply)
+        return replies
+
+    def request(self, payload):
+        return self.request_batch([payload])[0]
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--header", choices=HEADERS, default=ASCII3,
+                        help="length prefix format, must match the server")
+    parser.add_argument("--uri", default=URI, help="tcp://host:port or unix:///path")
+    parser.add_argument("--pipeline", type=int, default=0, metavar="N",
+                        help="send N messages over one pipelined connection instead of one thread per message")
+    parser.add_argument("--compress", metavar="METHODS", nargs="?", const=",".join(METHODS),
+                        help="with --pipeline: negotiate compression (zlib,lzma by default)")
+    parser.add_argument("--size", type=int, default=0,
+                        help="with --pipeline: send compressible payloads of this many bytes instead of the demo messages")
+    args = parser.parse_args()
+
+    # List of messages to send
+    messages = ["hello", "world", "test message"]
+
+    if args.pipeline:
+        if args.size:
+            line = b"sensor=%d temperature=21.5 humidity=40 status=ok\n"
+            batch = [b"".join(line % j for j in range(args.size // len(line) + 1))[:args.size]
+                     for _ in range(args.pipeline)]
+        else:
+            batch = [messages[i % len(messages)].encode() for i in range(args.pipeline)]
+        compression = args.compress.split(",") if args.compress else None
+        with PipelinedClient(header=args.header, uri=args.uri, compression=compression) as client:
+            start = time.perf_counter()
+            replies = client.request_batch(batch)
+            elapsed = time.perf_counter() - start
+            codec = client.codec
+        if not args.size:
+            for msg, reply in list(zip(batch, replies))[:len(messages)]:
+                print(f"[client] {msg.decode()!r} -> {reply.decode()!r}")
+        logical = sum(len(r) for r in replies)
+        print(f"[client] {len(replies)} pipelined replies in {elapsed:.4f}s "
+              f"({logical / elapsed / 1e6:.1f} MB/s of payload)")
+        if codec is not None:
+            print(f"[client] {codec.method}: sent {codec.bytes_before} bytes as {codec.bytes_after} "
+                  f"(ratio {codec.ratio():.1f}x)")
+        return
+
+    threads = []
+    for msg in messages:
+        thread = threading.Thread(target=client_thread, args=(msg, args.header, args.uri))
+        threads.append(thread)
+        thread.start()
 
-threads = []
-for msg in messages:
-    thread = threading.Thread(target=client_thread, args=(msg,))
-    threads.append(thread)
-    thread.start()
+    for thread in threads:
+        thread.join()
 
-for thread in threads:
-    thread.join()
+    print("[client] all client threads done")
 
-print("[client] all client threads done")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""compression.py
+
+Optional, negotiated payload compression for the length-prefixed protocol.
+
+Negotiation is one control frame at the start of a connection. Control
+payloads start with a NUL byte, which the text protocol never sends:
+
+    client -> server   b"\\x00COMPRESS zlib,lzma"    methods the client accepts, preferred first
+    server -> client   b"\\x00COMPRESS zlib"         the chosen one, or b"\\x00COMPRESS none"
+
+Once a method is agreed, every payload in both directions starts with one
+flags byte (FLAG_RAW or FLAG_COMPRESSED) followed by the data. Payloads below
+the threshold are sent raw, so small messages pay one byte and no CPU.
+
+zlib keeps one compressor and one decompressor per connection and flushes
+with Z_SYNC_FLUSH after each frame: frames can be decoded on arrival, and
+later frames reuse the dictionary built from earlier ones, which helps most
+with many similar messages. lzma cannot flush mid-stream, so lzma frames are
+compressed independently.
+"""
+
+import lzma
+import zlib
+
+from framing import ASCII3, FrameDecoder, encode_frame, encode_header, recv_frame
+
+CONTROL = 0x00
+NEGOTIATE = b"\x00COMPRESS "
+NONE = "none"
+ZLIB = "zlib"
+LZMA = "lzma"
+METHODS = (ZLIB, LZMA)
+
+FLAG_RAW = 0x00
+FLAG_COMPRESSED = 0x01
+RAW = bytes([FLAG_RAW])
+COMPRESSED = bytes([FLAG_COMPRESSED])
+
+DEFAULT_THRESHOLD = 1024
+_SYNC_TAIL = b"\x00\x00\xff\xff"   # every Z_SYNC_FLUSH block ends with this
+
+
+class CompressionError(ValueError):
+    """Bad negotiation or a frame that does not decompress."""
+
+
+def offer(methods=METHODS):
+    """Payload of the client's negotiation frame."""
+    return NEGOTIATE + ",".join(methods).encode()
+
+
+def is_negotiation(payload):
+    return len(payload) >= len(NEGOTIATE) and payload[0] == CONTROL and bytes(payload[:len(NEGOTIATE)]) == NEGOTIATE
+
+
+def choose(payload, supported=METHODS):
+    """Server side: pick the first offered method we support. Returns the reply payload and method."""
+    offered = bytes(payload[len(NEGOTIATE):]).decode("ascii", "replace").split(",")
+    for method in offered:
+        method = method.strip()
+        if method in supported:
+            return NEGOTIATE + method.encode(), method
+    return NEGOTIATE + NONE.encode(), NONE
+
+
+def accepted(payload):
+    """Client side: the method from the server's reply (NONE if it declined)."""
+    if not is_negotiation(payload):
+        raise CompressionError(f"unexpected negotiation reply: {bytes(payload[:32])!r}")
+    method = bytes(payload[len(NEGOTIATE):]).decode("ascii", "replace")
+    if method != NONE and method not in METHODS:
+        raise CompressionError(f"server chose an unknown method: {method!r}")
+    return method
+
+
+def negotiate(sock, methods=METHODS, header=ASCII3, decoder=None, **codec_kwargs):
+    """
+    Client side of the handshake on a fresh blocking connection. Returns a
+    FrameCodec, or None if the server declined (frames then stay plain).
+    """
+    if decoder is None:
+        decoder = FrameDecoder(header)
+    header = decoder.header
+    sock.sendall(encode_frame(offer(methods), header))
+    reply = recv_frame(sock, decoder)
+    if reply is None:
+        raise ConnectionError("server closed the connection during compression negotiation")
+    method = accepted(reply)
+    return None if method == NONE else FrameCodec(method, **codec_kwargs)
+
+
+class FrameCodec:
+    """
+    Per-connection compressor/decompressor state for one negotiated method.
+    Not thread-safe: each direction of a connection is used by one thread.
+    """
+
+    def __init__(self, method, level=None, threshold=DEFAULT_THRESHOLD, max_size=64 * 1024 * 1024):
+        if method not in METHODS:
+            raise ValueError(f"unknown compression method: {method!r}")
+        self.method = method
+        self.threshold = threshold
+        self.max_size = max_size
+        if method == ZLIB:
+            self.level = 1 if level is None else level   # speed over ratio: we are on the hot path
+            self._compressor = zlib.compressobj(self.level)
+            self._decompressor = zlib.decompressobj()
+        else:
+            self.level = 0 if level is None else level
+        self.bytes_before = 0     # logical payload bytes that went through compress()
+        self.bytes_after = 0      # what actually went on the wire for them
+
+    def _compress(self, data):
+        if self.method == ZLIB:
+            out = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            # the sync marker is implied; the receiver adds it back
+            return out[:-4] if out.endswith(_SYNC_TAIL) else out
+        return lzma.compress(data, preset=self.level)
+
+    def _decompress(self, data):
+        if self.method == ZLIB:
+            d = self._decompressor
+            out = d.decompress(bytes(data) + _SYNC_TAIL, self.max_size)
+            if d.unconsumed_tail:
+                raise CompressionError(f"frame inflates past {self.max_size} bytes")
+            return out
+        d = lzma.LZMADecompressor()
+        out = d.decompress(bytes(data), self.max_size)
+        if not d.eof:
+            raise CompressionError(f"frame inflates past {self.max_size} bytes or is truncated")
+        return out
+
+    def encode(self, payload):
+        """
+        Buffers for one outgoing payload: [flag, data]. Payloads below the
+        threshold go out raw; bigger ones are compressed.
+        """
+        if len(payload) < self.threshold:
+            return [RAW, payload]
+        packed = self._compress(payload)
+        if self.method == LZMA and len(packed) >= len(payload):
+            return [RAW, payload]
+        # a zlib frame has already advanced the shared stream, so it is sent
+        # compressed even when it did not shrink, or the peer falls out of step
+        self.bytes_before += len(payload)
+        self.bytes_after += len(packed)
+        return [COMPRESSED, packed]
+
+    def frame_buffers(self, payload, header):
+        """encode() plus the length header: ready for sendmsg_all()."""
+        flag, data = self.encode(payload)
+        return [encode_header(1 + len(data), header), flag, data]
+
+    def decode(self, payload):
+        """Payload without its flags byte, inflated if it was compressed."""
+        if not len(payload):
+            raise CompressionError("empty frame on a compressed connection")
+        flag = payload[0]
+        body = memoryview(payload)[1:]
+        if flag == FLAG_RAW:
+            return body
+        if flag == FLAG_COMPRESSED:
+            try:
+                return self._decompress(body)
+            except (zlib.error, lzma.LZMAError) as e:
+                raise CompressionError(f"corrupt compressed frame: {e}") from None
+        raise CompressionError(f"unknown frame flags: {flag:#x}")
+
+    def ratio(self):
+        return self.bytes_before / self.bytes_after if self.bytes_after else 1.0
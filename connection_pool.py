@@ -0,0 +1,294 @@
+"""connection_pool.py
+
+Thread-safe pool of warm client connections for the length-prefixed protocol.
+
+Instead of paying socket.create_connection() for every message (as
+client.client_thread does), callers check a connection out, send one or more
+frames over it and hand it back:
+
+    pool = ConnectionPool(max_size=8, min_idle=2)
+    reply = pool.request(b"hello")
+
+    with pool.connection() as conn:        # conn is a client.PipelinedClient
+        replies = conn.request_batch([b"a", b"b", b"c"])
+
+PoolManager keeps one ConnectionPool per server URI so every host gets its own
+connection limit.
+"""
+
+import argparse
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from client import HOST, PORT, URI, PipelinedClient
+from framing import ASCII3, HEADERS
+from transport import tcp_uri
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the checkout timeout."""
+
+
+def is_healthy(client):
+    """
+    Cheap checkout health check: the socket must be open, have no unread bytes
+    and not be at EOF. A non-blocking peek tells those apart without consuming data.
+    """
+    if client.decoder.pending:
+        return False
+    sock = client.sock
+    timeout = sock.gettimeout()
+    try:
+        sock.settimeout(0)
+        sock.recv(1, socket.MSG_PEEK)
+    except BlockingIOError:
+        return True   # nothing to read: idle and alive
+    except OSError:
+        return False
+    finally:
+        try:
+            sock.settimeout(timeout)
+        except OSError:
+            pass
+    # b"" means the server closed it; any data means a stray reply is waiting.
+    # Either way the connection cannot be handed out.
+    return False
+
+
+class ConnectionPool:
+    """
+    Pool of PipelinedClient connections to one server.
+
+    max_size         - hard limit on open connections (idle + checked out)
+    min_idle         - idle connections kept warm by maintain()/the reaper
+    max_idle_time    - idle connections older than this (seconds) are closed
+    checkout_timeout - how long acquire() waits when the pool is exhausted
+    compression      - methods each new connection offers (see PipelinedClient)
+    """
+
+    def __init__(self, host=HOST, port=PORT, header=ASCII3, max_size=8, min_idle=0,
+                 max_idle_time=30.0, connect_timeout=5, checkout_timeout=5, uri=None, compression=None):
+        if min_idle > max_size:
+            raise ValueError("min_idle cannot exceed max_size")
+        self.uri = uri or tcp_uri(host, port)
+        self.header = header
+        self.max_size = max_size
+        self.min_idle = min_idle
+        self.max_idle_time = max_idle_time
+        self.connect_timeout = connect_timeout
+        self.checkout_timeout = checkout_timeout
+        self.compression = compression
+
+        self._idle = deque()        # (client, last_used); most recently used on the right
+        self._total = 0             # open connections plus ones being opened
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._reaper = None
+        self._counters = {
+            "created": 0, "reused": 0, "closed": 0, "health_check_failures": 0,
+            "evicted_idle": 0, "checkout_timeouts": 0, "connect_errors": 0,
+        }
+
+    def _connect(self):
+        try:
+            client = PipelinedClient(header=self.header, timeout=self.connect_timeout, uri=self.uri,
+                                     compression=self.compression)
+        except BaseException:
+            # whatever failed, the slot reserved for this connection is free again
+            with self._cond:
+                self._total -= 1
+                self._counters["connect_errors"] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters["created"] += 1
+        return client
+
+    def _discard(self, client):
+        """Close a connection that has already been removed from the pool. Caller holds the lock."""
+        client.close()
+        self._total -= 1
+        self._counters["closed"] += 1
+        self._cond.notify()
+
+    def _evict_expired(self, now):
+        """Close idle connections past max_idle_time, keeping min_idle. Caller holds the lock."""
+        while len(self._idle) > self.min_idle and now - self._idle[0][1] > self.max_idle_time:
+            client, _ = self._idle.popleft()
+            self._counters["evicted_idle"] += 1
+            self._discard(client)
+
+    def acquire(self, timeout=None):
+        """Check out a healthy connection, opening a new one if under max_size."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("pool is closed")
+                self._evict_expired(time.monotonic())
+                while self._idle:
+                    client, _ = self._idle.pop()   # LIFO keeps the warmest sockets busy
+                    if is_healthy(client):
+                        self._counters["reused"] += 1
+                        return client
+                    self._counters["health_check_failures"] += 1
+                    self._discard(client)
+                if self._total < self.max_size:
+                    self._total += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["checkout_timeouts"] += 1
+                    raise PoolTimeout(f"no connection to {self.uri} available after {timeout}s")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+        return self._connect()
+
+    def release(self, client, discard=False):
+        """Return a connection. Pass discard=True if it may be in a bad state."""
+        with self._cond:
+            if discard or self._closed or client.decoder.pending:
+                self._discard(client)
+                return
+            self._idle.append((client, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        client = self.acquire(timeout)
+        try:
+            yield client
+        except BaseException:
+            self.release(client, discard=True)
+            raise
+        self.release(client)
+
+    def request(self, payload):
+        with self.connection() as client:
+            return client.request(payload)
+
+    def request_batch(self, payloads):
+        with self.connection() as client:
+            return client.request_batch(payloads)
+
+    def maintain(self):
+        """Evict expired idle connections and open new ones until min_idle are warm."""
+        with self._cond:
+            self._evict_expired(time.monotonic())
+            missing = min(self.min_idle - len(self._idle), self.max_size - self._total)
+            if self._closed or missing <= 0:
+                return
+            self._total += missing
+        for left in range(missing, 0, -1):
+            try:
+                client = self._connect()
+            except (OSError, ValueError):   # ValueError: a bad address or compression handshake
+                continue
+            except BaseException:
+                # _connect freed its own slot; free the ones reserved for the rest too
+                with self._cond:
+                    self._total -= left - 1
+                    self._cond.notify_all()
+                raise
+            self.release(client)
+
+    def start_reaper(self, interval=1.0):
+        """Run maintain() every `interval` seconds in a daemon thread."""
+        def loop():
+            while not self._closed:
+                self.maintain()
+                time.sleep(interval)
+        self._reaper = threading.Thread(target=loop, name="pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def stats(self):
+        with self._cond:
+            out = dict(self._counters)
+            out.update(
+                uri=self.uri,
+                open=self._total,
+                idle=len(self._idle),
+                in_use=self._total - len(self._idle),
+                waiting=self._waiting,
+                max_size=self.max_size,
+            )
+            return out
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                client, _ = self._idle.pop()
+                self._discard(client)
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PoolManager:
+    """One ConnectionPool per server URI; pool settings apply to every host."""
+
+    def __init__(self, **pool_kwargs):
+        self.pool_kwargs = pool_kwargs
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool(self, uri=URI):
+        with self._lock:
+            pool = self._pools.get(uri)
+            if pool is None:
+                pool = self._pools[uri] = ConnectionPool(uri=uri, **self.pool_kwargs)
+            return pool
+
+    def request(self, payload, uri=URI):
+        return self.pool(uri).request(payload)
+
+    def stats(self):
+        with self._lock:
+            pools = list(self._pools.values())
+        return [pool.stats() for pool in pools]
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan requests out over a pool of warm connections")
+    parser.add_argument("--header", choices=HEADERS, default=ASCII3)
+    parser.add_argument("--uri", default=URI, help="tcp://host:port or unix:///path")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--max-size", type=int, default=4)
+    parser.add_argument("--min-idle", type=int, default=2)
+    args = parser.parse_args()
+
+    messages = [b"hello", b"world", b"test message"]
+    with ConnectionPool(header=args.header, uri=args.uri, max_size=args.max_size, min_idle=args.min_idle) as pool:
+        pool.maintain()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as ex:
+            replies = list(ex.map(pool.request, (messages[i % 3] for i in range(args.requests))))
+        elapsed = time.perf_counter() - start
+        print(f"[pool] {len(replies)} requests in {elapsed:.4f}s")
+        print(f"[pool] stats: {pool.stats()}")
+
+
+if __name__ == "__main__":
+    main()
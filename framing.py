@@ -0,0 +1,278 @@
+"""framing.py
+
+Incremental frame codec for the length-prefixed socket protocol used by
+server.py, client.py and labmid/*_with_length.py.
+
+A frame is a length header followed by that many payload bytes. Three header
+formats are supported:
+
+    ascii3  - 3 ASCII digits, zero padded (the original lab protocol, max 999 bytes)
+    u32     - 4 byte big-endian unsigned int (max 4 GiB - 1)
+    varint  - unsigned LEB128, 1 byte for payloads < 128 bytes
+
+FrameDecoder reads straight into one reusable buffer with recv_into() and
+yields every complete frame in that buffer as a memoryview, so pipelined frames
+and frames split across reads are both handled without per-frame allocations.
+"""
+
+import os
+import struct
+
+ASCII3 = "ascii3"
+U32 = "u32"
+VARINT = "varint"
+HEADERS = (ASCII3, U32, VARINT)
+
+MAX_ASCII3 = 999
+MAX_VARINT_BYTES = 10
+DEFAULT_MAX_FRAME = 64 * 1024 * 1024
+
+_U32 = struct.Struct("!I")
+
+
+class FrameError(ValueError):
+    """Raised when the peer sends something that is not a valid frame."""
+
+
+def encode_header(length, header=ASCII3):
+    """Return the header bytes announcing a payload of `length` bytes."""
+    if length < 0:
+        raise ValueError("negative frame length")
+    if header == ASCII3:
+        if length > MAX_ASCII3:
+            raise ValueError(f"ascii3 frames are limited to {MAX_ASCII3} bytes, got {length}")
+        return b"%03d" % length
+    if header == U32:
+        return _U32.pack(length)
+    if header == VARINT:
+        out = bytearray()
+        while True:
+            byte = length & 0x7F
+            length >>= 7
+            if length:
+                out.append(byte | 0x80)
+            else:
+                out.append(byte)
+                return bytes(out)
+    raise ValueError(f"unknown header format: {header!r}")
+
+
+def encode_frame(payload, header=ASCII3):
+    """Return header + payload as a single bytes object."""
+    return encode_header(len(payload), header) + bytes(payload)
+
+
+def _parse_header(buf, start, end, header):
+    """
+    Parse a header at buf[start:end].
+    Returns (header_len, payload_len) or None if more bytes are needed.
+    """
+    avail = end - start
+    if header == ASCII3:
+        if avail < 3:
+            return None
+        digits = bytes(buf[start:start+3])
+        if not digits.isdigit():
+            raise FrameError(f"bad ascii3 length prefix: {digits!r}")
+        return 3, int(digits)
+    if header == U32:
+        if avail < 4:
+            return None
+        return 4, _U32.unpack_from(buf, start)[0]
+    if header == VARINT:
+        length = 0
+        shift = 0
+        for i in range(min(avail, MAX_VARINT_BYTES)):
+            byte = buf[start+i]
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return i + 1, length
+            shift += 7
+        if avail >= MAX_VARINT_BYTES:
+            raise FrameError("varint length prefix is too long")
+        return None
+    raise ValueError(f"unknown header format: {header!r}")
+
+
+class FrameDecoder:
+    """
+    Streaming decoder for one connection.
+
+    Typical use with a blocking socket:
+
+        decoder = FrameDecoder(U32)
+        while decoder.recv_into(sock):
+            for payload in decoder.frames():
+                ...
+
+    Payload memoryviews point into the decoder's buffer and are only valid
+    until the next call to recv_into() or feed(); copy them (bytes(payload))
+    if they must live longer.
+    """
+
+    def __init__(self, header=ASCII3, buffer_size=65536, max_frame=DEFAULT_MAX_FRAME):
+        if header not in HEADERS:
+            raise ValueError(f"unknown header format: {header!r}")
+        self.header = header
+        self.buffer_size = buffer_size
+        self.max_frame = max_frame
+        self._buf = None   # allocated on first read, so idle connections cost nothing
+        self._view = None
+        self._start = 0    # first unconsumed byte
+        self._end = 0      # one past the last received byte
+        self._need = 0     # size of the frame we are waiting for, if known
+
+    @property
+    def pending(self):
+        """Number of received bytes that are not yet part of a complete frame."""
+        return self._end - self._start
+
+    def _reserve(self):
+        """Make room at the end of the buffer and return a writable view of it."""
+        if self._buf is None:
+            self._buf = bytearray(max(self.buffer_size, self._need))
+            self._view = memoryview(self._buf)
+        pending = self._end - self._start
+        capacity = len(self._buf)
+        if self._need > capacity or pending == capacity:
+            # a frame bigger than the buffer: grow once to fit it
+            new = bytearray(max(self._need, 2 * capacity))
+            new[:pending] = self._view[self._start:self._end]
+            self._buf = new
+            self._view = memoryview(new)
+            self._start, self._end = 0, pending
+        elif self._start and (self._start == self._end or self._end == capacity
+                              or self._start + self._need > capacity):
+            # move the partial frame to the front so the buffer is reused
+            self._view[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        return self._view[self._end:]
+
+    def recv_into(self, sock):
+        """Receive once from sock into the buffer. Returns the byte count (0 on EOF)."""
+        with self._reserve() as free:
+            n = sock.recv_into(free)
+        self._end += n
+        return n
+
+    def feed(self, data):
+        """Append already-received bytes (e.g. from a test or another transport)."""
+        data = memoryview(data)
+        while data:
+            with self._reserve() as free:
+                n = min(len(free), len(data))
+                free[:n] = data[:n]
+            self._end += n
+            data = data[n:]
+
+    @property
+    def view(self):
+        """memoryview of the whole receive buffer (offsets come from frame_spans())."""
+        return self._view
+
+    def frame_spans(self):
+        """
+        Yield (frame_start, payload_start, frame_end) offsets into `view` for
+        every complete frame currently buffered. Consecutive frames are
+        contiguous, which lets an echo server send runs of them in one slice.
+        """
+        while self._start < self._end:
+            parsed = _parse_header(self._buf, self._start, self._end, self.header)
+            if parsed is None:
+                self._need = MAX_VARINT_BYTES
+                return
+            hlen, length = parsed
+            if length > self.max_frame:
+                raise FrameError(f"frame of {length} bytes exceeds the {self.max_frame} byte limit")
+            if self._end - self._start < hlen + length:
+                self._need = hlen + length
+                return
+            frame_start = self._start
+            self._start = frame_start + hlen + length
+            self._need = 0
+            yield frame_start, frame_start + hlen, self._start
+        self._need = 0
+
+    def frames(self):
+        """Yield the payload of every complete frame currently buffered."""
+        for _, payload_start, end in self.frame_spans():
+            yield self._view[payload_start:end]
+
+
+def iter_frames(sock, decoder):
+    """Yield payloads from a blocking socket until the peer closes it."""
+    while decoder.recv_into(sock):
+        yield from decoder.frames()
+
+
+def recv_frame(sock, decoder):
+    """Block until one complete frame is available and return it as bytes (None on EOF)."""
+    for payload in decoder.frames():
+        return bytes(payload)
+    while decoder.recv_into(sock):
+        for payload in decoder.frames():
+            return bytes(payload)
+    return None
+
+
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+
+def sendmsg_all(sock, buffers):
+    """
+    Send a list of buffers with vectored sendmsg() calls, handling partial
+    writes. Falls back to one joined sendall() where sendmsg is missing (Windows).
+    Returns the number of bytes sent.
+    """
+    if not hasattr(sock, "sendmsg"):
+        data = b"".join(buffers)
+        sock.sendall(data)
+        return len(data)
+    views = [memoryview(b).cast("B") for b in buffers if len(b)]
+    total = sum(len(v) for v in views)
+    i = 0
+    while i < len(views):
+        sent = sock.sendmsg(views[i:i+IOV_MAX])
+        # skip the buffers that went out completely, trim the partial one
+        while sent and i < len(views):
+            if sent >= len(views[i]):
+                sent -= len(views[i])
+                i += 1
+            else:
+                views[i] = views[i][sent:]
+                sent = 0
+    return total
+
+
+def send_frames(sock, payloads, header=ASCII3):
+    """
+    Send several frames in as few system calls as possible, without joining
+    payloads. Returns the number of bytes sent, headers included.
+    """
+    buffers = []
+    for payload in payloads:
+        buffers.append(encode_header(len(payload), header))
+        buffers.append(payload)
+    return sendmsg_all(sock, buffers)
+
+
+# Multiplexed sessions (labmid/server_with_length.py --mux): the first 4 bytes
+# of every payload are a request ID chosen by the client. Replies carry the
+# same ID, so they can come back in any order.
+REQUEST_ID = struct.Struct("!I")
+
+
+def split_request_id(payload):
+    """Return (request_id, body) for a multiplexed payload; body is a view, not a copy."""
+    if len(payload) < REQUEST_ID.size:
+        raise FrameError("multiplexed frame is shorter than its request ID")
+    return REQUEST_ID.unpack_from(payload)[0], memoryview(payload)[REQUEST_ID.size:]
+
+
+def send_request(sock, request_id, body, header=U32):
+    """Send one multiplexed frame: length header, request ID, body."""
+    return sendmsg_all(sock, [encode_header(REQUEST_ID.size + len(body), header),
+                              REQUEST_ID.pack(request_id), body])
@@ -1,7 +1,12 @@
-import multiprocessing as mp
-from concurrent.futures import ProcessPoolExecutor
+import functools
+import os
+import sys
 import time
 
+# parallel_loop.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parallel_loop import parallel_reduce
+
 def compute_partial_sum(chunk_data):
     """
     Compute partial sum for a chunk of array.
@@ -18,6 +23,13 @@ def compute_partial_sum(chunk_data):
     return chunk_id, partial_sum
 
 
+def sum_block(array, chunk):
+    """One block of the loop (a parallel_loop.Chunk): [(first, last, partial sum)]."""
+    first, stop = chunk.iterations.start, chunk.iterations.stop
+    _, partial_sum = compute_partial_sum((chunk.id, array[first:stop]))
+    return [(first, stop - 1, partial_sum)]
+
+
 def parallel_reduction_sum(array, num_workers=4):
     """
     Parallel sum using reduction pattern.
@@ -37,37 +49,27 @@ def parallel_reduction_sum(array, num_workers=4):
     Returns:
         Total sum of array
     """
-    n = len(array)
-    chunk_size = (n + num_workers - 1) // num_workers  # Ceiling division
-    
-    # Create chunks with IDs
-    chunks = []
-    for i in range(num_workers):
-        start = i * chunk_size
-        end = min(start + chunk_size, n)
-        if start < n:
-            chunks.append((i, array[start:end]))
-    
-    print(f"Array divided into {len(chunks)} chunks")
-    for chunk_id, chunk in chunks:
-        print(f"  Worker {chunk_id}: {len(chunk)} elements -> range [{chunk[0]}..{chunk[-1]}]")
+    # One block per worker (static schedule); each block returns a one-item
+    # list, so adding the partials collects all of them. The backend is
+    # chosen from the measured cost of a block: summing 100 numbers is far
+    # cheaper than pickling them to another process.
+    results = parallel_reduce(len(array), functools.partial(sum_block, array), initial=[],
+                              workers=num_workers, per_chunk=True)
+
+    print(f"Array divided into {len(results)} blocks")
     print()
-    
-    # Parallel computation of partial sums
-    with ProcessPoolExecutor(max_workers=num_workers) as executor:
-        results = list(executor.map(compute_partial_sum, chunks))
-    
+
     # Display partial results
     print("Partial sums computed:")
-    for chunk_id, partial in sorted(results):
-        print(f"  Worker {chunk_id}: Partial sum = {partial}")
+    for first, last, partial in sorted(results):
+        print(f"  Block [{array[first]}..{array[last]}]: {last - first + 1} elements -> partial sum = {partial}")
     print()
-    
+
     # Reduction: Combine all partial sums
     print("Reduction operation:")
-    partial_values = [partial for _, partial in sorted(results)]
+    partial_values = [partial for _, _, partial in sorted(results)]
     print(f"  {' + '.join(map(str, partial_values))} = ", end="")
-    total_sum = sum(partial for _, partial in results)
+    total_sum = sum(partial_values)
     print(total_sum)
     
     return total_sum
@@ -150,7 +152,8 @@ if __name__ == "__main__":
 # - Efficient parallel aggregation
 #
 # THIS IMPLEMENTATION:
-# - Divides array into chunks
+# - Divides array into blocks (parallel_loop's static schedule)
 # - Each worker computes partial sum (private accumulator)
+# - Workers are threads of parallel_loop's warm pool
 # - Master thread reduces all partials (implicit barrier + reduction)
 # - Demonstrates scatter-compute-reduce pattern
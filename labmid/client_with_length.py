@@ -1,25 +1,37 @@
+import argparse
+import itertools
+import os
 import socket
+import sys
+import threading
+import time
+from concurrent.futures import Future
 
-def start_client(host='localhost', port=12345):
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client_socket.connect((host, port))
+# framing.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from framing import ASCII3, HEADERS, U32, FrameDecoder, encode_frame, encode_header, iter_frames, send_request, split_request_id
+from transport import connect, tcp_uri
+
+def start_client(host='localhost', port=12345, header=ASCII3, uri=None):
+    client_socket = connect(uri or tcp_uri(host, port))
 
     message = input("Enter message to send: ")
 
     # Compute length of message
-    length = len(message.encode('utf-8'))  # Length in bytes
-    length_str = str(length).zfill(3)  # Pad to 3 digits with leading zeros
+    payload = message.encode('utf-8')
+    length = len(payload)  # Length in bytes
+    length_header = encode_header(length, header)  # e.g. 3 digits with leading zeros
 
     # Prepend length to message
-    full_message = length_str + message
+    full_message = encode_frame(payload, header)
 
     print(f"Original message: '{message}'")
     print(f"Message length: {length} bytes")
-    print(f"Padded length: '{length_str}'")
-    print(f"Full message to send: '{full_message}'")
+    print(f"Length header ({header}): {length_header!r}")
+    print(f"Full message to send: {full_message!r}")
 
     # Send the message
-    client_socket.sendall(full_message.encode('utf-8'))
+    client_socket.sendall(full_message)
 
     # Receive response from server
     response = client_socket.recv(1024).decode('utf-8')
@@ -27,5 +39,85 @@ def start_client(host='localhost', port=12345):
 
     client_socket.close()
 
+class MuxClient:
+    """
+    Client for server_with_length.py --mux. One connection carries many
+    concurrent requests; each gets a request ID and submit() returns a Future
+    that a background reader thread completes when the reply with that ID
+    arrives, whatever order the server answers in.
+    """
+
+    def __init__(self, host='localhost', port=12345, header=U32, uri=None):
+        self.header = header
+        self.sock = connect(uri or tcp_uri(host, port))
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()       # guards _pending
+        self._send_lock = threading.Lock()  # keeps frames from different threads whole
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        error = ConnectionError("connection closed by server")
+        try:
+            for payload in iter_frames(self.sock, FrameDecoder(self.header)):
+                request_id, body = split_request_id(payload)
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is not None:
+                    future.set_result(str(body, 'utf-8'))
+        except (OSError, ValueError) as e:
+            error = e
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(error)
+
+    def submit(self, message):
+        future = Future()
+        request_id = next(self._ids) & 0xFFFFFFFF
+        with self._lock:
+            self._pending[request_id] = future
+        with self._send_lock:
+            send_request(self.sock, request_id, message.encode('utf-8'), self.header)
+        return future
+
+    def request(self, message, timeout=None):
+        return self.submit(message).result(timeout)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._reader.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def mux_demo(host='localhost', port=12345, header=U32, uri=None):
+    """A slow request and several fast ones share one connection; the fast ones finish first."""
+    with MuxClient(host, port, header=header, uri=uri) as client:
+        start = time.perf_counter()
+        slow = client.submit("sleep:1.0")
+        fast = [client.submit(f"fast request {i}") for i in range(5)]
+        for f in fast + [slow]:
+            response = f.result()
+            print(f"[{time.perf_counter() - start:.3f}s] {response}")
+
 if __name__ == "__main__":
-    start_client()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mux", action="store_true", help="talk to server_with_length.py --mux")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--uri", help="tcp://host:port or unix:///path (overrides --port)")
+    parser.add_argument("--header", choices=HEADERS,
+                        help="length prefix format, must match the server (default: ascii3, u32 with --mux)")
+    args = parser.parse_args()
+    if args.mux:
+        mux_demo(port=args.port, header=args.header or U32, uri=args.uri)
+    else:
+        start_client(port=args.port, header=args.header or ASCII3, uri=args.uri)
@@ -1,7 +1,15 @@
+import argparse
 import multiprocessing as mp
+import os
+import sys
 import time
 import random
 
+# task_queue.py and parallel_loop.py live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parallel_loop import parallel_reduce
+from task_queue import Coordinator, run_worker
+
 def make_chunks_dynamic(n, chunk_size):
     """Generate chunks for dynamic scheduling."""
     chunks = []
@@ -21,61 +29,109 @@ def process_chunk(chunk_id, start, end, process_id):
     print(f"Process {process_id} processed chunk {chunk_id}: range({start}, {end}) -> sum = {result}")
     return result
 
-def worker(queue, results, process_id):
-    """Worker function that processes chunks from the queue."""
-    while True:
-        try:
-            chunk = queue.get(timeout=1)  # Wait for a chunk
-            if chunk is None:  # Sentinel to stop
-                break
-            chunk_id, start, end = chunk
-            result = process_chunk(chunk_id, start, end, process_id)
-            results.append(result)
-        except:
-            break
-
-def main():
-    n = 100
-    chunk_size = 10
-    num_processes = 4
-
+def run_chunk(chunk):
+    """One chunk handed out by parallel_loop: (sum, chunks) so the count reduces along with the sum."""
+    return process_chunk(chunk.id, chunk.iterations.start, chunk.iterations.stop, chunk.worker), 1
+
+def add_pairs(a, b):
+    """Reduce (sum, chunks) pairs; module level so the warm process pool can unpickle it."""
+    return a[0] + b[0], a[1] + b[1]
+
+def tcp_worker(uri, process_id):
+    """Lease chunks from a coordinator (possibly on another machine) until it runs out."""
+    done = run_worker(uri, lambda chunk_id, start, end: process_chunk(chunk_id, start, end, process_id),
+                      name=f"process-{process_id}")
+    print(f"Process {process_id} finished {done} chunks")
+
+def run_coordinator(uri, n, chunk_size, local_workers, lease_timeout):
+    """
+    Same dynamic schedule, but chunks are leased over TCP: any number of
+    `--worker` processes on any host can join. `local_workers` starts that
+    many on this machine as well.
+    """
     chunks = make_chunks_dynamic(n, chunk_size)
     print(f"Total chunks: {len(chunks)}")
-    for i, (start, end) in enumerate(chunks):
-        print(f"Chunk {i}: range({start}, {end})")
-
-    # Create a queue for chunks
-    queue = mp.Queue()
-    for i, (start, end) in enumerate(chunks):
-        queue.put((i, start, end))
-
-    # Add sentinels
-    for _ in range(num_processes):
-        queue.put(None)
+    with Coordinator([(i, start, end) for i, (start, end) in enumerate(chunks)], uri,
+                     lease_timeout=lease_timeout) as coordinator:
+        print(f"Coordinator listening on {uri}, waiting for workers...")
+        start_time = time.time()
+        processes = [mp.Process(target=tcp_worker, args=(uri, i)) for i in range(local_workers)]
+        for p in processes:
+            p.start()
+
+        total_sum = 0
+        per_worker = {}
+        # results stream in as workers finish chunks, in completion order
+        for chunk_id, value, worker in coordinator.results():
+            if chunk_id in coordinator.failed:
+                continue            # reported below; its value is None
+            total_sum += value
+            per_worker[worker] = per_worker.get(worker, 0) + 1
+        end_time = time.time()
+
+        for p in processes:
+            p.join()
+        stats = coordinator.stats()
 
-    # Shared list for results
-    manager = mp.Manager()
-    results = manager.list()
+    expected_sum = sum(range(n))
+    print(f"\nChunks per worker: {per_worker}")
+    print(f"Lease stats: {stats}")
+    for chunk_id, error in sorted(coordinator.failed.items()):
+        print(f"Chunk {chunk_id} {chunks[chunk_id]} failed: {error}")
+    print(f"Total sum: {total_sum}" + (f" (without {len(coordinator.failed)} failed chunk(s))"
+                                        if coordinator.failed else ""))
+    print(f"Expected sum: {expected_sum}")
+    print(f"Match: {total_sum == expected_sum}")
+    print(f"Time taken: {end_time - start_time:.4f} seconds")
 
-    print(f"\nStarting {num_processes} processes with dynamic scheduling...")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=100)
+    parser.add_argument("--chunk-size", type=int, default=10)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--schedule", choices=["dynamic", "guided", "steal", "auto"], default="dynamic",
+                        help="guided: chunks of remaining/processes (at least --chunk-size), sized at claim time; "
+                             "steal: per-process blocks, idle processes steal half of the fullest one; "
+                             "auto: chunk size tuned from measured chunk times (--chunk-size is the first probe)")
+    parser.add_argument("--coordinator", metavar="URI",
+                        help="lease chunks over TCP on this URI (e.g. tcp://0.0.0.0:5600) instead of a shared counter")
+    parser.add_argument("--local-workers", type=int, default=None,
+                        help="with --coordinator: workers to start on this host (default: --processes)")
+    parser.add_argument("--lease-timeout", type=float, default=30.0,
+                        help="with --coordinator: seconds before an unfinished chunk is handed to someone else")
+    parser.add_argument("--worker", metavar="URI", help="join the coordinator at URI as one worker")
+    parser.add_argument("--id", type=int, default=0, help="with --worker: process id shown in the output")
+    args = parser.parse_args()
+
+    if args.worker:
+        tcp_worker(args.worker, args.id)
+        return
+    if args.coordinator:
+        local = args.processes if args.local_workers is None else args.local_workers
+        run_coordinator(args.coordinator, args.n, args.chunk_size, local, args.lease_timeout)
+        return
+
+    n = args.n
+    chunk_size = args.chunk_size
+    num_processes = args.processes
+
+    # No chunk list: each process claims its next chunk from shared memory
+    # when it is ready, so chunks are sized (guided) and handed out at run
+    # time without a queue round trip
+    print(f"Starting {num_processes} processes with {args.schedule} scheduling...")
 
     start_time = time.time()
 
-    processes = []
-    for i in range(num_processes):
-        p = mp.Process(target=worker, args=(queue, results, i))
-        p.start()
-        processes.append(p)
-
-    for p in processes:
-        p.join()
+    total_sum, total_chunks = parallel_reduce(
+        n, run_chunk, op=add_pairs, initial=(0, 0),
+        schedule=args.schedule, chunk=chunk_size, workers=num_processes, backend="processes", per_chunk=True)
 
     end_time = time.time()
 
-    total_sum = sum(results)
     expected_sum = sum(range(n))
 
-    print(f"\nTotal sum: {total_sum}")
+    print(f"\nTotal chunks: {total_chunks}")
+    print(f"Total sum: {total_sum}")
     print(f"Expected sum: {expected_sum}")
     print(f"Match: {total_sum == expected_sum}")
     print(f"Time taken: {end_time - start_time:.4f} seconds")
@@ -1,6 +1,12 @@
 import multiprocessing as mp
+import os
+import sys
 import time
 
+# worker_pools.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from worker_pools import process_pool
+
 def compute_sum(start, end):
     """Function to compute sum of numbers in a range."""
     total = 0
@@ -20,8 +26,9 @@ def main():
 
     start_time = time.time()
 
-    with mp.Pool(processes=num_processes) as pool:
-        results = pool.starmap(compute_sum, ranges)
+    # the warm pool is started once per process and reused by every later call
+    with process_pool(num_processes) as pool:
+        results = list(pool.map(compute_sum, *zip(*ranges)))
 
     total_sum = sum(results)
     end_time = time.time()
@@ -37,5 +44,5 @@ if __name__ == "__main__":
 # In this program, we use multiprocessing to parallelize a loop that computes the sum of numbers from 0 to n-1.
 # The loop is divided into chunks, each processed by a separate process.
 # This demonstrates parallel execution using Python's multiprocessing module, which simulates a parallel loop construct.
-# The Pool.starmap function is used to apply the compute_sum function to each range in parallel.
+# The warm process pool's map applies the compute_sum function to each range in parallel.
 # This approach distributes the workload across multiple CPU cores, potentially speeding up the computation for large n.
\ No newline at end of file
@@ -1,68 +1,37 @@
+import os
+import sys
 import time
 import random
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def make_chunks_static(n, chunk_size, num_workers):
-    """Create static chunks distributed among workers."""
-    indices = list(range(n))
-    chunked = [indices[i:i+chunk_size] for i in range(0, n, chunk_size)]
-    buckets = [[] for _ in range(num_workers)]
-    for i, ch in enumerate(chunked):
-        buckets[i % num_workers].extend(ch)
-    return buckets
+# parallel_loop.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parallel_loop import parallel_reduce
 
-def make_chunks_dynamic(n, chunk_size):
-    """Create dynamic chunks."""
-    return [list(range(i, min(i+chunk_size, n))) for i in range(0, n, chunk_size)]
+# Chunks are range objects handed out by parallel_loop, so nothing is ever
+# planned as list(range(n)) and copied.
 
-def make_chunks_guided(n, min_chunk=1):
-    """Create guided chunks with decreasing sizes."""
-    remaining = n
-    start = 0
-    chunks = []
-    while remaining > 0:
-        size = max(remaining // 2, min_chunk)
-        end = min(start + size, n)
-        chunks.append(list(range(start, end)))
-        consumed = end - start
-        start = end
-        remaining -= consumed
-    return chunks
-
-def process_chunk(indices, worker_id, schedule_type):
-    """Process a chunk of indices, simulating work."""
+def process_chunk(chunk, schedule_type):
+    """Process the indices of one chunk (a parallel_loop.Chunk), simulating work."""
     # Simulate variable work
     work_time = random.uniform(0.01, 0.05)
     time.sleep(work_time)
-    result = sum(i**2 for i in indices)
-    print(f"[{schedule_type}] Worker {worker_id} processed {len(indices)} items: {indices[:3]}{'...' if len(indices) > 3 else ''} -> partial sum = {result}")
+    items = chunk.iterations
+    result = sum(i**2 for i in items)
+    head = list(items[:3])
+    print(f"[{schedule_type}] Worker {chunk.worker} processed {len(items)} items: {head}{'...' if len(items) > 3 else ''} -> partial sum = {result}")
     return result
 
 def run_schedule(n, chunk_size, schedule_type, num_workers=4):
-    """Run computation with specified schedule."""
+    """Run computation with specified schedule (chunk_size is tuned for "auto")."""
     print(f"\n--- Running {schedule_type.upper()} scheduling ---")
     start_time = time.time()
 
-    if schedule_type == "static":
-        buckets = make_chunks_static(n, chunk_size, num_workers)
-        work = [bucket for bucket in buckets if bucket]
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = [executor.submit(process_chunk, bucket, i, schedule_type) for i, bucket in enumerate(work)]
-            results = [f.result() for f in futures]
-    elif schedule_type == "dynamic":
-        chunks = make_chunks_dynamic(n, chunk_size)
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = [executor.submit(process_chunk, chunk, i, schedule_type) for i, chunk in enumerate(chunks)]
-            results = [f.result() for f in as_completed(futures)]
-    elif schedule_type == "guided":
-        chunks = make_chunks_guided(n, max(1, chunk_size // 2))
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = [executor.submit(process_chunk, chunk, i, schedule_type) for i, chunk in enumerate(chunks)]
-            results = [f.result() for f in as_completed(futures)]
-    else:
-        raise ValueError("Unknown schedule type")
+    # guided takes chunk_size // 2 as its minimum chunk, as it always has here
+    chunk = max(1, chunk_size // 2) if schedule_type == "guided" else chunk_size
+    total_sum = parallel_reduce(n, lambda c: process_chunk(c, schedule_type), initial=0,
+                                schedule=schedule_type, chunk=chunk, workers=num_workers,
+                                per_chunk=True)
 
-    total_sum = sum(results)
     end_time = time.time()
     print(f"[{schedule_type.upper()}] Total sum: {total_sum}, Time: {end_time - start_time:.4f}s")
     return total_sum, end_time - start_time
@@ -75,7 +44,7 @@ def main():
     print("Experimenting with different scheduling options")
     print(f"n = {n}, chunk_size = {chunk_size}, num_workers = {num_workers}")
 
-    schedules = ["static", "dynamic", "guided"]
+    schedules = ["static", "dynamic", "guided", "steal", "auto"]
     results = {}
 
     for schedule in schedules:
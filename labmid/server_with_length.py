@@ -1,33 +1,53 @@
-import socket
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def start_server(host='localhost', port=12345):
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind((host, port))
-    server_socket.listen(5)
-    print(f"Server listening on {host}:{port}")
+# framing.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from framing import ASCII3, HEADERS, U32, FrameDecoder, FrameError, iter_frames, recv_frame, send_request, split_request_id
+from transport import create_server, peer_name, set_nodelay, tcp_uri
+
+MAX_SLEEP = 5.0  # longest slow request a client may ask the mux demo for
+
+def make_response(message, slow=False):
+    """
+    Acknowledge a message. With slow=True (the multiplexing server only, where
+    it holds up nobody else), 'sleep:<seconds>' simulates a slow request of
+    at most MAX_SLEEP seconds.
+    """
+    if slow and message.startswith("sleep:"):
+        time.sleep(min(float(message[len("sleep:"):]), MAX_SLEEP))
+    return f"Message received: '{message}' (length: {len(message.encode('utf-8'))})"
+
+def start_server(host='localhost', port=12345, header=ASCII3, uri=None):
+    uri = uri or tcp_uri(host, port)
+    server_socket = create_server(uri, backlog=5)
+    print(f"Server listening on {uri}")
 
     while True:
         client_socket, client_address = server_socket.accept()
-        print(f"Connection from {client_address}")
+        print(f"Connection from {peer_name(client_address)}")
 
         try:
-            # First, receive the length prefix (exactly 3 bytes)
-            length_bytes = client_socket.recv(3)
-            if not length_bytes:
+            # Read the length prefix, then exactly that many message bytes,
+            # even if they arrive split over several packets
+            decoder = FrameDecoder(header, buffer_size=1024)
+            message_bytes = recv_frame(client_socket, decoder)
+            if message_bytes is None:
                 break
-            length_str = length_bytes.decode('utf-8')
-            message_length = int(length_str)
+            message_length = len(message_bytes)
 
-            print(f"Received length prefix: '{length_str}' -> {message_length} bytes")
+            print(f"Received length prefix ({header}) -> {message_length} bytes")
 
-            # Now receive the message content (exactly message_length bytes)
-            message_bytes = client_socket.recv(message_length)
             message = message_bytes.decode('utf-8')
 
             print(f"Received message: '{message}'")
 
             # Send acknowledgment
-            response = f"Message received: '{message}' (length: {message_length})"
+            response = make_response(message)
             client_socket.sendall(response.encode('utf-8'))
 
         except Exception as e:
@@ -35,5 +55,65 @@ def start_server(host='localhost', port=12345):
         finally:
             client_socket.close()
 
+def serve_session(client_socket, client_address, executor, header=U32):
+    """
+    One persistent multiplexed session. Every frame starts with a request ID;
+    requests run concurrently on `executor` and each reply is written as soon
+    as it is ready, tagged with the same ID, so a slow request does not hold
+    up fast ones behind it.
+    """
+    send_lock = threading.Lock()   # replies from different workers must not interleave
+    pending = set()
+
+    def handle(request_id, message):
+        try:
+            response = make_response(message, slow=True)
+        except Exception as e:
+            response = f"Error: {e}"
+        try:
+            with send_lock:
+                send_request(client_socket, request_id, response.encode('utf-8'), header)
+        except OSError:
+            pass  # client went away; the reader loop will notice
+
+    print(f"Session from {peer_name(client_address)}")
+    with client_socket:
+        try:
+            for payload in iter_frames(client_socket, FrameDecoder(header)):
+                request_id, body = split_request_id(payload)
+                message = str(body, 'utf-8')
+                pending.add(executor.submit(handle, request_id, message))
+                pending = {f for f in pending if not f.done()}
+        except (OSError, FrameError, UnicodeDecodeError) as e:
+            print(f"Session error from {peer_name(client_address)}: {e}")
+        # let requests that are still running answer before the socket closes
+        for f in pending:
+            f.result()
+    print(f"Session closed {peer_name(client_address)}")
+
+def start_mux_server(host='localhost', port=12345, header=U32, workers=32, uri=None):
+    uri = uri or tcp_uri(host, port)
+    server_socket = create_server(uri)
+    print(f"Multiplexing server listening on {uri}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            client_socket, client_address = server_socket.accept()
+            set_nodelay(client_socket)
+            threading.Thread(target=serve_session, args=(client_socket, client_address, executor, header),
+                             daemon=True).start()
+
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mux", action="store_true",
+                        help="persistent sessions with request IDs instead of one message per connection")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--uri", help="tcp://host:port or unix:///path (overrides --port)")
+    parser.add_argument("--header", choices=HEADERS,
+                        help="length prefix format: 3 ASCII digits (at most 999 bytes), 4 byte big-endian "
+                             "or varint (default: ascii3, u32 with --mux)")
+    args = parser.parse_args()
+    if args.mux:
+        start_mux_server(port=args.port, header=args.header or U32, uri=args.uri)
+    else:
+        start_server(port=args.port, header=args.header or ASCII3, uri=args.uri)
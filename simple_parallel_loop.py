@@ -1,6 +1,7 @@
-import multiprocessing as mp
 import time
 
+from worker_pools import process_pool
+
 def sum_squares(start, end):
     t0 = time.time()
     total = 0
@@ -18,8 +19,8 @@ if __name__ == '__main__':
     if n % num_processes != 0:
         ranges[-1] = (ranges[-1][0], n)
     
-    with mp.Pool(processes=num_processes) as pool:
-        results = pool.starmap(sum_squares, ranges)
+    with process_pool(num_processes) as pool:
+        results = list(pool.map(sum_squares, *zip(*ranges)))
     
     total_sum = sum(r[0] for r in results)
     print(f"Sum of squares from 0 to {n-1} is {total_sum}")
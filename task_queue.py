@@ -0,0 +1,284 @@
+"""task_queue.py
+
+Chunk leasing over TCP, so a dynamic schedule can use workers on other hosts.
+
+The coordinator owns the chunk list; workers connect, lease chunks, compute
+them and stream the results back. Messages are JSON objects in u32 frames:
+
+    worker -> coordinator                       coordinator -> worker
+    {"op": "hello", "worker": name}
+    {"op": "lease", "max": k}                   {"op": "tasks", "tasks": [[id, start, end], ...]}
+                                                {"op": "done"}            nothing left, disconnect
+    {"op": "ack", "ids": [...]}                 (no reply)
+    {"op": "result", "id": i, "value": v}       (no reply)
+    {"op": "error", "id": i, "error": text}     (no reply)
+
+A lease that is not acknowledged within `ack_timeout`, or whose result does
+not arrive within `lease_timeout` after the ack, is taken back and put at the
+front of the queue, as is everything held by a worker that disconnects. The
+first result for a chunk wins; a late one from a worker whose lease was
+taken back is counted as a duplicate and dropped, so chunk functions should
+be idempotent (range sums are). So is a result for a chunk that has already
+failed max_attempts times.
+
+A "lease" request blocks on the coordinator until a chunk is free or all
+chunks are finished, so idle workers do not poll.
+"""
+
+import itertools
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+
+from framing import U32, FrameDecoder, FrameError, encode_frame, iter_frames, recv_frame
+from transport import connect, create_server, peer_name, set_nodelay
+
+
+class TaskFailed(RuntimeError):
+    """A chunk failed on every attempt."""
+
+
+def _send(sock, message):
+    sock.sendall(encode_frame(json.dumps(message).encode(), U32))
+
+
+class _Lease:
+    __slots__ = ("lease_id", "worker", "leased_at", "acked_at")
+
+    def __init__(self, lease_id, worker, now):
+        self.lease_id = lease_id
+        self.worker = worker
+        self.leased_at = now
+        self.acked_at = 0.0
+
+
+class Coordinator:
+    """
+    Hands out `chunks` ((chunk_id, start, end) tuples) to workers connecting
+    on `uri`. results() yields (chunk_id, value, worker) as they arrive.
+    """
+
+    def __init__(self, chunks, uri, lease_timeout=30.0, ack_timeout=5.0, max_attempts=3):
+        self.chunks = {chunk_id: (start, end) for chunk_id, start, end in chunks}
+        self.lease_timeout = lease_timeout
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self.server = create_server(uri)
+        self.uri = uri
+        self._cond = threading.Condition()
+        self._pending = deque(chunk_id for chunk_id, _, _ in chunks)
+        self._leases = {}          # chunk_id -> _Lease
+        self._done = set()
+        self._attempts = {}
+        self.failed = {}           # chunk_id -> last error
+        self._lease_ids = 0
+        self._results = queue.Queue()
+        self._closed = False
+        self._connections = itertools.count(1)
+        self.counters = {
+            "leased": 0, "acked": 0, "completed": 0, "duplicates": 0, "errors": 0,
+            "requeued_unacked": 0, "requeued_expired": 0, "requeued_disconnect": 0,
+            "workers_seen": 0,
+        }
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._reaper, daemon=True).start()
+
+    # -- bookkeeping, all under self._cond -------------------------------
+
+    def _finished(self):
+        return len(self._done) + len(self.failed) >= len(self.chunks)
+
+    def _requeue(self, chunk_id, counter=None):
+        del self._leases[chunk_id]
+        self._pending.appendleft(chunk_id)   # retried chunks go first
+        if counter is not None:
+            self.counters[counter] += 1
+        self._cond.notify_all()
+
+    def _lease(self, worker, k):
+        """Block until chunks are free (returns them) or everything is finished (returns [])."""
+        with self._cond:
+            while not self._pending and not self._finished() and not self._closed:
+                self._cond.wait(0.5)
+            tasks = []
+            now = time.monotonic()
+            while self._pending and len(tasks) < k:
+                chunk_id = self._pending.popleft()
+                if chunk_id in self._done or chunk_id in self.failed:
+                    continue
+                self._lease_ids += 1
+                self._leases[chunk_id] = _Lease(self._lease_ids, worker, now)
+                self.counters["leased"] += 1
+                tasks.append([chunk_id, *self.chunks[chunk_id]])
+            return tasks
+
+    def _ack(self, worker, ids):
+        now = time.monotonic()
+        with self._cond:
+            for chunk_id in ids:
+                lease = self._leases.get(chunk_id)
+                if lease is not None and lease.worker == worker and not lease.acked_at:
+                    lease.acked_at = now
+                    self.counters["acked"] += 1
+
+    def _complete(self, worker, chunk_id, value):
+        with self._cond:
+            # a chunk that already failed has been reported (value None); a late
+            # success from an expired lease would report it a second time
+            if chunk_id in self._done or chunk_id in self.failed or chunk_id not in self.chunks:
+                self.counters["duplicates"] += 1
+                return
+            self._done.add(chunk_id)
+            self._leases.pop(chunk_id, None)
+            try:
+                self._pending.remove(chunk_id)   # it may have been requeued meanwhile
+            except ValueError:
+                pass
+            self.counters["completed"] += 1
+            self._cond.notify_all()
+        self._results.put((chunk_id, value, worker))
+
+    def _fail(self, worker, chunk_id, error):
+        with self._cond:
+            lease = self._leases.get(chunk_id)
+            if lease is None or lease.worker != worker:
+                return
+            self.counters["errors"] += 1
+            self._attempts[chunk_id] = self._attempts.get(chunk_id, 0) + 1
+            if self._attempts[chunk_id] >= self.max_attempts:
+                del self._leases[chunk_id]
+                self.failed[chunk_id] = error
+                self._cond.notify_all()
+                self._results.put((chunk_id, None, worker))
+            else:
+                self._requeue(chunk_id)
+
+    def _release_worker(self, worker):
+        with self._cond:
+            for chunk_id in [c for c, lease in self._leases.items() if lease.worker == worker]:
+                self._requeue(chunk_id, "requeued_disconnect")
+
+    def _reaper(self):
+        tick = max(0.01, min(self.ack_timeout, self.lease_timeout) / 4)
+        while not self._closed:
+            time.sleep(tick)
+            now = time.monotonic()
+            with self._cond:
+                for chunk_id, lease in list(self._leases.items()):
+                    if not lease.acked_at:
+                        if now - lease.leased_at >= self.ack_timeout:
+                            self._requeue(chunk_id, "requeued_unacked")
+                    elif now - lease.acked_at >= self.lease_timeout:
+                        self._requeue(chunk_id, "requeued_expired")
+
+    # -- network -----------------------------------------------------------
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, addr = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_worker, args=(conn, addr), daemon=True).start()
+
+    def _serve_worker(self, conn, addr):
+        # a per-connection number keeps two workers from the same host (or Unix socket) apart
+        number = next(self._connections)
+        worker = f"#{number}@{peer_name(addr)}"
+        set_nodelay(conn)
+        with conn:
+            try:
+                for payload in iter_frames(conn, FrameDecoder(U32)):
+                    message = json.loads(bytes(payload))
+                    op = message.get("op")
+                    if op == "hello":
+                        worker = f"{message.get('worker', 'worker')}#{number}@{peer_name(addr)}"
+                        with self._cond:
+                            self.counters["workers_seen"] += 1
+                    elif op == "lease":
+                        tasks = self._lease(worker, max(1, int(message.get("max", 1))))
+                        _send(conn, {"op": "tasks", "tasks": tasks} if tasks else {"op": "done"})
+                        if not tasks:
+                            break
+                    elif op == "ack":
+                        self._ack(worker, message["ids"])
+                    elif op == "result":
+                        self._complete(worker, message["id"], message["value"])
+                    elif op == "error":
+                        self._fail(worker, message["id"], message.get("error", "unknown error"))
+                    else:
+                        raise ValueError(f"unknown op {op!r}")
+            except (OSError, FrameError, ValueError, KeyError) as e:
+                print(f"[coordinator] worker {worker}: {e}")
+            finally:
+                self._release_worker(worker)
+
+    # -- public --------------------------------------------------------------
+
+    def results(self):
+        """Yield (chunk_id, value, worker) for every chunk as it finishes (value None if it failed)."""
+        remaining = len(self.chunks)
+        while remaining:
+            yield self._results.get()
+            remaining -= 1
+
+    def wait(self):
+        """Collect all results into {chunk_id: value}; raises TaskFailed if any chunk failed."""
+        values = {chunk_id: value for chunk_id, value, _ in self.results()}
+        if self.failed:
+            raise TaskFailed(f"{len(self.failed)} chunk(s) failed: {self.failed}")
+        return values
+
+    def stats(self):
+        with self._cond:
+            return {**self.counters, "pending": len(self._pending), "leased_now": len(self._leases)}
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_worker(uri, handler, name=None, batch=1, timeout=None):
+    """
+    Lease chunks from the coordinator at `uri` until it says done.
+    handler(chunk_id, start, end) returns a JSON-serialisable value.
+    Returns the number of chunks this worker completed.
+    """
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    sock = connect(uri, timeout=timeout)
+    decoder = FrameDecoder(U32)
+    completed = 0
+    with sock:
+        _send(sock, {"op": "hello", "worker": name})
+        while True:
+            _send(sock, {"op": "lease", "max": batch})
+            reply = recv_frame(sock, decoder)
+            if reply is None:
+                break
+            message = json.loads(reply)
+            if message["op"] == "done":
+                break
+            tasks = message["tasks"]
+            _send(sock, {"op": "ack", "ids": [chunk_id for chunk_id, _, _ in tasks]})
+            for chunk_id, start, end in tasks:
+                try:
+                    value = handler(chunk_id, start, end)
+                except Exception as e:
+                    _send(sock, {"op": "error", "id": chunk_id, "error": f"{type(e).__name__}: {e}"})
+                    continue
+                # streamed: the coordinator sees each result as soon as it exists
+                _send(sock, {"op": "result", "id": chunk_id, "value": value})
+                completed += 1
+    return completed
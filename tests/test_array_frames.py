@@ -0,0 +1,177 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from array_frames import (MAGIC, PREFIX, VERSION, DotClient, _serve_dot_connection, pack_header, recv_array,
+                          send_array, send_arrays)
+from transport import create_server, tcp_uri
+
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    with a, b:
+        yield a, b
+
+
+def send_in_background(sock, arrays):
+    # arrays bigger than the socket buffers need a reader on the other end
+    sender = threading.Thread(target=send_arrays, args=(sock, arrays))
+    sender.start()
+    return sender
+
+
+def frame_with(arr, dtype=None, nbytes=None, magic=MAGIC, version=VERSION):
+    """A frame for `arr` whose header fields can be doctored."""
+    header = pack_header(arr)
+    dtype_len = PREFIX.unpack_from(header)[3]
+    descr = header[PREFIX.size:PREFIX.size + dtype_len] if dtype is None else dtype
+    rest = header[PREFIX.size + dtype_len:]
+    prefix = PREFIX.pack(magic, version, arr.ndim, len(descr), arr.nbytes if nbytes is None else nbytes)
+    return prefix + descr + rest + arr.tobytes(order="A")
+
+
+ARRAYS = [
+    np.arange(24, dtype=np.float64).reshape(2, 3, 4),
+    np.arange(10, dtype=">i4"),
+    np.zeros((0, 5), dtype=np.int16),
+    np.array(3.5),
+    np.array([(1, 2.0), (3, 4.0)], dtype=[("id", "<u2"), ("x", "<f4")]),
+    np.array([True, False]),
+]
+
+
+@pytest.mark.parametrize("arr", ARRAYS, ids=lambda a: f"{a.dtype}{a.shape}")
+def test_round_trip(pair, arr):
+    send_array(pair[0], arr)
+    got = recv_array(pair[1])
+    assert got.dtype == arr.dtype and got.shape == arr.shape
+    np.testing.assert_array_equal(got, arr)
+
+
+def test_fortran_order_arrives_fortran_ordered(pair):
+    arr = np.asfortranarray(np.arange(12.0).reshape(3, 4))
+    send_array(pair[0], arr)
+    got = recv_array(pair[1])
+    assert got.flags.f_contiguous and not got.flags.c_contiguous
+    assert got.strides == arr.strides
+    np.testing.assert_array_equal(got, arr)
+
+
+def test_non_contiguous_array_is_sent_as_a_copy(pair):
+    arr = np.arange(40).reshape(4, 10)[:, ::3]
+    send_array(pair[0], arr)
+    got = recv_array(pair[1])
+    assert got.flags.c_contiguous
+    np.testing.assert_array_equal(got, arr)
+
+
+def test_several_arrays_in_one_call(pair):
+    a, b = np.ones((300, 300)), np.arange(7)
+    sender = send_in_background(pair[0], [a, b])
+    got_a, got_b = recv_array(pair[1]), recv_array(pair[1])
+    sender.join()
+    np.testing.assert_array_equal(got_a, a)
+    np.testing.assert_array_equal(got_b, b)
+
+
+def test_receive_into_row_blocks_of_a_bigger_array(pair):
+    blocks = [np.full((2, 5), i, dtype=np.int32) for i in range(3)]
+    out = np.empty((6, 5), dtype=np.int32)
+    send_arrays(pair[0], blocks)
+    for i in range(3):
+        assert recv_array(pair[1], out=out[2 * i:2 * i + 2]) is not None
+    np.testing.assert_array_equal(out, np.repeat(np.arange(3), 2)[:, None].repeat(5, axis=1))
+
+
+def test_receive_into_a_fortran_out(pair):
+    arr = np.asfortranarray(np.arange(6.0).reshape(2, 3))
+    out = np.empty((2, 3), order="F")
+    send_array(pair[0], arr)
+    assert recv_array(pair[1], out=out) is out
+    np.testing.assert_array_equal(out, arr)
+
+
+@pytest.mark.parametrize("out", [np.empty((3, 4), dtype=np.float32), np.empty((4, 3)), np.empty((3, 4), order="F"),
+                                 np.empty((3, 8))[:, ::2]],
+                         ids=["dtype", "shape", "order", "strided"])
+def test_out_that_does_not_match_is_rejected(pair, out):
+    send_array(pair[0], np.zeros((3, 4)))
+    with pytest.raises(ValueError):
+        recv_array(pair[1], out=out)
+
+
+def test_read_only_out_is_rejected(pair):
+    out = np.empty(4)
+    out.flags.writeable = False
+    send_array(pair[0], np.zeros(4))
+    with pytest.raises(ValueError):
+        recv_array(pair[1], out=out)
+
+
+def test_nbytes_that_disagree_with_out_are_rejected(pair):
+    pair[0].sendall(frame_with(np.zeros(4), nbytes=16))
+    with pytest.raises(ValueError):
+        recv_array(pair[1], out=np.empty(4))
+
+
+def test_shape_outside_the_data_is_rejected(pair):
+    pair[0].sendall(frame_with(np.zeros(4), nbytes=16))
+    with pytest.raises(ValueError):
+        recv_array(pair[1])
+
+
+@pytest.mark.parametrize("fields", [dict(magic=b"NPY!"), dict(version=VERSION + 1), dict(nbytes=1 << 40),
+                                    dict(dtype=b"'<f8"), dict(dtype=b"__import__('os')"), dict(dtype=b"'|O'"),
+                                    dict(dtype=b"'\xff'")],
+                         ids=["magic", "version", "too big", "syntax", "code", "object", "not ascii"])
+def test_bad_header_is_rejected(pair, fields):
+    pair[0].sendall(frame_with(np.zeros(4), **fields))
+    with pytest.raises(ValueError):
+        recv_array(pair[1])
+
+
+def test_object_arrays_are_not_sent(pair):
+    with pytest.raises(TypeError):
+        send_array(pair[0], np.array([object()]))
+
+
+def test_eof(pair):
+    pair[0].close()
+    assert recv_array(pair[1]) is None
+
+
+def test_eof_mid_array(pair):
+    frame = frame_with(np.arange(10.0))
+    pair[0].sendall(frame[:-8])
+    pair[0].shutdown(socket.SHUT_WR)
+    with pytest.raises(ConnectionError):
+        recv_array(pair[1])
+
+
+def test_eof_mid_header(pair):
+    pair[0].sendall(PREFIX.pack(MAGIC, VERSION, 2, 6, 0))
+    pair[0].shutdown(socket.SHUT_WR)
+    with pytest.raises(ConnectionError):
+        recv_array(pair[1])
+
+
+def test_dot_worker():
+    listener = create_server("tcp://127.0.0.1:0")
+    uri = tcp_uri(*listener.getsockname()[:2])
+
+    def serve():
+        conn, addr = listener.accept()
+        _serve_dot_connection(conn, addr)
+
+    worker = threading.Thread(target=serve, daemon=True)
+    worker.start()
+    A, B = np.arange(6.0).reshape(2, 3), np.arange(12.0).reshape(3, 4)
+    out = np.empty((2, 4))
+    with listener, DotClient(uri, timeout=5) as client:
+        np.testing.assert_array_equal(client.dot(A, B), A @ B)
+        assert client.dot(A, B, out=out) is out
+    worker.join(timeout=5)
+    np.testing.assert_array_equal(out, A @ B)
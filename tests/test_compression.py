@@ -0,0 +1,160 @@
+import os
+import socket
+import threading
+
+import pytest
+
+import server
+from compression import (COMPRESSED, FLAG_COMPRESSED, FLAG_RAW, LZMA, METHODS, NONE, RAW, ZLIB,
+                         CompressionError, FrameCodec, accepted, choose, is_negotiation, negotiate, offer)
+from framing import ASCII3, U32, FrameDecoder, encode_frame, recv_frame
+
+# compressible, but not so repetitive that a single frame says everything
+MESSAGES = [b"".join(b"reading %d of sensor %d is ok\n" % (i, j) for i in range(60)) for j in range(5)]
+
+
+def wire(buffers):
+    return b"".join(bytes(b) for b in buffers)
+
+
+def echo(decoder, session, *payloads):
+    decoder.feed(b"".join(encode_frame(p, decoder.header) for p in payloads))
+    buffers, frames = server.echo_replies(decoder, encode_frame(server.GREETING, decoder.header),
+                                          session=session)
+    assert frames == len(payloads)
+    replies = FrameDecoder(decoder.header)
+    replies.feed(wire(buffers))
+    return [bytes(p) for p in replies.frames()]
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_pipelined_frames_round_trip(method):
+    sender, receiver = FrameCodec(method), FrameCodec(method)
+    encoded = [wire(sender.encode(m)) for m in MESSAGES]
+    assert all(e[0] == FLAG_COMPRESSED for e in encoded)
+    assert [bytes(receiver.decode(e)) for e in encoded] == MESSAGES
+    assert sender.ratio() > 1
+
+
+def test_zlib_frames_share_one_stream():
+    codec = FrameCodec(ZLIB)
+    first, second = (wire(codec.encode(MESSAGES[0])) for _ in range(2))
+    # the repeat is mostly back references into the first frame
+    assert len(second) < len(first) / 2
+    fresh = FrameCodec(ZLIB)
+    with pytest.raises(CompressionError):
+        fresh.decode(second)
+    receiver = FrameCodec(ZLIB)
+    assert bytes(receiver.decode(first)) == bytes(receiver.decode(second)) == MESSAGES[0]
+
+
+def test_zlib_stream_survives_raw_frames_in_between():
+    sender, receiver = FrameCodec(ZLIB, threshold=100), FrameCodec(ZLIB, threshold=100)
+    payloads = [MESSAGES[0], b"short", MESSAGES[1], b"", MESSAGES[0]]
+    encoded = [wire(sender.encode(p)) for p in payloads]
+    assert [e[0] for e in encoded] == [FLAG_COMPRESSED, FLAG_RAW, FLAG_COMPRESSED, FLAG_RAW, FLAG_COMPRESSED]
+    assert [bytes(receiver.decode(e)) for e in encoded] == payloads
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_below_the_threshold_goes_out_raw(method):
+    payload = MESSAGES[0]
+    codec = FrameCodec(method, threshold=len(payload))
+    assert codec.encode(payload[:-1]) == [RAW, payload[:-1]]
+    assert codec.encode(payload)[0] == COMPRESSED
+    assert codec.bytes_before == len(payload)
+
+
+def test_incompressible_lzma_frame_goes_out_raw():
+    codec = FrameCodec(LZMA, threshold=0)
+    noise = os.urandom(2000)
+    assert codec.encode(noise) == [RAW, noise]
+    assert codec.ratio() == 1.0
+
+
+def test_frame_buffers_carry_the_length_header():
+    codec = FrameCodec(ZLIB)
+    decoder = FrameDecoder(U32)
+    decoder.feed(wire(codec.frame_buffers(MESSAGES[0], U32)))
+    (payload,) = decoder.frames()
+    assert bytes(FrameCodec(ZLIB).decode(payload)) == MESSAGES[0]
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_inflating_past_max_size_is_rejected(method):
+    bomb = wire(FrameCodec(method).encode(b"\x00" * 100_000))
+    with pytest.raises(CompressionError):
+        FrameCodec(method, max_size=1000).decode(bomb)
+
+
+@pytest.mark.parametrize("frame", [b"", b"\x07abc", b"\x01not deflate"])
+def test_bad_frames_are_rejected(frame):
+    with pytest.raises(CompressionError):
+        FrameCodec(ZLIB).decode(frame)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        FrameCodec("brotli")
+
+
+def test_choose_takes_the_first_supported_offer():
+    assert choose(offer(["brotli", LZMA, ZLIB])) == (b"\x00COMPRESS lzma", LZMA)
+    assert choose(offer([ZLIB, LZMA]), supported=(LZMA,))[1] == LZMA
+    reply, method = choose(offer(["brotli"]))
+    assert method == NONE and accepted(reply) == NONE
+
+
+def test_negotiation_payloads():
+    assert is_negotiation(offer())
+    assert not is_negotiation(b"\x00COMPRESS")
+    assert not is_negotiation(b"COMPRESS zlib")
+    with pytest.raises(CompressionError):
+        accepted(b"hello")
+    with pytest.raises(CompressionError):
+        accepted(b"\x00COMPRESS brotli")
+
+
+def test_negotiate_over_a_socket():
+    a, b = socket.socketpair()
+    with a, b:
+        def answer():
+            decoder = FrameDecoder(ASCII3)
+            reply, _ = choose(recv_frame(b, decoder), supported=(LZMA,))
+            b.sendall(encode_frame(reply, ASCII3))
+
+        peer = threading.Thread(target=answer)
+        peer.start()
+        codec = negotiate(a, threshold=10)
+        peer.join()
+    assert codec.method == LZMA and codec.threshold == 10
+
+
+def test_server_echoes_through_the_negotiated_codec():
+    decoder = FrameDecoder(U32)
+    session = server.Session()
+    replies = echo(decoder, session, offer([ZLIB]))
+    assert replies == [b"\x00COMPRESS zlib"]
+    assert session.codec.method == ZLIB
+    client, inbound = FrameCodec(ZLIB), FrameCodec(ZLIB)
+    frames = [wire(client.encode(p)) for p in [MESSAGES[0], b"hello", MESSAGES[1], MESSAGES[0]]]
+    replies = echo(decoder, session, *frames)
+    # raw frames are echoed as they came, flag byte and all
+    assert replies[1] == RAW + server.GREETING
+    assert [bytes(inbound.decode(r)) for r in replies] == [MESSAGES[0], server.GREETING, MESSAGES[1], MESSAGES[0]]
+
+
+def test_server_without_a_common_codec_stays_plain():
+    decoder = FrameDecoder(U32)
+    session = server.Session()
+    assert echo(decoder, session, offer(["brotli"])) == [b"\x00COMPRESS none"]
+    assert session.codec is None
+    assert echo(decoder, session, b"plain", b"hello") == [b"plain", server.GREETING]
+
+
+def test_server_with_compression_turned_off_declines(monkeypatch):
+    monkeypatch.setattr(server, "COMPRESSION", ())
+    decoder = FrameDecoder(U32)
+    session = server.Session()
+    assert echo(decoder, session, offer()) == [b"\x00COMPRESS none"]
+    assert session.codec is None
@@ -0,0 +1,166 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from connection_pool import ConnectionPool, PoolManager, PoolTimeout, is_healthy
+from framing import U32, FrameDecoder, encode_frame, recv_frame
+from transport import create_server, tcp_uri
+
+
+class EchoServer:
+    """Echoes U32 frames and keeps every accepted socket, so a test can close them from the server side."""
+
+    def __init__(self):
+        self.listener = create_server("tcp://127.0.0.1:0")
+        self.uri = tcp_uri(*self.listener.getsockname()[:2])
+        self.conns = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.conns.append(conn)
+            threading.Thread(target=self._echo, args=(conn,), daemon=True).start()
+
+    def _echo(self, conn):
+        decoder = FrameDecoder(U32)
+        try:
+            while (payload := recv_frame(conn, decoder)) is not None:
+                conn.sendall(encode_frame(payload, U32))
+        except OSError:
+            pass
+
+    def drop_connections(self):
+        while self.conns:
+            conn = self.conns.pop()
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass   # the client hung up first
+            conn.close()
+
+    def close(self):
+        self.listener.close()
+        self.drop_connections()
+
+
+@pytest.fixture
+def echo_server():
+    server = EchoServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def dead_uri():
+    # a port nobody listens on: bound once, then released
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return tcp_uri(*sock.getsockname()[:2])
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_connections_are_reused(echo_server):
+    with ConnectionPool(uri=echo_server.uri, header=U32, max_size=2) as pool:
+        assert pool.request(b"one") == b"one"
+        assert pool.request_batch([b"two", b"three"]) == [b"two", b"three"]
+        stats = pool.stats()
+    assert (stats["created"], stats["reused"], stats["open"], stats["idle"]) == (1, 1, 1, 1)
+
+
+def test_connection_closed_by_the_server_is_not_handed_out(echo_server):
+    with ConnectionPool(uri=echo_server.uri, header=U32, max_size=1) as pool:
+        pool.request(b"warm")
+        (client, _), = pool._idle
+        echo_server.drop_connections()
+        wait_until(lambda: not is_healthy(client))
+        assert pool.request(b"again") == b"again"
+        stats = pool.stats()
+    assert stats["health_check_failures"] == 1
+    assert stats["created"] == 2 and stats["open"] == 1
+
+
+def test_connection_with_a_stray_reply_is_not_handed_out(echo_server):
+    with ConnectionPool(uri=echo_server.uri, header=U32, max_size=1) as pool:
+        with pool.connection() as client:
+            client.sock.sendall(encode_frame(b"never read", U32))
+        wait_until(lambda: not is_healthy(client))
+        with pool.connection() as fresh:
+            assert fresh is not client
+        assert pool.stats()["health_check_failures"] == 1
+
+
+def test_failed_connect_frees_its_slot(dead_uri):
+    with ConnectionPool(uri=dead_uri, header=U32, max_size=1, checkout_timeout=0.2) as pool:
+        for _ in range(3):
+            # a leaked slot would turn the second attempt into a PoolTimeout
+            with pytest.raises(ConnectionRefusedError):
+                pool.acquire()
+        stats = pool.stats()
+    assert (stats["open"], stats["connect_errors"], stats["checkout_timeouts"]) == (0, 3, 0)
+
+
+def test_maintain_gives_back_slots_it_could_not_fill(dead_uri):
+    with ConnectionPool(uri=dead_uri, header=U32, max_size=3, min_idle=2) as pool:
+        pool.maintain()
+        stats = pool.stats()
+    assert (stats["open"], stats["idle"], stats["connect_errors"]) == (0, 0, 2)
+
+
+def test_maintain_keeps_min_idle_warm_and_evicts_the_rest(echo_server):
+    with ConnectionPool(uri=echo_server.uri, header=U32, max_size=4, min_idle=2, max_idle_time=0.05) as pool:
+        pool.maintain()
+        assert pool.stats()["idle"] == 2
+        clients = [pool.acquire() for _ in range(4)]
+        for client in clients:
+            pool.release(client)
+        time.sleep(0.1)
+        pool.maintain()
+        stats = pool.stats()
+    assert (stats["idle"], stats["open"], stats["evicted_idle"]) == (2, 2, 2)
+
+
+def test_exhausted_pool_waits_then_times_out(echo_server):
+    with ConnectionPool(uri=echo_server.uri, header=U32, max_size=1, checkout_timeout=0.1) as pool:
+        held = pool.acquire()
+        with pytest.raises(PoolTimeout):
+            pool.acquire()
+        threading.Timer(0.05, pool.release, args=(held,)).start()
+        assert pool.acquire(timeout=5) is held
+        assert pool.stats()["checkout_timeouts"] == 1
+
+
+def test_connection_is_discarded_when_the_caller_fails(echo_server):
+    with ConnectionPool(uri=echo_server.uri, header=U32, max_size=1) as pool:
+        with pytest.raises(RuntimeError):
+            with pool.connection():
+                raise RuntimeError("caller bug")
+        stats = pool.stats()
+    assert (stats["open"], stats["closed"]) == (0, 1)
+
+
+def test_min_idle_above_max_size():
+    with pytest.raises(ValueError):
+        ConnectionPool(max_size=1, min_idle=2)
+
+
+def test_manager_keeps_one_pool_per_uri(echo_server, dead_uri):
+    manager = PoolManager(header=U32, max_size=1)
+    try:
+        assert manager.pool(echo_server.uri) is manager.pool(echo_server.uri)
+        assert manager.pool(dead_uri) is not manager.pool(echo_server.uri)
+        assert manager.request(b"ping", echo_server.uri) == b"ping"
+        assert sorted(s["uri"] for s in manager.stats()) == sorted([echo_server.uri, dead_uri])
+    finally:
+        manager.close()
@@ -0,0 +1,156 @@
+import socket
+import threading
+
+import pytest
+
+from framing import (ASCII3, HEADERS, MAX_ASCII3, U32, VARINT, FrameDecoder, FrameError, encode_frame,
+                     encode_header, recv_frame, send_frames, send_request, split_request_id)
+
+PAYLOADS = [b"", b"a", b"hello", bytes(range(256)) * 3, b"x" * 999]
+
+
+def decode_all(decoder):
+    return [bytes(p) for p in decoder.frames()]
+
+
+@pytest.mark.parametrize("header", HEADERS)
+def test_pipelined_frames_in_one_read(header):
+    decoder = FrameDecoder(header)
+    decoder.feed(b"".join(encode_frame(p, header) for p in PAYLOADS))
+    assert decode_all(decoder) == PAYLOADS
+    assert decoder.pending == 0
+
+
+@pytest.mark.parametrize("header", HEADERS)
+def test_frames_split_at_every_byte(header):
+    stream = b"".join(encode_frame(p, header) for p in PAYLOADS)
+    decoder = FrameDecoder(header, buffer_size=16)
+    got = []
+    for i in range(len(stream)):
+        decoder.feed(stream[i:i + 1])
+        got += decode_all(decoder)
+    assert got == PAYLOADS
+    assert decoder.pending == 0
+
+
+@pytest.mark.parametrize("header", HEADERS)
+def test_partial_frame_waits_for_the_rest(header):
+    frame = encode_frame(b"0123456789", header)
+    hlen = len(encode_header(10, header))
+    decoder = FrameDecoder(header)
+    decoder.feed(frame[:hlen + 4])
+    assert decode_all(decoder) == []
+    assert decoder.pending == hlen + 4
+    decoder.feed(frame[hlen + 4:])
+    assert decode_all(decoder) == [b"0123456789"]
+
+
+@pytest.mark.parametrize("header", HEADERS)
+def test_partial_header(header):
+    decoder = FrameDecoder(header)
+    frame = encode_frame(b"y" * 300, header)
+    decoder.feed(frame[:1])
+    assert decode_all(decoder) == []
+    decoder.feed(frame[1:])
+    assert decode_all(decoder) == [b"y" * 300]
+
+
+@pytest.mark.parametrize("header", [U32, VARINT])
+def test_frame_larger_than_the_buffer(header):
+    payload = bytes(range(256)) * 1000
+    decoder = FrameDecoder(header, buffer_size=64)
+    stream = encode_frame(payload, header) + encode_frame(b"after", header)
+    for i in range(0, len(stream), 1000):
+        decoder.feed(stream[i:i + 1000])
+    assert decode_all(decoder) == [payload, b"after"]
+
+
+@pytest.mark.parametrize("header", HEADERS)
+def test_oversize_frame_is_rejected(header):
+    decoder = FrameDecoder(header, max_frame=100)
+    decoder.feed(encode_header(101, header))
+    with pytest.raises(FrameError):
+        decode_all(decoder)
+
+
+@pytest.mark.parametrize("header", HEADERS)
+def test_frame_at_the_limit_is_accepted(header):
+    decoder = FrameDecoder(header, max_frame=100)
+    decoder.feed(encode_frame(b"z" * 100, header))
+    assert decode_all(decoder) == [b"z" * 100]
+
+
+def test_ascii3_header_limit():
+    assert encode_header(MAX_ASCII3, ASCII3) == b"999"
+    with pytest.raises(ValueError):
+        encode_header(MAX_ASCII3 + 1, ASCII3)
+
+
+def test_bad_ascii3_prefix():
+    decoder = FrameDecoder(ASCII3)
+    decoder.feed(b"1x3abc")
+    with pytest.raises(FrameError):
+        decode_all(decoder)
+
+
+def test_varint_prefix_too_long():
+    decoder = FrameDecoder(VARINT)
+    decoder.feed(b"\x80" * 10)
+    with pytest.raises(FrameError):
+        decode_all(decoder)
+
+
+@pytest.mark.parametrize("length", [0, 1, 127, 128, 300, 16383, 16384, 2 ** 32])
+def test_varint_lengths(length):
+    header = encode_header(length, VARINT)
+    assert len(header) == max(1, (length.bit_length() + 6) // 7)
+    decoder = FrameDecoder(VARINT, max_frame=2 ** 33)
+    decoder.feed(header)
+    spans = decoder.frame_spans()
+    if length == 0:
+        assert next(spans) == (0, 1, 1)
+    else:
+        assert list(spans) == []
+        assert decoder.pending == len(header)
+
+
+def test_unknown_header():
+    with pytest.raises(ValueError):
+        FrameDecoder("u64")
+    with pytest.raises(ValueError):
+        encode_header(1, "u64")
+
+
+@pytest.mark.parametrize("header", HEADERS)
+def test_recv_frame_over_a_socket(header):
+    a, b = socket.socketpair()
+    with a, b:
+        stream = b"".join(encode_frame(p, header) for p in PAYLOADS[:4])
+
+        def send_slowly():
+            for i in range(0, len(stream), 7):
+                a.sendall(stream[i:i + 7])
+            a.shutdown(socket.SHUT_WR)
+
+        sender = threading.Thread(target=send_slowly)
+        sender.start()
+        decoder = FrameDecoder(header, buffer_size=32)
+        got = []
+        while (payload := recv_frame(b, decoder)) is not None:
+            got.append(payload)
+        sender.join()
+    assert got == PAYLOADS[:4]
+
+
+def test_send_frames_and_request_ids():
+    a, b = socket.socketpair()
+    with a, b:
+        send_frames(a, [b"one", b"two"], U32)
+        send_request(a, 7, b"body", U32)
+        decoder = FrameDecoder(U32)
+        assert recv_frame(b, decoder) == b"one"
+        assert recv_frame(b, decoder) == b"two"
+        request_id, body = split_request_id(recv_frame(b, decoder))
+    assert (request_id, bytes(body)) == (7, b"body")
+    with pytest.raises(FrameError):
+        split_request_id(b"abc")
@@ -0,0 +1,147 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+
+import pytest
+
+from loop_schedule import AUTO, DYNAMIC, GUIDED, LoopCounter, StealingRanges, static_chunks
+
+SIZES = [0, 1, 7, 100, 1001]
+
+
+def slow(i):
+    # irregular costs, so workers fall out of step and steals actually happen
+    if i % 17 == 0:
+        time.sleep(0.0005)
+
+
+def counter_worker(counter, schedule, chunk, workers, out):
+    for chunk_id, iterations in counter.chunks(schedule, chunk, workers):
+        for i in iterations:
+            slow(i)
+        out.put((chunk_id, iterations.start, iterations.stop))
+    out.put(None)
+
+
+def stealing_worker(ranges, worker, chunk, out):
+    for chunk_id, iterations in ranges.chunks(worker, chunk):
+        for i in iterations:
+            slow(i)
+        out.put((chunk_id, iterations.start, iterations.stop))
+    out.put(None)
+
+
+def collect(out, workers):
+    claims = []
+    done = 0
+    while done < workers:
+        claim = out.get(timeout=30)
+        if claim is None:
+            done += 1
+        else:
+            claims.append(claim)
+    return claims
+
+
+def assert_exact_cover(claims, n):
+    iterations = [i for _, start, stop in claims for i in range(start, stop)]
+    assert sorted(iterations) == list(range(n))
+    assert all(stop > start for _, start, stop in claims)
+    ids = [chunk_id for chunk_id, _, _ in claims]
+    assert len(set(ids)) == len(ids)
+
+
+def run_threads(target, args_for, workers):
+    out = queue.Queue()
+    threads = [threading.Thread(target=target, args=(*args_for(w), out)) for w in range(workers)]
+    for t in threads:
+        t.start()
+    claims = collect(out, workers)
+    for t in threads:
+        t.join()
+    return claims
+
+
+def run_processes(target, args_for, workers):
+    ctx = mp.get_context()
+    out = ctx.Queue()
+    procs = [ctx.Process(target=target, args=(*args_for(w), out)) for w in range(workers)]
+    for p in procs:
+        p.start()
+    claims = collect(out, workers)
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+    return claims
+
+
+@pytest.mark.parametrize("n", SIZES)
+@pytest.mark.parametrize("chunk", [None, 1, 3, 64])
+@pytest.mark.parametrize("workers", [1, 3, 8])
+def test_static_chunks_cover_once(n, chunk, workers):
+    claims = [(chunk_id, r.start, r.stop)
+              for w in range(workers) for chunk_id, r in static_chunks(n, chunk, workers, w)]
+    assert_exact_cover(claims, n)
+
+
+@pytest.mark.parametrize("n", SIZES)
+@pytest.mark.parametrize("schedule,chunk", [(DYNAMIC, 1), (DYNAMIC, 5), (GUIDED, 1), (GUIDED, 4), (AUTO, 1)])
+def test_counter_covers_once_under_threads(n, schedule, chunk):
+    counter = LoopCounter(n, shared=False)
+    claims = run_threads(counter_worker, lambda w: (counter, schedule, chunk, 4), 4)
+    assert_exact_cover(claims, n)
+    assert [chunk_id for chunk_id, _, _ in sorted(claims, key=lambda c: c[1])] == list(range(len(claims)))
+
+
+@pytest.mark.parametrize("schedule,chunk", [(DYNAMIC, 3), (GUIDED, 2), (AUTO, 1)])
+def test_counter_covers_once_under_processes(schedule, chunk):
+    counter = LoopCounter(1001)
+    claims = run_processes(counter_worker, lambda w: (counter, schedule, chunk, 3), 3)
+    assert_exact_cover(claims, 1001)
+
+
+def test_guided_chunks_shrink():
+    counter = LoopCounter(1000, shared=False)
+    sizes = [len(r) for _, r in counter.chunks(GUIDED, 10, 4)]
+    assert sizes[0] == 250
+    assert sizes == sorted(sizes, reverse=True)
+    assert min(sizes[:-1]) >= 10
+
+
+def test_counter_reset_and_attach():
+    counter = LoopCounter(10)
+    assert [len(r) for _, r in counter.chunks(DYNAMIC, 4, 2)] == [4, 4, 2]
+    assert counter.claim_dynamic(4) is None
+    counter.reset()
+    attached = LoopCounter.attach(10, counter._state, counter._lock)
+    assert attached.claim_dynamic(6) == (0, range(0, 6))
+    assert counter.claim_dynamic(6) == (1, range(6, 10))
+
+
+def test_unknown_on_demand_schedule():
+    with pytest.raises(ValueError):
+        list(LoopCounter(10, shared=False).chunks("static", 1, 2))
+
+
+@pytest.mark.parametrize("n", SIZES)
+@pytest.mark.parametrize("chunk", [1, 4])
+@pytest.mark.parametrize("workers", [1, 2, 5])
+def test_stealing_covers_once_under_threads(n, chunk, workers):
+    ranges = StealingRanges(n, workers, shared=False)
+    claims = run_threads(stealing_worker, lambda w: (ranges, w, chunk), workers)
+    assert_exact_cover(claims, n)
+
+
+def test_stealing_covers_once_under_processes():
+    ranges = StealingRanges(1001, 3)
+    claims = run_processes(stealing_worker, lambda w: (ranges, w, 4), 3)
+    assert_exact_cover(claims, 1001)
+
+
+def test_idle_worker_steals_the_back_half():
+    ranges = StealingRanges(100, 2, shared=False)
+    # worker 0 never starts, so worker 1 halves its block down to the last iteration
+    claims = [(r.start, r.stop) for _, r in ranges.chunks(1, 50)]
+    assert claims == [(50, 100), (25, 50), (12, 25), (6, 12), (3, 6), (1, 3), (0, 1)]
+    assert list(ranges.chunks(0, 50)) == []
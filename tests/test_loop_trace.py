@@ -0,0 +1,89 @@
+import json
+import pickle
+
+import pytest
+
+from loop_trace import Trace
+from parallel_loop import PROCESSES, SERIAL, THREADS, parallel_for, parallel_reduce, square
+
+
+@pytest.fixture
+def trace():
+    with Trace(2, capacity=4) as t:
+        yield t
+
+
+def fill(trace, worker, n, start=0):
+    for i in range(start, start + n):
+        trace.record(worker, chunk=i, iteration=i, t_start=1000 * i, t_end=1000 * i + 10 * (worker + 1))
+
+
+def test_records_come_back_in_start_order(trace):
+    fill(trace, 1, 2)
+    fill(trace, 0, 2, start=5)
+    assert [(r[2], r[4]) for r in trace.records()] == [(1, 0), (1, 1), (0, 5), (0, 6)]
+    assert trace.dropped() == 0
+
+
+def test_full_ring_keeps_the_latest_records(trace):
+    fill(trace, 0, 11)
+    fill(trace, 1, 3)
+    assert trace.dropped() == 7
+    assert [r[4] for r in trace.records() if r[2] == 0] == [7, 8, 9, 10]
+    assert [r[4] for r in trace.records() if r[2] == 1] == [0, 1, 2]
+    assert trace.stats()["records"] == 7 and trace.stats()["dropped"] == 7
+
+
+def test_stats(trace):
+    trace.record(0, 0, 0, 0, 4_000_000_000, count=10)
+    trace.record(1, 1, 10, 1_000_000_000, 2_000_000_000, count=10)
+    stats = trace.stats()
+    assert stats["makespan"] == 4.0
+    assert stats["busy"] == [4.0, 1.0]
+    assert stats["imbalance"] == 4.0 / 2.5
+
+
+def test_stats_of_an_empty_trace(trace):
+    assert trace.stats() == {"makespan": 0.0, "busy": [0.0, 0.0], "imbalance": 1.0, "records": 0, "dropped": 0}
+
+
+def test_pickled_trace_writes_the_same_rings(trace):
+    copy = pickle.loads(pickle.dumps(trace))
+    try:
+        assert (copy.workers, copy.capacity, copy.created) == (trace.workers, trace.capacity, trace.created)
+        fill(copy, 1, 5)
+    finally:
+        copy.close()
+    assert [r[4] for r in trace.records()] == [1, 2, 3, 4]
+    assert trace.dropped() == 1
+
+
+def test_chrome_export(trace, tmp_path):
+    trace.record(0, 3, 30, trace.created, trace.created + 2000, count=5)
+    trace.record(1, 4, 41, trace.created + 1000, trace.created + 1500)
+    path = tmp_path / "trace.json"
+    trace.to_chrome(path, name="demo")
+    events = json.loads(path.read_text())["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    assert [(e["name"], e["cat"], e["tid"], e["ts"], e["dur"]) for e in spans] == [
+        ("chunk 3", "chunk", 0, 0.0, 2.0), ("iteration 41", "iteration", 1, 1.0, 0.5)]
+    assert {e["args"]["name"] for e in events if e["ph"] == "M"} == {"worker 0", "worker 1", "demo"}
+
+
+@pytest.mark.parametrize("backend", [SERIAL, THREADS, PROCESSES])
+def test_loops_record_every_chunk(backend):
+    workers = 1 if backend == SERIAL else 2
+    with Trace(workers) as t:
+        total = parallel_reduce(range(100), square, schedule="dynamic", chunk=10, workers=workers,
+                                backend=backend, trace=t)
+        records = t.records()
+        assert t.backend == backend
+    assert total == sum(i * i for i in range(100))
+    assert sorted((r[4], r[5]) for r in records) == [(i, 10) for i in range(0, 100, 10)]
+    assert {r[2] for r in records} <= set(range(workers))
+
+
+def test_auto_backend_is_recorded():
+    with Trace(2) as t:
+        parallel_for(range(50), square, workers=2, backend="auto", trace=t)
+        assert t.backend in (SERIAL, THREADS, PROCESSES)
@@ -0,0 +1,172 @@
+import operator
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import parallel_loop
+from loop_trace import Trace
+from parallel_loop import (PROCESSES, SCHEDULES, SERIAL, STATIC, THREADS, Chunk, parallel_for, parallel_reduce,
+                           square)
+
+N = 500
+EXPECTED = sum(i * i for i in range(N))
+
+
+@pytest.mark.parametrize("schedule", SCHEDULES)
+@pytest.mark.parametrize("chunk", [0, -3])
+def test_chunk_below_one_is_rejected(schedule, chunk):
+    with pytest.raises(ValueError):
+        parallel_reduce(range(N), square, schedule=schedule, chunk=chunk, workers=2, backend=THREADS)
+
+
+@pytest.mark.parametrize("backend", [SERIAL, THREADS, PROCESSES])
+@pytest.mark.parametrize("schedule", SCHEDULES)
+def test_reduce_matches_serial(schedule, backend):
+    chunk = None if schedule == STATIC else 7
+    assert parallel_reduce(range(N), square, schedule=schedule, chunk=chunk, workers=3,
+                           backend=backend) == EXPECTED
+
+
+@pytest.mark.parametrize("schedule", SCHEDULES)
+def test_for_runs_every_iteration_once(schedule):
+    seen = []
+    parallel_for(range(N), seen.append, schedule=schedule, chunk=3, workers=4, backend=THREADS)
+    assert sorted(seen) == list(range(N))
+
+
+def test_reduce_of_an_empty_loop():
+    assert parallel_reduce(range(0), square, initial=0, workers=2, backend=THREADS) == 0
+    with pytest.raises(TypeError):
+        parallel_reduce(range(0), square, workers=2, backend=THREADS)
+
+
+def test_reduce_over_a_slice_with_another_op():
+    assert parallel_reduce(range(10, 20, 3), square, op=operator.mul, schedule="dynamic", chunk=1,
+                           workers=2, backend=THREADS) == 100 * 169 * 256 * 361
+
+
+@pytest.fixture
+def costs(monkeypatch):
+    """A fresh cost cache and four cores, so backend choices do not depend on the machine or earlier tests."""
+    fresh = {}
+    monkeypatch.setattr(parallel_loop, "_costs", fresh)
+    monkeypatch.setattr(parallel_loop.os, "cpu_count", lambda: 4)
+    monkeypatch.setattr(parallel_loop, "FREE_THREADED", False)
+    return fresh
+
+
+def seeded(costs, body, seconds, cpu, per_chunk=False):
+    costs[parallel_loop._body_signature(body, per_chunk)] = (seconds, cpu)
+
+
+def choose(body, n=100_000, op=operator.add, workers=4):
+    loop = parallel_loop._Loop(range(n), body, op, False, None)
+    backend, partial, done = parallel_loop._choose_backend(loop, workers)
+    assert (partial, done) == (parallel_loop._NOTHING, 0)   # a seeded cost runs no probe
+    return backend
+
+
+def test_estimate_under_the_gil(costs):
+    busy = parallel_loop.estimate(100_000, 1e-5, cpu=1.0, workers=4)
+    assert busy[PROCESSES] < busy[SERIAL] < busy[THREADS]
+    waiting = parallel_loop.estimate(100_000, 1e-5, cpu=0.0, workers=4)
+    assert waiting[THREADS] < waiting[PROCESSES] < waiting[SERIAL]
+    tiny = parallel_loop.estimate(10, 1e-7, cpu=1.0, workers=4)
+    assert min(tiny, key=tiny.get) == SERIAL
+
+
+def test_estimate_charges_processes_for_the_payload(costs):
+    light = parallel_loop.estimate(100_000, 1e-5, cpu=1.0, workers=4)
+    heavy = parallel_loop.estimate(100_000, 1e-5, cpu=1.0, workers=4, payload=10**9)
+    assert heavy[PROCESSES] > light[PROCESSES] + 4 * 10**9 / parallel_loop.PICKLE_BYTES_PER_SECOND - 1e-9
+    assert heavy[THREADS] == light[THREADS]
+
+
+def test_estimate_free_threaded(costs, monkeypatch):
+    monkeypatch.setattr(parallel_loop, "FREE_THREADED", True)
+    busy = parallel_loop.estimate(100_000, 1e-5, cpu=1.0, workers=4)
+    assert busy[THREADS] < busy[PROCESSES] < busy[SERIAL]
+
+
+def test_choice_follows_the_cost(costs):
+    seeded(costs, square, 1e-5, cpu=1.0)
+    assert choose(square) == PROCESSES
+    seeded(costs, square, 1e-5, cpu=0.0)
+    assert choose(square) == THREADS
+    seeded(costs, square, 1e-8, cpu=1.0)
+    assert choose(square) == SERIAL
+
+
+def test_parallel_for_never_chooses_processes(costs):
+    seeded(costs, square, 1e-5, cpu=1.0)
+    assert choose(square, op=None) == SERIAL
+    seeded(costs, square, 1e-5, cpu=0.0)
+    assert choose(square, op=None) == THREADS
+
+
+def test_unpicklable_body_never_chooses_processes(costs):
+    def local_square(i):
+        return i * i
+
+    seeded(costs, local_square, 1e-5, cpu=1.0)
+    assert choose(local_square) == SERIAL
+
+
+def test_one_worker_or_no_iterations_run_serially(costs):
+    assert choose(square, workers=1) == SERIAL
+    assert choose(square, n=0) == SERIAL
+    assert costs == {}
+
+
+def test_probe_runs_the_first_iterations_once(costs):
+    with Trace(2) as t:
+        assert parallel_reduce(range(N), square, workers=2, trace=t) == EXPECTED
+        probe = [(r[4], r[5]) for r in t.records() if r[3] == -1]
+    assert probe[0] == (0, 1)
+    assert all(size == 2 * prev for (_, prev), (_, size) in zip(probe[:-2], probe[1:-1]))
+    assert sum(size for _, size in probe) <= N // (8 * 2)
+    seconds, cpu = costs[parallel_loop._body_signature(square, False)]
+    assert seconds > 0 and 0 <= cpu <= 1
+
+
+def sleep_chunk(chunk):
+    time.sleep(0.002 * len(chunk.iterations))
+    return len(chunk.iterations)
+
+
+def test_first_chunk_of_a_per_chunk_body_is_timed_alone(costs):
+    running = []
+    overlapped = []
+
+    def body(chunk):
+        running.append(chunk.id)
+        if len(running) == 1:
+            time.sleep(0.05)
+            overlapped.append(len(running) > 1)
+        return 0
+
+    timed = parallel_loop._Timed(body)
+    with ThreadPoolExecutor(4) as ex:
+        list(ex.map(timed, [Chunk(i, range(10 * i, 10 * i + 10), i) for i in range(4)]))
+    assert overlapped == [False]
+    seconds, cpu = timed.cost
+    assert seconds >= 0.005 and cpu < 0.5
+
+
+def test_per_chunk_auto_times_its_first_call_on_threads(costs):
+    with Trace(2) as t:
+        assert parallel_reduce(range(40), sleep_chunk, schedule="dynamic", chunk=5, workers=2,
+                               per_chunk=True, trace=t) == 40
+        assert t.backend == THREADS
+        # no probe: the body's chunks are the schedule's
+        assert sorted((r[4], r[5]) for r in t.records()) == [(i, 5) for i in range(0, 40, 5)]
+    seconds, cpu = costs[parallel_loop._body_signature(sleep_chunk, True)]
+    assert 0.002 <= seconds < 0.02 and cpu < 0.5
+
+
+def test_serial_per_chunk_run_keeps_the_chunk_boundaries():
+    seen = []
+    parallel_for(range(12), lambda c: seen.append((c.worker, c.iterations.start, c.iterations.stop)),
+                 workers=3, backend=SERIAL, per_chunk=True)
+    assert seen == [(0, 0, 4), (1, 4, 8), (2, 8, 12)]
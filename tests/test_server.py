@@ -0,0 +1,161 @@
+import socket
+import threading
+
+import pytest
+
+import server
+from compression import ZLIB, FrameCodec, negotiate
+from framing import U32, FrameDecoder, encode_frame, recv_frame
+from transport import connect, tcp_uri
+
+HELLO = encode_frame(server.GREETING, U32)
+# plain echoes, hellos in any padding, an empty frame and a NUL frame the echo path must not touch
+PAYLOADS = [b"one", b"hello", b"two", b"three", b" Hello\n", b"", b"\x00not a request", b"x" * 5000, b"four"]
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    monkeypatch.setattr(server, "VERBOSE", False)
+
+
+@pytest.fixture(scope="module")
+def servers():
+    """One event-loop and one threaded server on ephemeral ports; they run until the tests exit."""
+    verbose, server.VERBOSE = server.VERBOSE, False
+    uris = {}
+    for name, serve in [("event_loop", server.serve_event_loop),
+                        ("threaded", lambda s, header: server.serve_threaded(s, header, workers=4))]:
+        listener = server.create_listener(port=0)
+        uris[name] = tcp_uri(*listener.getsockname()[:2])
+        threading.Thread(target=serve, args=(listener, U32), daemon=True).start()
+    yield uris
+    server.VERBOSE = verbose
+
+
+def echo(payloads):
+    decoder = FrameDecoder(U32)
+    decoder.feed(b"".join(encode_frame(p, U32) for p in payloads))
+    buffers, frames = server.echo_replies(decoder, HELLO)
+    return buffers, frames, decoder
+
+
+def exchange(uri, payloads, step=7):
+    """Send every frame in small writes, then read back one reply per frame."""
+    stream = b"".join(encode_frame(p, U32) for p in payloads)
+    with connect(uri, timeout=5) as sock:
+        for i in range(0, len(stream), step):
+            sock.sendall(stream[i:i + step])
+        decoder = FrameDecoder(U32)
+        return [recv_frame(sock, decoder) for _ in payloads]
+
+
+def test_runs_of_echoes_are_one_slice_of_the_receive_buffer():
+    buffers, frames, decoder = echo(PAYLOADS)
+    assert frames == len(PAYLOADS)
+    assert [b is HELLO for b in buffers] == [False, True, False, True, False]
+    assert all(isinstance(b, memoryview) and b.obj is decoder.view.obj for b in buffers if b is not HELLO)
+    assert bytes(buffers[2]) == b"".join(encode_frame(p, U32) for p in PAYLOADS[2:4])
+    assert bytes(buffers[4]) == b"".join(encode_frame(p, U32) for p in PAYLOADS[5:])
+
+
+def test_an_all_echo_read_is_a_single_buffer():
+    payloads = [b"a", b"bb", b"ccc"]
+    buffers, frames, _ = echo(payloads)
+    assert frames == 3
+    assert [bytes(b) for b in buffers] == [b"".join(encode_frame(p, U32) for p in payloads)]
+
+
+def test_only_complete_frames_are_answered():
+    decoder = FrameDecoder(U32)
+    stream = encode_frame(b"whole", U32) + encode_frame(b"cut short", U32)
+    decoder.feed(stream[:-3])
+    buffers, frames = server.echo_replies(decoder, HELLO)
+    assert frames == 1
+    assert b"".join(bytes(b) for b in buffers) == encode_frame(b"whole", U32)
+    assert decoder.pending == len(encode_frame(b"cut short", U32)) - 3
+
+
+def test_log_sees_every_frame():
+    seen = []
+    decoder = FrameDecoder(U32)
+    decoder.feed(b"".join(encode_frame(p, U32) for p in [b"a", b"hello"]))
+    server.echo_replies(decoder, HELLO, log=lambda payload, hello: seen.append((bytes(payload), hello)))
+    assert seen == [(b"a", False), (b"hello", True)]
+
+
+@pytest.mark.parametrize("mode", ["event_loop", "threaded"])
+def test_replies_over_a_socket(servers, mode):
+    expected = [server.GREETING if p.strip().lower() == b"hello" else p for p in PAYLOADS]
+    assert exchange(servers[mode], PAYLOADS) == expected
+
+
+def test_both_modes_reply_alike(servers):
+    payloads = PAYLOADS * 20
+    assert exchange(servers["event_loop"], payloads, step=1000) == exchange(servers["threaded"], payloads,
+                                                                              step=1000)
+
+
+@pytest.mark.parametrize("mode", ["event_loop", "threaded"])
+def test_both_modes_compress_alike(servers, mode):
+    with connect(servers[mode], timeout=5) as sock:
+        decoder = FrameDecoder(U32)
+        codec = negotiate(sock, [ZLIB], decoder=decoder, threshold=100)
+        inbound = FrameCodec(ZLIB, threshold=100)
+        payloads = [b"hello", b"y" * 3000, b"short", b"y" * 3000]
+        for p in payloads:
+            sock.sendall(b"".join(bytes(b) for b in codec.frame_buffers(p, U32)))
+        replies = [bytes(inbound.decode(recv_frame(sock, decoder))) for _ in payloads]
+    assert replies == [server.GREETING] + payloads[1:]
+
+
+def test_event_loop_stops_reading_while_replies_pile_up(servers):
+    frame = encode_frame(b"z" * 65536, U32)
+    count = 512     # 32 MiB: far more than the socket buffers and the high-water mark hold
+    stream = memoryview(frame * count)
+    with connect(servers["event_loop"], timeout=1) as sock:
+        sent = 0
+        try:
+            while sent < len(stream):
+                sent += sock.send(stream[sent:])
+        except TimeoutError:
+            pass
+        # the server quit reading long before taking everything
+        assert sent < len(stream) // 2
+        sock.settimeout(10)
+        received = []
+
+        def read_replies():
+            decoder = FrameDecoder(U32)
+            for _ in range(count):
+                received.append(len(recv_frame(sock, decoder)))
+
+        reader = threading.Thread(target=read_replies)
+        reader.start()
+        sock.sendall(stream[sent:])
+        reader.join(timeout=30)
+    assert received == [65536] * count
+
+
+def test_handler_pool_survives_a_handler_bug(monkeypatch):
+    calls = []
+    handle_client = server.handle_client
+
+    def buggy_once(conn, addr, header):
+        calls.append(addr)
+        if len(calls) == 1:
+            raise RuntimeError("bug")
+        handle_client(conn, addr, header)
+
+    monkeypatch.setattr(server, "handle_client", buggy_once)
+    pool = server.HandlerPool(workers=1, header=U32)
+    broken, served = socket.socketpair(), socket.socketpair()
+    try:
+        pool.submit(broken[1], ("first", 1))
+        assert broken[0].recv(1) == b""       # the pool closed the connection it failed on
+        pool.submit(served[1], ("second", 2))
+        served[0].sendall(encode_frame(b"still here", U32))
+        assert recv_frame(served[0], FrameDecoder(U32)) == b"still here"
+    finally:
+        broken[0].close()
+        served[0].close()
+    assert calls == [("first", 1), ("second", 2)]
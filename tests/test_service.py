@@ -0,0 +1,160 @@
+import json
+import socket
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import server
+from framing import ASCII3, MAX_ASCII3, U32, FrameDecoder, encode_frame, recv_frame
+from service import (ERROR, OK, OP_ARRAY_SUM, OP_MATMUL_ROWS, OP_PING, ComputeService, Registry, ServiceError,
+                     is_request, pack_int64, parse_reply, reply_payload, request_payload)
+from transport import connect, tcp_uri
+
+
+@pytest.fixture(scope="module")
+def service():
+    service = ComputeService(workers=2)
+    yield service
+    service.close(wait=True)
+
+
+def ascii3(reply):
+    return encode_frame(reply, ASCII3)
+
+
+def result(reply):
+    return reply.result(timeout=30) if isinstance(reply, Future) else reply
+
+
+def matmul_body(n):
+    return json.dumps({"A": [[1] * n] * n, "B": [[1] * n] * n}).encode()
+
+
+def test_array_sum(service):
+    values = [3, -7, 2 ** 40, 0, 11]
+    reply = result(service.submit(request_payload(OP_ARRAY_SUM, pack_int64(values))))
+    assert parse_reply(reply) == str(sum(values)).encode()
+
+
+def test_matmul_rows(service):
+    body = json.dumps({"A": [[1, 2], [3, 4]], "B": [[5, 6], [7, 8]]}).encode()
+    reply = result(service.submit(request_payload(OP_MATMUL_ROWS, body)))
+    assert json.loads(parse_reply(reply)) == [[19, 22], [43, 50]]
+
+
+def test_ping_is_answered_inline(service):
+    reply = service.submit(request_payload(OP_PING, b"pong"))
+    assert reply == reply_payload(OP_PING, OK, b"pong")
+
+
+def test_unknown_opcode(service):
+    reply = service.submit(request_payload(0x3f, b"body"))
+    assert reply[:3] == bytes((0, 0x3f, ERROR))
+    with pytest.raises(ServiceError, match="unknown opcode"):
+        parse_reply(reply)
+
+
+def test_handler_error_in_a_worker(service):
+    reply = result(service.submit(request_payload(OP_ARRAY_SUM, b"\x01\x02\x03")))
+    with pytest.raises(ServiceError, match="array_sum: .*int64"):
+        parse_reply(reply)
+
+
+def test_handler_error_inline():
+    registry = Registry()
+
+    @registry.register(0x10, "broken", cpu=False)
+    def broken(body):
+        raise KeyError("missing")
+
+    service = ComputeService(workers=1, registry=registry)
+    try:
+        reply = service.submit(request_payload(0x10))
+    finally:
+        service.close()
+    assert reply[:3] == bytes((0, 0x10, ERROR))
+    with pytest.raises(ServiceError, match="missing"):
+        parse_reply(reply)
+
+
+def test_reply_too_long_for_ascii3_inline(service):
+    body = b"p" * (MAX_ASCII3 - 2)     # the reply adds three bytes to it
+    reply = service.submit(request_payload(OP_PING, body), frame=ascii3)
+    assert len(reply) <= 3 + MAX_ASCII3
+    with pytest.raises(ServiceError, match="1000 bytes cannot be sent"):
+        parse_reply(reply[3:])
+    assert service.submit(request_payload(OP_PING, body[:-1]), frame=ascii3) == ascii3(
+        reply_payload(OP_PING, OK, body[:-1]))
+
+
+def test_reply_too_long_for_ascii3_from_a_worker(service):
+    reply = service.submit(request_payload(OP_MATMUL_ROWS, matmul_body(40)), frame=ascii3)
+    assert isinstance(reply, Future)
+    with pytest.raises(ServiceError, match="cannot be sent"):
+        parse_reply(reply.result(timeout=30)[3:])
+
+
+def test_closed_service_answers_with_an_error():
+    service = ComputeService(workers=1)
+    service.close(wait=True)
+    reply = service.submit(request_payload(OP_ARRAY_SUM, pack_int64([1])))
+    with pytest.raises(ServiceError, match="array_sum"):
+        parse_reply(reply)
+
+
+def test_register_rejects_bad_and_taken_opcodes():
+    registry = Registry()
+    registry.register(0x01, "one")(len)
+    for opcode in (0x00, 0x40, 0x01):
+        with pytest.raises(ValueError):
+            registry.register(opcode, "other")
+    assert registry.names() == {0x01: "one"}
+
+
+def test_request_frames():
+    assert is_request(request_payload(OP_PING))
+    assert not is_request(b"\x00COMPRESS zlib")
+    assert not is_request(b"\x00")
+    with pytest.raises(ServiceError):
+        parse_reply(b"plain")
+
+
+def open_connection(mode, header):
+    """A client socket to a server of the given mode, and the thread serving it."""
+    if mode == "threaded":
+        a, b = socket.socketpair()
+        handler = threading.Thread(target=server.handle_client, args=(b, None, header))
+    else:
+        listener = server.create_listener(port=0)
+        # the loop never returns; it dies with the test run
+        handler = threading.Thread(target=server.serve_event_loop, args=(listener, header), daemon=True)
+        a = connect(tcp_uri(*listener.getsockname()[:2]), timeout=30)
+    handler.start()
+    return a, handler
+
+
+@pytest.mark.parametrize("mode", ["threaded", "event_loop"])
+@pytest.mark.parametrize("header", [ASCII3, U32])
+def test_server_keeps_replies_in_order(service, monkeypatch, mode, header):
+    monkeypatch.setattr(server, "SERVICE", service)
+    monkeypatch.setattr(server, "VERBOSE", False)
+    a, handler = open_connection(mode, header)
+    with a:
+        requests = [request_payload(OP_MATMUL_ROWS, matmul_body(3)), b"after the work",
+                    request_payload(OP_PING, b"x" * (MAX_ASCII3 - 2)), b"hello",
+                    request_payload(OP_ARRAY_SUM, pack_int64(range(100)))]
+        a.sendall(b"".join(encode_frame(r, header) for r in requests))
+        decoder = FrameDecoder(header)
+        replies = [recv_frame(a, decoder) for _ in requests]
+    if mode == "threaded":
+        handler.join(timeout=30)
+    assert json.loads(parse_reply(replies[0])) == [[3] * 3] * 3
+    assert replies[1] == b"after the work"
+    if header == ASCII3:
+        with pytest.raises(ServiceError, match="cannot be sent"):
+            parse_reply(replies[2])
+    else:
+        assert parse_reply(replies[2]) == b"x" * (MAX_ASCII3 - 2)
+    assert replies[3] == server.GREETING
+    assert parse_reply(replies[4]) == b"4950"
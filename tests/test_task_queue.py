@@ -0,0 +1,191 @@
+import json
+import threading
+import time
+
+import pytest
+
+from framing import U32, FrameDecoder, recv_frame
+from task_queue import Coordinator, TaskFailed, _send, run_worker
+from transport import connect, tcp_uri
+
+
+def chunks_of(n, chunk):
+    return [(i, start, min(start + chunk, n)) for i, start in enumerate(range(0, n, chunk))]
+
+
+@pytest.fixture
+def make_coordinator():
+    coordinators = []
+
+    def make(chunks, **kwargs):
+        coordinator = Coordinator(chunks, "tcp://127.0.0.1:0", **kwargs)
+        coordinator.uri = tcp_uri(*coordinator.server.getsockname()[:2])
+        coordinators.append(coordinator)
+        return coordinator
+
+    yield make
+    for coordinator in coordinators:
+        coordinator.close()
+
+
+class Client:
+    """Speaks the worker side of the protocol one message at a time."""
+
+    def __init__(self, uri, name="test"):
+        self.sock = connect(uri, timeout=5)
+        self.decoder = FrameDecoder(U32)
+        self.send(op="hello", worker=name)
+
+    def send(self, **message):
+        _send(self.sock, message)
+
+    def lease(self, k=1):
+        self.send(op="lease", max=k)
+        return json.loads(recv_frame(self.sock, self.decoder))
+
+    def close(self):
+        self.sock.close()
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_workers_cover_every_chunk_once(make_coordinator):
+    chunks = chunks_of(1000, 7)
+    coordinator = make_coordinator(chunks)
+    completed = []
+    workers = [threading.Thread(target=lambda b=b: completed.append(
+        run_worker(coordinator.uri, lambda i, s, e: sum(range(s, e)), batch=b))) for b in (1, 3, 4)]
+    for t in workers:
+        t.start()
+    values = coordinator.wait()
+    for t in workers:
+        t.join()
+    assert sorted(values) == [i for i, _, _ in chunks]
+    assert sum(values.values()) == sum(range(1000))
+    assert sum(completed) == len(chunks)
+    stats = coordinator.stats()
+    assert stats["completed"] == len(chunks)
+    assert stats["duplicates"] == 0
+    assert stats["pending"] == stats["leased_now"] == 0
+
+
+def test_unacked_lease_is_requeued_first(make_coordinator):
+    coordinator = make_coordinator(chunks_of(30, 10), ack_timeout=0.1)
+    slow, fast = Client(coordinator.uri), Client(coordinator.uri)
+    try:
+        assert slow.lease() == {"op": "tasks", "tasks": [[0, 0, 10]]}
+        wait_until(lambda: coordinator.stats()["requeued_unacked"] == 1)
+        assert fast.lease() == {"op": "tasks", "tasks": [[0, 0, 10]]}
+        # the ack from the worker that lost the lease is ignored
+        slow.send(op="ack", ids=[0])
+        fast.send(op="ack", ids=[0])
+        wait_until(lambda: coordinator.stats()["acked"] == 1)
+    finally:
+        slow.close()
+        fast.close()
+
+
+def test_expired_lease_late_result_is_a_duplicate(make_coordinator):
+    coordinator = make_coordinator(chunks_of(20, 10), ack_timeout=5.0, lease_timeout=0.1)
+    slow, fast = Client(coordinator.uri), Client(coordinator.uri)
+    try:
+        assert slow.lease()["tasks"] == [[0, 0, 10]]
+        slow.send(op="ack", ids=[0])
+        wait_until(lambda: coordinator.stats()["requeued_expired"] == 1)
+        assert fast.lease(2)["tasks"] == [[0, 0, 10], [1, 10, 20]]
+        fast.send(op="ack", ids=[0, 1])
+        fast.send(op="result", id=0, value="fast")
+        fast.send(op="result", id=1, value="fast")
+        wait_until(lambda: coordinator.stats()["completed"] == 2)
+        slow.send(op="result", id=0, value="slow")
+        wait_until(lambda: coordinator.stats()["duplicates"] == 1)
+        assert coordinator.wait() == {0: "fast", 1: "fast"}
+    finally:
+        slow.close()
+        fast.close()
+
+
+def test_disconnect_requeues_held_chunks(make_coordinator):
+    coordinator = make_coordinator(chunks_of(30, 10))
+    leaver = Client(coordinator.uri)
+    assert leaver.lease(2)["tasks"] == [[0, 0, 10], [1, 10, 20]]
+    leaver.send(op="ack", ids=[0, 1])
+    leaver.close()
+    wait_until(lambda: coordinator.stats()["requeued_disconnect"] == 2)
+    assert coordinator.stats()["pending"] == 3
+    run_worker(coordinator.uri, lambda i, s, e: e - s)
+    assert coordinator.wait() == {0: 10, 1: 10, 2: 10}
+
+
+def test_result_before_requeued_chunk_is_leased_again(make_coordinator):
+    # the lease expires and the chunk goes back to the queue, but the original
+    # worker's result arrives before anyone else leases it
+    coordinator = make_coordinator(chunks_of(10, 10), ack_timeout=0.1)
+    client = Client(coordinator.uri)
+    try:
+        assert client.lease()["tasks"] == [[0, 0, 10]]
+        wait_until(lambda: coordinator.stats()["requeued_unacked"] == 1)
+        client.send(op="result", id=0, value=45)
+        assert coordinator.wait() == {0: 45}
+        assert coordinator.stats()["pending"] == 0
+        assert client.lease() == {"op": "done"}
+    finally:
+        client.close()
+
+
+def test_repeated_result_is_a_duplicate(make_coordinator):
+    coordinator = make_coordinator(chunks_of(10, 10))
+    client = Client(coordinator.uri)
+    try:
+        client.lease()
+        client.send(op="result", id=0, value=1)
+        client.send(op="result", id=0, value=2)
+        client.send(op="result", id=99, value=3)
+        wait_until(lambda: coordinator.stats()["duplicates"] == 2)
+        assert coordinator.wait() == {0: 1}
+        assert coordinator.stats()["completed"] == 1
+    finally:
+        client.close()
+
+
+def test_failed_chunk_is_reported_once(make_coordinator):
+    coordinator = make_coordinator(chunks_of(20, 10), max_attempts=2, lease_timeout=0.1)
+    client = Client(coordinator.uri)
+    try:
+        for _ in range(2):
+            assert client.lease()["tasks"] == [[0, 0, 10]]
+            client.send(op="ack", ids=[0])
+            client.send(op="error", id=0, error="boom")
+        wait_until(lambda: 0 in coordinator.failed)
+        assert coordinator.failed == {0: "boom"}
+        # a late success for the failed chunk must not be counted a second time
+        client.send(op="result", id=0, value=0)
+        wait_until(lambda: coordinator.stats()["duplicates"] == 1)
+        assert client.lease()["tasks"] == [[1, 10, 20]]
+        client.send(op="result", id=1, value=145)
+        with pytest.raises(TaskFailed):
+            coordinator.wait()
+        assert coordinator._finished()
+        assert coordinator.stats()["errors"] == 2
+        assert client.lease() == {"op": "done"}
+    finally:
+        client.close()
+
+
+def test_error_from_a_worker_without_the_lease_is_ignored(make_coordinator):
+    coordinator = make_coordinator(chunks_of(10, 10), max_attempts=1)
+    holder, other = Client(coordinator.uri), Client(coordinator.uri)
+    try:
+        holder.lease()
+        other.send(op="error", id=0, error="not mine")
+        holder.send(op="result", id=0, value=45)
+        assert coordinator.wait() == {0: 45}
+        assert coordinator.stats()["errors"] == 0
+    finally:
+        holder.close()
+        other.close()
@@ -0,0 +1,166 @@
+import contextlib
+import threading
+import time
+
+import pytest
+
+import worker_pools
+from parallel_loop import parallel_reduce, square
+from worker_pools import PROCESSES, THREADS, ProcessPool, ThreadPool
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    worker_pools.shutdown()
+    yield
+    worker_pools.shutdown()
+
+
+def is_shut_down(pool):
+    return pool.executor._shutdown
+
+
+def write_word(slot, value):
+    words, _ = worker_pools.worker_storage(slot)
+    words[0] = value
+    return value
+
+
+def test_pool_is_reused_and_leased():
+    pool = worker_pools.thread_pool(2)
+    assert worker_pools.thread_pool(1) is pool
+    assert pool._leases == 2
+    pool.release()
+    with pool:
+        pass
+    assert pool._leases == 0
+    assert not is_shut_down(pool)
+
+
+def test_growing_retires_the_old_pool_after_its_last_lease():
+    old = worker_pools.thread_pool(2)
+    held = worker_pools.thread_pool(2)
+    new = worker_pools.thread_pool(4)
+    assert new is not old and new.workers == 4
+    assert old._retired
+    # calls that still hold the old pool keep running on it
+    assert old.submit(sum, [1, 2]).result() == 3
+    old.release()
+    assert not is_shut_down(old)
+    held.release()
+    assert is_shut_down(old)
+    assert worker_pools.thread_pool(3) is new
+    assert new._leases == 2
+
+
+def test_growing_an_unleased_pool_shuts_it_down_at_once():
+    old = worker_pools.thread_pool(1)
+    old.release()
+    new = worker_pools.thread_pool(2)
+    assert is_shut_down(old)
+    assert not is_shut_down(new)
+
+
+def test_concurrent_calls_build_one_pool(monkeypatch):
+    built = []
+
+    class SlowPool(ThreadPool):
+        def __init__(self, workers):
+            built.append(workers)
+            time.sleep(0.05)            # wide open window for a second builder
+            super().__init__(workers)
+
+    monkeypatch.setitem(worker_pools._KINDS, THREADS, SlowPool)
+    start = threading.Barrier(8)
+    pools = [None] * 8
+
+    def call(i):
+        start.wait()
+        pools[i] = worker_pools.thread_pool(3)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert built == [3]
+    assert all(p is pools[0] for p in pools)
+    assert pools[0]._leases == 8
+
+
+def test_concurrent_growth_hands_out_big_enough_pools():
+    start = threading.Barrier(6)
+    got = {}
+
+    def call(workers):
+        start.wait()
+        got[workers] = worker_pools.thread_pool(workers)
+
+    threads = [threading.Thread(target=call, args=(w,)) for w in range(1, 7)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(pool.workers >= workers for workers, pool in got.items())
+    current = worker_pools._pools[THREADS]
+    assert current.workers == 6
+    for pool in set(got.values()):
+        for _ in range(sum(p is pool for p in got.values())):
+            pool.release()
+    # every replaced pool shut down once its leases were back; the current one did not
+    assert all(is_shut_down(pool) for pool in got.values() if pool is not current)
+    assert not is_shut_down(current)
+
+
+def test_resize_takes_no_lease():
+    leased = worker_pools.thread_pool(4)
+    smaller = worker_pools.resize(THREADS, 2)
+    assert smaller.workers == 2 and smaller._leases == 0
+    assert not is_shut_down(leased)
+    leased.release()
+    assert is_shut_down(leased)
+    with worker_pools.thread_pool(2) as pool:
+        assert pool is smaller
+
+
+def test_discard_forgets_the_pool():
+    pool = worker_pools.thread_pool(2)
+    worker_pools.discard(pool)
+    assert is_shut_down(pool)
+    with worker_pools.thread_pool(2) as fresh:
+        assert fresh is not pool
+
+
+def test_in_worker():
+    assert not worker_pools.in_worker()
+    with worker_pools.thread_pool(1) as pool:
+        assert pool.submit(worker_pools.in_worker).result()
+
+
+def test_slots_run_out_and_come_back():
+    pool = ProcessPool(1, slots=2)
+    try:
+        with pool.slot() as a, pool.slot() as b, pool.slot() as c:
+            assert {a, b} == {0, 1}
+            assert c is None
+        with pool.slot() as again:
+            assert again is not None
+        # the task sees the region the caller lent it
+        with pool.slot() as slot:
+            words, _ = pool.storage(slot)
+            words[0] = 0
+            assert pool.submit(write_word, slot, 42).result() == 42
+            assert words[0] == 42
+    finally:
+        pool.shutdown()
+
+
+def test_loop_falls_back_when_every_slot_is_taken():
+    with contextlib.ExitStack() as stack:
+        pool = stack.enter_context(worker_pools.process_pool(2))
+        slots = [stack.enter_context(pool.slot()) for _ in range(worker_pools.SLOTS)]
+        assert None not in slots
+        with pool.slot() as none_left:
+            assert none_left is None
+        total = parallel_reduce(1000, square, schedule="dynamic", chunk=10, workers=2, backend=PROCESSES)
+    assert total == sum(i * i for i in range(1000))
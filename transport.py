@@ -0,0 +1,143 @@
+"""transport.py
+
+Transport URIs for the socket servers and clients:
+
+    tcp://127.0.0.1:65432     TCP over IPv4/IPv6 (host may be [::1])
+    unix:///tmp/echo.sock     Unix domain stream socket (same host only)
+
+The framing is identical on both; a Unix socket just skips the TCP/IP stack,
+which is cheaper for co-located callers.
+"""
+
+import errno
+import os
+import socket
+import stat
+from urllib.parse import urlsplit
+
+TCP = "tcp"
+UNIX = "unix"
+
+
+def tcp_uri(host, port):
+    if ":" in host:
+        host = f"[{host}]"
+    return f"tcp://{host}:{port}"
+
+
+def parse_uri(uri):
+    """Return (family, address) for socket.socket()/bind()/connect()."""
+    parts = urlsplit(uri)
+    if parts.scheme == TCP:
+        if not parts.hostname or parts.port is None:
+            raise ValueError(f"tcp URI needs a host and a port: {uri!r}")
+        family = socket.AF_INET6 if ":" in parts.hostname else socket.AF_INET
+        return family, (parts.hostname, parts.port)
+    if parts.scheme == UNIX:
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("unix sockets are not supported on this platform")
+        path = parts.netloc + parts.path
+        if not path:
+            raise ValueError(f"unix URI needs a path: {uri!r}")
+        return socket.AF_UNIX, path
+    raise ValueError(f"unsupported transport {parts.scheme!r} in {uri!r} (use tcp:// or unix://)")
+
+
+def is_tcp(sock):
+    return sock.family in (socket.AF_INET, socket.AF_INET6)
+
+
+def set_nodelay(sock):
+    """Disable Nagle on TCP sockets; a no-op for Unix sockets, which have no Nagle."""
+    if is_tcp(sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def set_keepalive(sock, idle=60, interval=10, count=3):
+    """
+    Turn on TCP keepalive so a peer that vanished without a FIN/RST (a
+    half-open connection) is detected after about idle + interval * count
+    seconds; the next recv() then fails with ETIMEDOUT. No-op for Unix sockets.
+    """
+    if not is_tcp(sock):
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # the tuning knobs are platform specific; keep the system defaults where missing
+    for name, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+        if hasattr(socket, name):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+
+def _remove_stale_socket(path):
+    """
+    Unlink the Unix socket file at `path` if nobody is listening on it (a
+    dead server left it behind); raise EADDRINUSE if a server still is.
+    """
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return                      # not a socket: let bind() report it
+    except FileNotFoundError:
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.setblocking(False)            # a live server with a full backlog answers EAGAIN
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    except FileNotFoundError:
+        return                          # removed meanwhile
+    except BlockingIOError:
+        pass
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, f"a server is already listening on {path}")
+
+
+def create_server(uri, backlog=socket.SOMAXCONN, reuse_port=False):
+    """
+    Bind and listen on `uri`. A stale Unix socket file left by a dead server
+    is removed; one a live server still listens on is not (EADDRINUSE).
+    """
+    family, address = parse_uri(uri)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        if family == socket.AF_UNIX:
+            if reuse_port:
+                raise ValueError("SO_REUSEPORT sharding needs a tcp:// URI")
+            _remove_stale_socket(address)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                # several processes bind the same port and the kernel spreads connections over them
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+        sock.listen(backlog)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def connect(uri, timeout=None):
+    """Open a client connection to `uri` (TCP_NODELAY set for TCP)."""
+    family, address = parse_uri(uri)
+    if family == socket.AF_UNIX:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(address)
+        except BaseException:
+            sock.close()
+            raise
+    else:
+        sock = socket.create_connection(address, timeout=timeout)
+    set_nodelay(sock)
+    return sock
+
+
+def peer_name(addr):
+    """Printable peer for log lines; accept() on a Unix socket returns an empty address."""
+    if isinstance(addr, tuple):
+        return f"{addr[0]}:{addr[1]}"
+    return f"unix:{addr or 'local'}"
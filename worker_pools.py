@@ -0,0 +1,280 @@
+"""worker_pools.py
+
+Warm worker pools shared by every parallel call in the process.
+
+thread_pool(n) and process_pool(n) return a pool with at least n workers.
+The first call starts it, with all n workers up front, and a call that asks
+for more workers than the pool has replaces it with a bigger one; pools
+never shrink on their own (resize() does that). They live until exit, when
+an atexit hook shuts them down, so a parallel call pays for submitting
+tasks, not for starting threads or processes.
+
+Each returned pool carries a lease for the caller, handed back by leaving
+its with block (or release()):
+
+    with process_pool(4) as pool:
+        results = list(pool.map(f, items))
+
+A pool that has been replaced keeps running until its last lease is
+returned, so calls already holding it finish there. A lease that is never
+returned only keeps a replaced pool alive until exit.
+
+Process pools use the forkserver start method where it exists: the modules
+in PRELOAD (add more with preload() before the first pool starts) are
+imported once in the fork server, and every worker is forked from it with
+those imports done. Forking from a clean server instead of from the caller
+is also safe when the caller already runs threads (the server and the
+thread pools do).
+
+A process pool can only run picklable tasks, and locks or shared arrays
+cannot be pickled into a task. So each process pool owns a small arena of
+shared int64 words and locks, handed to its workers when they start.
+ProcessPool.slot() lends one region of it to a call: the caller builds its
+shared state (a loop_schedule counter, say) on storage(slot) and the task
+finds the same memory with worker_storage(slot).
+
+Tasks running on a pool worker can check in_worker(); parallel_loop uses it
+to run nested loops inline (OpenMP's default), since a pool task blocked on
+tasks queued behind it on the same pool would never finish.
+"""
+
+import atexit
+import ctypes
+import multiprocessing as mp
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+THREADS = "threads"
+PROCESSES = "processes"
+
+PRELOAD = ["loop_schedule", "parallel_loop", "worker_pools"]
+SLOTS = 8                      # concurrent calls that can hold arena space on one process pool
+
+_registry_lock = threading.Lock()
+_pools = {}                    # kind -> ThreadPool | ProcessPool
+_create_locks = {THREADS: threading.Lock(), PROCESSES: threading.Lock()}   # one pool being built per kind
+_local = threading.local()
+_in_process_worker = False
+_worker_arena = None           # (words, locks, slot_words, slot_locks) inside a process pool worker
+
+
+def in_worker():
+    """True on a thread or process that belongs to one of these pools."""
+    return _in_process_worker or getattr(_local, "in_worker", False)
+
+
+def preload(*modules):
+    """Import `modules` in the fork server too (only affects pools started after this)."""
+    for name in modules:
+        if name not in PRELOAD:
+            PRELOAD.append(name)
+
+
+def _context():
+    if "forkserver" in mp.get_all_start_methods():
+        ctx = mp.get_context("forkserver")
+        ctx.set_forkserver_preload(PRELOAD)
+        return ctx
+    return mp.get_context("spawn")
+
+
+def _slot_view(arena, locks, slot_words, slot_locks, slot):
+    words = (ctypes.c_int64 * slot_words).from_buffer(arena, slot * slot_words * 8)
+    return words, locks[slot * slot_locks:(slot + 1) * slot_locks]
+
+
+def _init_thread():
+    _local.in_worker = True
+
+
+def _init_process(arena, locks, slot_words, slot_locks):
+    global _in_process_worker, _worker_arena
+    _in_process_worker = True
+    _worker_arena = (arena, locks, slot_words, slot_locks)
+
+
+def worker_storage(slot):
+    """Inside a process pool task: (words, locks) of arena region `slot`."""
+    if _worker_arena is None:
+        raise RuntimeError("worker_storage() called outside a process pool worker")
+    return _slot_view(*_worker_arena, slot)
+
+
+def _warm(executor, workers):
+    """Start every worker now rather than on the first real task."""
+    barrier = threading.Barrier(workers) if isinstance(executor, ThreadPoolExecutor) else None
+    if barrier is None:
+        futures = [executor.submit(int) for _ in range(workers)]
+    else:
+        # a barrier keeps each task busy until all have started, so each gets its own thread
+        futures = [executor.submit(barrier.wait) for _ in range(workers)]
+    for f in futures:
+        f.result()
+
+
+class _Leased:
+    """Lease counting: a retired pool shuts down when its last lease is released."""
+
+    def _init_leases(self):
+        self._lease_lock = threading.Lock()
+        self._leases = 0
+        self._retired = False
+
+    def _acquire(self):
+        with self._lease_lock:
+            self._leases += 1
+
+    def release(self):
+        with self._lease_lock:
+            self._leases -= 1
+            done = self._retired and self._leases == 0
+        if done:
+            self.shutdown(wait=False)
+
+    def _retire(self):
+        with self._lease_lock:
+            self._retired = True
+            done = self._leases == 0
+        if done:
+            self.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ThreadPool(_Leased):
+    def __init__(self, workers):
+        self.workers = workers
+        self._init_leases()
+        self.executor = ThreadPoolExecutor(max_workers=workers, initializer=_init_thread)
+        _warm(self.executor, workers)
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def map(self, fn, *iterables):
+        return self.executor.map(fn, *iterables)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+class ProcessPool(ThreadPool):
+    def __init__(self, workers, slots=SLOTS):
+        self.workers = workers
+        self._init_leases()
+        ctx = _context()
+        # per slot: room for a loop counter and a work-stealing range per worker
+        self.slot_words = 2 * workers + 4
+        self.slot_locks = workers + 1
+        self.arena = ctx.RawArray(ctypes.c_int64, slots * self.slot_words)
+        self.locks = [ctx.Lock() for _ in range(slots * self.slot_locks)]
+        self._free = list(range(slots))
+        self._free_lock = threading.Lock()
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=ctx, initializer=_init_process,
+            initargs=(self.arena, self.locks, self.slot_words, self.slot_locks))
+        _warm(self.executor, workers)
+
+    @contextmanager
+    def slot(self):
+        """Lend an arena region for one call; yields its index, or None if all are taken."""
+        with self._free_lock:
+            slot = self._free.pop() if self._free else None
+        try:
+            yield slot
+        finally:
+            if slot is not None:
+                with self._free_lock:
+                    self._free.append(slot)
+
+    def storage(self, slot):
+        """(words, locks) of region `slot`, the same memory worker_storage(slot) gives a task."""
+        return _slot_view(self.arena, self.locks, self.slot_words, self.slot_locks, slot)
+
+
+_KINDS = {THREADS: ThreadPool, PROCESSES: ProcessPool}
+
+
+def _current(kind, workers):
+    """The registered pool, leased, if it has `workers` workers; call with _registry_lock held."""
+    pool = _pools.get(kind)
+    if pool is not None and pool.workers >= workers:
+        pool._acquire()
+        return pool
+    return None
+
+
+def get_pool(kind, workers):
+    """
+    The warm `kind` pool, started or grown so it has at least `workers`
+    workers, with a lease for the caller (see the module docstring).
+    """
+    workers = max(1, workers)
+    with _registry_lock:
+        pool = _current(kind, workers)
+    if pool is not None:
+        return pool
+    # one builder per kind; others wait here and then take what it built
+    with _create_locks[kind]:
+        with _registry_lock:
+            pool = _current(kind, workers)
+            size = _pools[kind].workers if kind in _pools else 0
+        if pool is not None:
+            return pool
+        return _replace(kind, max(workers, size), lease=True)
+
+
+def thread_pool(workers):
+    return get_pool(THREADS, workers)
+
+
+def process_pool(workers):
+    return get_pool(PROCESSES, workers)
+
+
+def _replace(kind, workers, lease):
+    # the caller holds _create_locks[kind]; warming a process pool takes a while,
+    # so it is built outside _registry_lock
+    new = _KINDS[kind](workers)
+    with _registry_lock:
+        old = _pools.get(kind)
+        _pools[kind] = new
+        if lease:
+            new._acquire()
+    if old is not None:
+        old._retire()
+    return new
+
+
+def resize(kind, workers):
+    """
+    Replace the `kind` pool with one of exactly `workers` workers (no lease
+    is taken). Calls holding the old one finish there; it shuts down after.
+    """
+    with _create_locks[kind]:
+        return _replace(kind, max(1, workers), lease=False)
+
+
+def discard(pool):
+    """Forget `pool` (e.g. a broken process pool) so the next call starts a fresh one."""
+    with _registry_lock:
+        for kind, current in list(_pools.items()):
+            if current is pool:
+                del _pools[kind]
+    pool.shutdown(wait=False)
+
+
+def shutdown():
+    with _registry_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+
+atexit.register(shutdown)